@@ -0,0 +1,108 @@
+"""Micro-benchmark: compiled ignore matcher vs. the old per-pattern loop.
+
+Usage:
+    python benchmarks/bench_ignore.py [--paths 50000] [--extra-patterns 40]
+
+Generates a synthetic list of project-relative paths (mostly source files a
+few directories deep, some under node_modules/build dirs) and times how long
+it takes to classify all of them with each implementation.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from fnmatch import fnmatch
+from pathlib import Path, PurePath
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rewindex.config import DEFAULT_IGNORE_PATTERNS  # noqa: E402
+from rewindex.ignore import IgnoreMatcher, PatternSet  # noqa: E402
+
+
+def legacy_match_any(patterns, rel_path):
+    """The matcher indexing.py used before patterns were compiled."""
+    pp = PurePath(rel_path)
+    name = pp.name
+    for pat in patterns:
+        try:
+            if pp.match(pat):
+                return True
+        except Exception:
+            pass
+        if fnmatch(rel_path, pat):
+            return True
+        if fnmatch(name, pat):
+            return True
+        if pat.startswith("**/") and fnmatch(name, pat[3:]):
+            return True
+    return False
+
+
+def make_paths(n, seed=0):
+    rng = random.Random(seed)
+    dirs = ["src", "lib", "app", "tests", "docs", "pkg", "internal", "node_modules", "build", "scripts"]
+    exts = [".py", ".js", ".ts", ".md", ".json", ".go", ".rs", ".log", ".min.js", ".txt"]
+    paths = []
+    for i in range(n):
+        depth = rng.randint(1, 5)
+        parts = [rng.choice(dirs) if rng.random() < 0.6 else f"d{rng.randint(0, 50)}" for _ in range(depth)]
+        parts.append(f"file{i}{rng.choice(exts)}")
+        paths.append("/".join(parts))
+    return paths
+
+
+def make_patterns(extra, seed=0):
+    # Roughly what a project .gitignore adds after Config.load converts it
+    rng = random.Random(seed)
+    patterns = list(DEFAULT_IGNORE_PATTERNS)
+    for i in range(extra):
+        kind = rng.randint(0, 3)
+        if kind == 0:
+            patterns += [f"*.ext{i}", f"**/*.ext{i}"]
+        elif kind == 1:
+            patterns.append(f"cache{i}/**")
+        elif kind == 2:
+            patterns += [f"name{i}", f"**/name{i}"]
+        else:
+            patterns.append(f"src/gen{i}/*.py")
+    return patterns
+
+
+def timed(label, fn, paths):
+    t = time.perf_counter()
+    hits = sum(1 for p in paths if fn(p))
+    dt = time.perf_counter() - t
+    print(f"{label:<34} {dt * 1000:9.1f} ms  {dt / len(paths) * 1e6:7.2f} us/path  ({hits} excluded)")
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--paths", type=int, default=50000)
+    ap.add_argument("--extra-patterns", type=int, default=40)
+    args = ap.parse_args()
+
+    paths = make_paths(args.paths)
+    patterns = make_patterns(args.extra_patterns)
+    print(f"{len(paths)} paths, {len(patterns)} patterns")
+
+    base = timed("legacy _match_any", lambda p: legacy_match_any(patterns, p), paths)
+
+    t = time.perf_counter()
+    compiled = PatternSet(patterns)
+    print(f"{'compile':<34} {(time.perf_counter() - t) * 1000:9.1f} ms")
+    flat = timed("PatternSet.matches (per path)", compiled.matches, paths)
+
+    matcher = IgnoreMatcher(patterns)
+    cold = timed("IgnoreMatcher (cold dir memo)", matcher.is_excluded, paths)
+    warm = timed("IgnoreMatcher (warm dir memo)", matcher.is_excluded, paths)
+
+    print()
+    print(f"speedup: {base / flat:.1f}x compiled, {base / cold:.1f}x cold memo, {base / warm:.1f}x warm memo")
+
+
+if __name__ == "__main__":
+    main()
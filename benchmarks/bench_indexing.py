@@ -0,0 +1,170 @@
+"""Indexing throughput benchmark: cold, warm no-op and 1%-changed runs.
+
+Usage:
+    python benchmarks/bench_indexing.py [--files 5000] [--median-kb 4] [--latency-ms 2]
+                                        [--bulk-ms-per-mb 0] [--bulk-capacity 0] [--max-in-flight N]
+                                        [--workers 4] [--change-fraction 0.01] [--tree DIR] [--json]
+
+Generates a synthetic tree (see treegen.py), starts the in-memory ES
+stand-in (see es_standin.py) with the given per-request latency, and runs
+``index_project`` three times against it: on an empty index (cold), again
+with nothing changed (warm), and after appending to ``--change-fraction`` of
+the text files. Each run is a fresh ``python`` process, like a real
+``rewindex index start``, so process-wide caches start empty and the peak
+RSS is that run's own (analyzer pool processes are reported separately).
+
+Reported per run: files/s and MB/s over the whole tree (i.e. how fast the
+tree is brought up to date), HTTP requests per file, bulk requests the
+stand-in rejected and the most it served at once, and peak RSS.
+``--bulk-capacity`` and ``--bulk-ms-per-mb`` model a small cluster, to see
+how ``indexing.writes`` (``--max-in-flight``) copes with one.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from es_standin import ESStandIn  # noqa: E402
+from treegen import DEFAULT_MIX, change_fraction, generate_tree, parse_mix  # noqa: E402
+
+
+def _rss_mb(who: int) -> float:
+    kb = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return kb / 1024 / 1024 if sys.platform == "darwin" else kb / 1024
+
+
+def run_child(root: Path, host: str, workers: int, max_in_flight: Optional[int]) -> None:
+    """Index ``root`` once and print timing and memory as JSON (runs in the child process)."""
+    from rewindex.config import Config
+    from rewindex.indexing import index_project
+
+    cfg = Config.load(root)
+    cfg.project.id = "bench"
+    cfg.elasticsearch.host = host
+    cfg.indexing.parallel_workers = workers
+    if max_in_flight is not None:
+        cfg.indexing.writes.max_in_flight = max_in_flight
+    t = time.perf_counter()
+    result = index_project(root, cfg)
+    elapsed = time.perf_counter() - t
+    print(json.dumps({
+        "elapsed_s": elapsed,
+        "result": result,
+        "rss_mb": _rss_mb(resource.RUSAGE_SELF),
+        "child_rss_mb": _rss_mb(resource.RUSAGE_CHILDREN),
+    }))
+
+
+def run_phase(label: str, root: Path, standin: ESStandIn, args: argparse.Namespace, files: int, tree_bytes: int) -> dict:
+    standin.reset_stats()
+    env = dict(os.environ, REWINDEX_ES_HOST=standin.host)
+    cmd = [sys.executable, __file__, "--child", str(root), "--host", standin.host, "--workers", str(args.workers)]
+    if args.max_in_flight is not None:
+        cmd += ["--max-in-flight", str(args.max_in_flight)]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"{label} run failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+    stats = json.loads(proc.stdout.strip().splitlines()[-1])
+    elapsed = stats["elapsed_s"]
+    calls = standin.total_calls()
+    return {
+        "run": label,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_s": round(files / elapsed, 1),
+        "mb_per_s": round(tree_bytes / 1024 ** 2 / elapsed, 2),
+        "http_calls": calls,
+        "calls_per_file": round(calls / max(1, files), 3),
+        "calls_by_endpoint": dict(standin.calls.most_common()),
+        "mb_sent": round(standin.bytes_in / 1024 ** 2, 2),
+        "bulk_rejected": standin.rejected,
+        "peak_bulk": standin.peak_bulk,
+        "rss_mb": round(stats["rss_mb"], 1),
+        "child_rss_mb": round(stats["child_rss_mb"], 1),
+        "result": stats["result"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--files", type=int, default=5000)
+    ap.add_argument("--median-kb", type=float, default=4.0)
+    ap.add_argument("--binary-ratio", type=float, default=0.05)
+    ap.add_argument("--junk-ratio", type=float, default=0.3)
+    ap.add_argument("--langs", default=DEFAULT_MIX)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--latency-ms", type=float, default=2.0, help="Added to every ES request")
+    ap.add_argument("--jitter-ms", type=float, default=0.5)
+    ap.add_argument("--bulk-ms-per-mb", type=float, default=0.0, help="Extra _bulk latency per MB of payload")
+    ap.add_argument("--bulk-capacity", type=int, default=0, help="Concurrent _bulk requests before 429s (0 = unlimited)")
+    ap.add_argument("--max-in-flight", type=int, help="indexing.writes.max_in_flight (default: config)")
+    ap.add_argument("--workers", type=int, default=4, help="indexing.parallel_workers (1 = sequential)")
+    ap.add_argument("--change-fraction", type=float, default=0.01)
+    ap.add_argument("--tree", type=Path, help="Generate the tree in this (empty) directory and keep it")
+    ap.add_argument("--json", action="store_true", help="Print results as JSON")
+    ap.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    ap.add_argument("--host", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        run_child(args.child, args.host, args.workers, args.max_in_flight)
+        return
+
+    root = args.tree or Path(tempfile.mkdtemp(prefix="rewindex-bench-"))
+    try:
+        t = time.perf_counter()
+        tree = generate_tree(
+            root, files=args.files, median_kb=args.median_kb, binary_ratio=args.binary_ratio,
+            junk_ratio=args.junk_ratio, mix=parse_mix(args.langs), seed=args.seed,
+        )
+        if not args.json:
+            print(f"tree: {tree['text_files']} text + {tree['binary_files']} binary files, "
+                  f"{tree['bytes'] / 1024 ** 2:.1f} MB (+{tree['junk_files']} ignored) in {time.perf_counter() - t:.1f}s")
+            print(f"ES stand-in latency {args.latency_ms} ms +/- {args.jitter_ms} ms, {args.bulk_ms_per_mb} ms/MB bulk, "
+                  f"bulk capacity {args.bulk_capacity or 'unlimited'}; {args.workers} workers")
+        files = tree["text_files"] + tree["binary_files"]
+
+        standin = ESStandIn(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed,
+            bulk_ms_per_mb=args.bulk_ms_per_mb, bulk_capacity=args.bulk_capacity,
+        ).start()
+        try:
+            runs = [run_phase("cold", root, standin, args, files, tree["bytes"])]
+            runs.append(run_phase("warm", root, standin, args, files, tree["bytes"]))
+            changed = change_fraction(root, args.change_fraction, seed=args.seed + 1)
+            runs.append(run_phase(f"{len(changed)} changed", root, standin, args, files, tree["bytes"]))
+        finally:
+            standin.stop()
+    finally:
+        if args.tree is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"tree": tree, "latency_ms": args.latency_ms, "workers": args.workers, "runs": runs}, indent=2))
+        return
+    print()
+    print(f"{'run':<14} {'time':>8} {'files/s':>9} {'MB/s':>8} {'calls':>7} {'calls/file':>10} {'MB sent':>8} "
+          f"{'429s':>5} {'bulk||':>6} {'RSS MB':>7} {'pool MB':>8}")
+    for r in runs:
+        print(f"{r['run']:<14} {r['elapsed_s']:>7.2f}s {r['files_per_s']:>9.0f} {r['mb_per_s']:>8.2f} {r['http_calls']:>7} "
+              f"{r['calls_per_file']:>10.3f} {r['mb_sent']:>8.2f} {r['bulk_rejected']:>5} {r['peak_bulk']:>6} "
+              f"{r['rss_mb']:>7.0f} {r['child_rss_mb']:>8.0f}")
+    for r in runs:
+        top = ", ".join(f"{k} {v}" for k, v in list(r["calls_by_endpoint"].items())[:6])
+        print(f"  {r['run']}: {r['result']}; {top}")
+
+
+if __name__ == "__main__":
+    main()
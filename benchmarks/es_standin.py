@@ -0,0 +1,449 @@
+"""In-process stand-in for the parts of the Elasticsearch HTTP API rewindex uses.
+
+Usage (as a server to point ``REWINDEX_ES_HOST`` at):
+    python benchmarks/es_standin.py [--port 9299] [--latency-ms 2] [--jitter-ms 1]
+                                    [--bulk-ms-per-mb 0] [--bulk-capacity 0]
+
+Documents live in memory, queries are evaluated by brute force and every
+request sleeps ``latency_ms`` (+/- ``jitter_ms``) before it is answered, so
+round trips cost what they would against a real cluster while the server's
+own work stays negligible. ``_bulk`` requests can additionally cost
+``bulk_ms_per_mb`` per MB of payload, and with ``bulk_capacity`` set, bulk
+requests beyond that many at once are rejected with 429 like a full write
+queue, to model a small cluster. Counts of requests per endpoint, of
+rejections and of bytes received are kept for the benchmark runner.
+
+Not a search engine: full-text queries are case-insensitive substring
+matches, and scores are constant.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+_TEXT_FIELDS = ("content", "added_lines", "file_name", "file_path")
+
+# Lucene's limit on a single indexed term
+MAX_TERM_BYTES = 32766
+_ASSIGN_RE = re.compile(r"ctx\._source\.(\w+)\s*=\s*([^;]+)")
+
+
+def _matches(src: Dict[str, Any], doc_id: str, q: Optional[dict]) -> bool:
+    if not q or "match_all" in q:
+        return True
+    if "bool" in q:
+        b = q["bool"]
+        for key in ("must", "filter"):
+            clauses = b.get(key) or []
+            for c in clauses if isinstance(clauses, list) else [clauses]:
+                if not _matches(src, doc_id, c):
+                    return False
+        not_clauses = b.get("must_not") or []
+        for c in not_clauses if isinstance(not_clauses, list) else [not_clauses]:
+            if _matches(src, doc_id, c):
+                return False
+        should = b.get("should") or []
+        if should and not any(_matches(src, doc_id, c) for c in should):
+            return int(b.get("minimum_should_match", 1)) == 0
+        return True
+    if "constant_score" in q:
+        return _matches(src, doc_id, q["constant_score"].get("filter"))
+    if "ids" in q:
+        return doc_id in q["ids"].get("values", [])
+    if "term" in q:
+        (field, value), = q["term"].items()
+        if isinstance(value, dict):
+            value = value.get("value")
+        return src.get(field) == value
+    if "terms" in q:
+        (field, values), = ((k, v) for k, v in q["terms"].items() if k != "boost")
+        return src.get(field) in values
+    if "prefix" in q:
+        (field, value), = q["prefix"].items()
+        if isinstance(value, dict):
+            value = value.get("value")
+        return str(src.get(field, "")).startswith(value)
+    if "exists" in q:
+        return src.get(q["exists"]["field"]) is not None
+    if "range" in q:
+        (field, bounds), = q["range"].items()
+        x = src.get(field)
+        if x is None:
+            return False
+        return (
+            ("gt" not in bounds or x > bounds["gt"])
+            and ("gte" not in bounds or x >= bounds["gte"])
+            and ("lt" not in bounds or x < bounds["lt"])
+            and ("lte" not in bounds or x <= bounds["lte"])
+        )
+    for key in ("multi_match", "query_string", "simple_query_string", "match", "match_phrase"):
+        if key in q:
+            spec = q[key]
+            if key in ("match", "match_phrase"):
+                (_field, spec), = spec.items()
+            text = spec.get("query", "") if isinstance(spec, dict) else str(spec)
+            text = text.strip("*\"").lower()
+            return any(text in str(src.get(f, "")).lower() for f in _TEXT_FIELDS)
+    # Anything else (scripts, wildcards, ...) is treated as matching
+    return True
+
+
+def _script_value(expr: str, params: Dict[str, Any]) -> Any:
+    expr = expr.strip()
+    if expr.startswith("params."):
+        return params.get(expr[len("params."):])
+    if expr[:1] in "'\"":
+        return expr[1:-1]
+    return json.loads(expr)  # true / false / null / numbers
+
+
+class ESStandIn:
+    """Threaded HTTP server holding indices in memory; see the module docstring."""
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        seed: int = 0,
+        bulk_ms_per_mb: float = 0.0,
+        bulk_capacity: int = 0,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bulk_ms_per_mb = bulk_ms_per_mb
+        self.bulk_capacity = bulk_capacity
+        self.rejected = 0
+        self.peak_bulk = 0
+        self._bulk_active = 0
+        self.indices: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # content.keyword's ignore_above per index (None: unbounded), for the term limit
+        self._keyword_limit: Dict[str, Optional[int]] = {}
+        self.calls: Counter = Counter()
+        self.bytes_in = 0
+        self._pits: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.standin = self  # type: ignore[attr-defined]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "ESStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="es-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.bytes_in = 0
+            self.rejected = 0
+            self.peak_bulk = 0
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def doc_count(self) -> int:
+        with self._lock:
+            return sum(len(docs) for docs in self.indices.values())
+
+    # Request handling
+    def _delay(self, extra_ms: float = 0.0) -> None:
+        if self.latency_ms or self.jitter_ms or extra_ms:
+            with self._lock:
+                jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            time.sleep(max(0.0, self.latency_ms + jitter + extra_ms) / 1000.0)
+
+    def _note_mapping(self, index: str, mappings: dict) -> None:
+        content = (mappings.get("properties") or {}).get("content") or {}
+        keyword = (content.get("fields") or {}).get("keyword")
+        if keyword is not None:
+            self._keyword_limit[index] = keyword.get("ignore_above")
+
+    def _immense_term(self, index: str, source: dict) -> Optional[str]:
+        """Lucene's 32766-byte term limit on content.keyword, which fails the whole doc."""
+        if index not in self._keyword_limit:
+            return None
+        content = source.get("content")
+        if not isinstance(content, str):
+            return None
+        limit = self._keyword_limit[index]
+        if limit is not None and len(content) > limit:
+            return None
+        if len(content.encode("utf-8", "surrogatepass")) <= MAX_TERM_BYTES:
+            return None
+        return "Document contains at least one immense term in field=\"content.keyword\""
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], raw: bytes) -> Tuple[int, Optional[dict]]:
+        parts = [unquote(p) for p in path.strip("/").split("/") if p]
+        endpoint = next((p for p in parts if p.startswith("_")), "HEAD" if method == "HEAD" else "index")
+        if endpoint != "_bulk":
+            self._delay()
+            with self._lock:
+                self.calls[endpoint] += 1
+                self.bytes_in += len(raw)
+                return self._route(method, parts, query, raw)
+
+        with self._lock:
+            self.calls[endpoint] += 1
+            if self.bulk_capacity and self._bulk_active >= self.bulk_capacity:
+                self.rejected += 1
+                return 429, {"error": {"type": "es_rejected_execution_exception", "reason": "bulk queue full"}, "status": 429}
+            self._bulk_active += 1
+            self.peak_bulk = max(self.peak_bulk, self._bulk_active)
+            self.bytes_in += len(raw)
+        try:
+            self._delay(self.bulk_ms_per_mb * len(raw) / 1024 ** 2)
+            with self._lock:
+                return self._route(method, parts, query, raw)
+        finally:
+            with self._lock:
+                self._bulk_active -= 1
+
+    def _route(self, method: str, parts: List[str], query: Dict[str, List[str]], raw: bytes) -> Tuple[int, Optional[dict]]:
+        body = json.loads(raw) if raw and parts[-1:] != ["_bulk"] else {}
+        if not parts:
+            return 200, {"version": {"number": "8.0.0-standin"}}
+        if parts[-1] == "_bulk":
+            return 200, self._bulk(raw)
+        if parts[-1] == "_mget":
+            return 200, self._mget(parts[0] if len(parts) == 2 else None, body, query)
+        if parts == ["_pit"] and method == "DELETE":
+            self._pits.pop(body.get("id"), None)
+            return 200, {"succeeded": True}
+        if parts == ["_search"] and "pit" in body:
+            parts = [self._pits.get(body["pit"]["id"], ""), "_search"]
+
+        name = parts[0]
+        if len(parts) == 1:
+            if method == "HEAD":
+                return (200 if name in self.indices else 404), None
+            if method == "PUT":
+                if name in self.indices:
+                    return 400, {"error": {"type": "resource_already_exists_exception"}, "status": 400}
+                self.indices[name] = {}
+                self._note_mapping(name, body.get("mappings") or {})
+                return 200, {"acknowledged": True, "index": name}
+            if method == "DELETE":
+                if self.indices.pop(name, None) is None:
+                    return 404, {"error": {"type": "index_not_found_exception"}, "status": 404}
+                return 200, {"acknowledged": True}
+        docs = self.indices.get(name)
+        if docs is None:
+            return 404, {"error": {"type": "index_not_found_exception", "index": name}, "status": 404}
+
+        op = parts[1]
+        if op == "_mapping" and method == "PUT":
+            self._note_mapping(name, body)
+        if op in ("_mapping", "_refresh", "_forcemerge"):
+            return 200, {"acknowledged": True, "_shards": {"failed": 0}}
+        if op == "_stats":
+            size = sum(len(json.dumps(d)) for d in docs.values())
+            return 200, {"_all": {"total": {"store": {"size_in_bytes": size}}}}
+        if op == "_count":
+            return 200, {"count": sum(1 for i, d in docs.items() if _matches(d, i, body.get("query")))}
+        if op == "_pit":
+            pit_id = f"pit-{len(self._pits)}-{name}"
+            self._pits[pit_id] = name
+            return 200, {"id": pit_id}
+        if op in ("_doc", "_create") and len(parts) == 3:
+            return self._doc(method, name, op, docs, parts[2], body, query)
+        if op == "_update" and len(parts) == 3:
+            doc = docs.get(parts[2])
+            if doc is None:
+                return 404, {"error": {"type": "document_missing_exception"}, "status": 404}
+            doc.update(body.get("doc") or {})
+            return 200, {"result": "updated", "_id": parts[2]}
+        if op in ("_search", "_update_by_query", "_delete_by_query"):
+            hits = [(i, d) for i, d in sorted(docs.items()) if _matches(d, i, body.get("query"))]
+            if op == "_delete_by_query":
+                for i, _ in hits:
+                    del docs[i]
+                return 200, {"deleted": len(hits), "failures": []}
+            if op == "_update_by_query":
+                self._apply_script(hits, body.get("script") or {})
+                return 200, {"updated": len(hits), "failures": []}
+            return 200, self._search(hits, body)
+        return 400, {"error": {"type": "unsupported", "reason": f"{method} /{'/'.join(parts)}"}, "status": 400}
+
+    def _doc(self, method, name, op, docs, doc_id, body, query) -> Tuple[int, Optional[dict]]:
+        if method == "GET":
+            doc = docs.get(doc_id)
+            if doc is None:
+                return 404, {"_id": doc_id, "found": False}
+            return 200, {"_id": doc_id, "found": True, "_source": self._project(doc, query.get("_source_includes", [None])[0])}
+        if method == "DELETE":
+            found = docs.pop(doc_id, None) is not None
+            return (200 if found else 404), {"result": "deleted" if found else "not_found"}
+        if op == "_create" and doc_id in docs:
+            return 409, {"error": {"type": "version_conflict_engine_exception"}, "status": 409}
+        error = self._immense_term(name, body)
+        if error:
+            return 400, {"error": {"type": "illegal_argument_exception", "reason": error}, "status": 400}
+        created = doc_id not in docs
+        docs[doc_id] = body
+        return (201 if created else 200), {"_id": doc_id, "result": "created" if created else "updated"}
+
+    def _bulk(self, raw: bytes) -> dict:
+        lines = [line for line in raw.decode("utf-8").split("\n") if line.strip()]
+        items = []
+        i = 0
+        while i < len(lines):
+            (op, meta), = json.loads(lines[i]).items()
+            i += 1
+            docs = self.indices.setdefault(meta["_index"], {})
+            doc_id = meta.get("_id")
+            if op == "delete":
+                found = docs.pop(doc_id, None) is not None
+                items.append({op: {"_id": doc_id, "status": 200 if found else 404}})
+                continue
+            source = json.loads(lines[i])
+            i += 1
+            if op == "create" and doc_id in docs:
+                items.append({op: {"_id": doc_id, "status": 409, "error": {"type": "version_conflict_engine_exception"}}})
+            elif op in ("index", "create"):
+                error = self._immense_term(meta["_index"], source)
+                if error:
+                    items.append({op: {"_id": doc_id, "status": 400, "error": {"type": "illegal_argument_exception", "reason": error}}})
+                    continue
+                docs[doc_id] = source
+                items.append({op: {"_id": doc_id, "status": 201}})
+            elif doc_id in docs:
+                params = (source.get("script") or {}).get("params") or {}
+                if "if_match" in params:
+                    # BulkWriter.update(if_match=...)
+                    if all(docs[doc_id].get(k) == v for k, v in params["if_match"].items()):
+                        docs[doc_id].update(params.get("doc") or {})
+                        items.append({op: {"_id": doc_id, "status": 200, "result": "updated"}})
+                    else:
+                        items.append({op: {"_id": doc_id, "status": 200, "result": "noop"}})
+                    continue
+                docs[doc_id].update(source.get("doc") or {})
+                items.append({op: {"_id": doc_id, "status": 200}})
+            elif source.get("doc_as_upsert") or "upsert" in source:
+                docs[doc_id] = dict(source.get("upsert") or source.get("doc") or {})
+                items.append({op: {"_id": doc_id, "status": 201}})
+            else:
+                items.append({op: {"_id": doc_id, "status": 404, "error": {"type": "document_missing_exception"}}})
+        errors = any(v["status"] >= 300 for item in items for v in item.values())
+        return {"took": 0, "errors": errors, "items": items}
+
+    def _mget(self, default_index, body, query) -> dict:
+        includes = query.get("_source_includes", [None])[0]
+        requests = body.get("docs") or [{"_id": i} for i in body.get("ids", [])]
+        out = []
+        for r in requests:
+            docs = self.indices.get(r.get("_index") or default_index or "", {})
+            doc = docs.get(r["_id"])
+            if doc is None:
+                out.append({"_id": r["_id"], "found": False})
+            else:
+                out.append({"_id": r["_id"], "found": True, "_source": self._project(doc, r.get("_source", includes))})
+        return {"docs": out}
+
+    def _search(self, hits, body) -> dict:
+        after = body.get("search_after")
+        if after:
+            hits = [h for h in hits if h[0] > str(after[-1])]
+        size = int(body.get("size", 10))
+        source = body.get("_source")
+        if isinstance(source, dict):
+            source = source.get("includes")
+        page = [
+            {"_id": i, "_score": 1.0, "_source": self._project(d, source), "sort": [i]}
+            for i, d in hits[int(body.get("from", 0)):][:size]
+        ]
+        out = {"took": 0, "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": page}}
+        if "pit" in body:
+            out["pit_id"] = body["pit"]["id"]
+        return out
+
+    @staticmethod
+    def _apply_script(hits, script) -> None:
+        params = script.get("params") or {}
+        assigns = _ASSIGN_RE.findall(script.get("source", ""))
+        for _, doc in hits:
+            if assigns:
+                for field, expr in assigns:
+                    doc[field] = _script_value(expr, params)
+            else:
+                doc.update(params.get("fields") or {})
+
+    @staticmethod
+    def _project(doc: Dict[str, Any], includes: Any) -> Any:
+        if includes in (None, True):
+            return doc
+        if includes is False:
+            return {}
+        if isinstance(includes, str):
+            includes = includes.split(",")
+        return {k: v for k, v in doc.items() if k in includes}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _dispatch(self) -> None:
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            status, body = self.server.standin.handle(self.command, url.path, parse_qs(url.query), raw)  # type: ignore[attr-defined]
+        except Exception as e:
+            status, body = 500, {"error": {"type": "standin_error", "reason": repr(e)}, "status": 500}
+        data = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _dispatch
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=9299)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--bulk-ms-per-mb", type=float, default=0.0)
+    ap.add_argument("--bulk-capacity", type=int, default=0, help="Concurrent _bulk requests before 429s (0 = unlimited)")
+    args = ap.parse_args()
+
+    standin = ESStandIn(
+        args.port, args.latency_ms, args.jitter_ms,
+        bulk_ms_per_mb=args.bulk_ms_per_mb, bulk_capacity=args.bulk_capacity,
+    ).start()
+    print(f"ES stand-in on http://{standin.host} (latency {args.latency_ms} ms +/- {args.jitter_ms} ms); Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
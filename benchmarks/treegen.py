@@ -0,0 +1,179 @@
+"""Synthetic project tree generator for indexing benchmarks.
+
+Usage:
+    python benchmarks/treegen.py OUT_DIR [--files 5000] [--median-kb 4] [--binary-ratio 0.05]
+                                 [--junk-ratio 0.3] [--langs python=4,javascript=3,go=1,markdown=1]
+
+Writes ``--files`` indexable files spread over a few directory levels, with
+sizes drawn from a log-normal distribution around ``--median-kb`` and
+content shaped like the chosen languages (imports, functions, classes and
+TODOs, so the extractor has real work). ``--binary-ratio`` of them are
+binary blobs, and ``--junk-ratio`` extra files go under ``node_modules/``,
+``build/`` and ``.git/`` where the walker should never look. The same seed
+always produces the same tree.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# language: (extension, import line, function template, class template, comment prefix)
+LANGUAGES: Dict[str, tuple] = {
+    "python": (".py", "import {mod}", "def {name}(x, y):\n    return x + y * {n}\n", "class {Name}:\n    def run(self):\n        return {n}\n", "#"),
+    "javascript": (".js", "import {{ {name} }} from './{mod}';", "function {name}(a, b) {{\n  return a + b * {n};\n}}\n", "class {Name} {{\n  run() {{ return {n}; }}\n}}\n", "//"),
+    "typescript": (".ts", "import {{ {name} }} from './{mod}';", "export function {name}(a: number, b: number): number {{\n  return a + b * {n};\n}}\n", "export class {Name} {{\n  run(): number {{ return {n}; }}\n}}\n", "//"),
+    "go": (".go", "import \"{mod}\"", "func {name}(a int, b int) int {{\n\treturn a + b*{n}\n}}\n", "type {Name} struct {{\n\tN int\n}}\n", "//"),
+    "rust": (".rs", "use crate::{mod};", "fn {name}(a: i64, b: i64) -> i64 {{\n    a + b * {n}\n}}\n", "struct {Name} {{\n    n: i64,\n}}\n", "//"),
+    "markdown": (".md", "# {Name}", "Some prose about `{name}` and how it relates to {n} other things.\n", "## {Name}\n", "<!--"),
+}
+
+DEFAULT_MIX = "python=4,javascript=3,typescript=1,go=1,markdown=1"
+BINARY_EXTS = [".png", ".jpg", ".pdf", ".zip", ".bin"]
+JUNK_DIRS = ["node_modules/lodash", "node_modules/@scope/pkg/dist", "build/lib", ".git/objects/ab"]
+WORDS = ["alpha", "beta", "gamma", "delta", "parse", "load", "store", "render", "fetch", "cache", "index", "query"]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in LANGUAGES:
+            raise ValueError(f"unknown language {name!r} (known: {', '.join(LANGUAGES)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _source_text(rng: random.Random, language: str, size: int) -> str:
+    ext, imp, func, cls, comment = LANGUAGES[language]
+    lines: List[str] = [imp.format(mod=rng.choice(WORDS), name=rng.choice(WORDS), Name=rng.choice(WORDS).title()) for _ in range(rng.randint(1, 6))]
+    lines.append("")
+    total = sum(len(line) + 1 for line in lines)
+    while total < size:
+        word = rng.choice(WORDS)
+        n = rng.randint(0, 9999)
+        roll = rng.random()
+        if roll < 0.6:
+            chunk = func.format(name=f"{word}_{n}", n=n)
+        elif roll < 0.85:
+            chunk = cls.format(Name=f"{word.title()}{n}", n=n)
+        elif roll < 0.9:
+            chunk = f"{comment} TODO: {word} {n} needs another look\n"
+        else:
+            chunk = f"{comment} {' '.join(rng.choice(WORDS) for _ in range(10))}\n"
+        lines.append(chunk)
+        total += len(chunk) + 1
+    return "\n".join(lines)[:max(size, 1)] + "\n"
+
+
+def _size(rng: random.Random, median_kb: float, sigma: float, max_kb: float) -> int:
+    kb = math.exp(rng.gauss(math.log(max(median_kb, 0.01)), sigma))
+    return max(16, int(min(kb, max_kb) * 1024))
+
+
+def generate_tree(
+    root: Path,
+    files: int = 5000,
+    median_kb: float = 4.0,
+    sigma: float = 1.0,
+    max_kb: float = 2048.0,
+    binary_ratio: float = 0.05,
+    junk_ratio: float = 0.3,
+    mix: Optional[Dict[str, float]] = None,
+    files_per_dir: int = 40,
+    seed: int = 0,
+) -> Dict[str, int]:
+    """Write the tree under ``root``; returns counts and total bytes of indexable files."""
+    rng = random.Random(seed)
+    mix = mix or parse_mix(DEFAULT_MIX)
+    langs, weights = list(mix), list(mix.values())
+    root.mkdir(parents=True, exist_ok=True)
+
+    # Directories a few levels deep, filled in order so some are crowded and some sparse
+    dir_count = max(1, files // max(1, files_per_dir))
+    dirs: List[str] = []
+    for i in range(dir_count):
+        depth = rng.randint(1, 4)
+        parts = [rng.choice(["src", "lib", "pkg", "app", "internal", "docs"])] + [f"{rng.choice(WORDS)}{rng.randint(0, 20)}" for _ in range(depth - 1)]
+        dirs.append("/".join(parts))
+
+    # Backdated like a real checkout, so the files don't look freshly written to the indexer
+    mtime = time.time() - 3600
+    text_files = binary_files = total_bytes = 0
+    for i in range(files):
+        rel_dir = dirs[i % dir_count]
+        (root / rel_dir).mkdir(parents=True, exist_ok=True)
+        size = _size(rng, median_kb, sigma, max_kb)
+        if rng.random() < binary_ratio:
+            ext = rng.choice(BINARY_EXTS)
+            data = b"\x00\x01BIN" + rng.randbytes(size)
+            path = root / rel_dir / f"asset_{i}{ext}"
+            path.write_bytes(data)
+            binary_files += 1
+            total_bytes += len(data)
+        else:
+            language = rng.choices(langs, weights)[0]
+            text = _source_text(rng, language, size)
+            path = root / rel_dir / f"{rng.choice(WORDS)}_{i}{LANGUAGES[language][0]}"
+            path.write_text(text, encoding="utf-8")
+            text_files += 1
+            total_bytes += len(text.encode("utf-8"))
+        os.utime(path, (mtime, mtime))
+
+    junk = int(files * junk_ratio)
+    for i in range(junk):
+        rel_dir = rng.choice(JUNK_DIRS)
+        (root / rel_dir).mkdir(parents=True, exist_ok=True)
+        (root / rel_dir / f"junk_{i}.js").write_text(_source_text(rng, "javascript", 512), encoding="utf-8")
+
+    return {"text_files": text_files, "binary_files": binary_files, "junk_files": junk, "bytes": total_bytes}
+
+
+def change_fraction(root: Path, fraction: float = 0.01, seed: int = 1) -> List[str]:
+    """Append a line to ``fraction`` of the tree's text files (skipping junk); returns their rel paths."""
+    rng = random.Random(seed)
+    candidates = sorted(
+        p for p in root.rglob("*")
+        if p.is_file() and p.suffix in {spec[0] for spec in LANGUAGES.values()}
+        and not any(part in ("node_modules", "build", ".git", ".rewindex") for part in p.relative_to(root).parts)
+    )
+    chosen = rng.sample(candidates, max(1, int(len(candidates) * fraction))) if candidates else []
+    later = time.time() - 60  # Newer than the generated tree, old enough to be trusted once indexed
+    for p in chosen:
+        with open(p, "a", encoding="utf-8") as f:
+            f.write(f"\n// changed {rng.randint(0, 1 << 30)}\n")
+        os.utime(p, (later, later))
+    return [p.relative_to(root).as_posix() for p in chosen]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("out_dir", type=Path)
+    ap.add_argument("--files", type=int, default=5000)
+    ap.add_argument("--median-kb", type=float, default=4.0)
+    ap.add_argument("--sigma", type=float, default=1.0, help="Log-normal spread of file sizes")
+    ap.add_argument("--max-kb", type=float, default=2048.0)
+    ap.add_argument("--binary-ratio", type=float, default=0.05)
+    ap.add_argument("--junk-ratio", type=float, default=0.3)
+    ap.add_argument("--langs", default=DEFAULT_MIX)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.out_dir.exists() and any(args.out_dir.iterdir()):
+        sys.exit(f"{args.out_dir} is not empty")
+    t = time.perf_counter()
+    stats = generate_tree(
+        args.out_dir, files=args.files, median_kb=args.median_kb, sigma=args.sigma, max_kb=args.max_kb,
+        binary_ratio=args.binary_ratio, junk_ratio=args.junk_ratio, mix=parse_mix(args.langs), seed=args.seed,
+    )
+    print(f"{stats} in {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,12 @@ import threading
 
 from .config import Config, find_project_root
 from .search import SearchFilters, SearchOptions, simple_search_es
-from .es import ESClient, ensure_indices
+from .es import get_client, resolve_indices
 from .indexing import watch, poll_watch
+from .thumbnails import thumbnail_progress
+from .priority import scope_progress
+from .retention import run_compactor
+from .versions import VersionStore
 from .theme_watcher import OmarchyThemeWatcher
 
 logger = logging.getLogger(__name__)
@@ -139,8 +143,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
         qs = parse_qs(parsed.query)
         if path_only == "/index/status":
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 watcher_alive = RewindexHandler.watcher_thread and RewindexHandler.watcher_thread.is_alive()
                 watcher_status = "running" if watcher_alive else "stopped"
 
@@ -164,7 +168,12 @@ class RewindexHandler(BaseHTTPRequestHandler):
                     "watcher": watcher_status,
                     "watcher_iterations": RewindexHandler.watcher_iteration_count,
                     "watcher_last_update": RewindexHandler.watcher_last_update,
+                    "thumbnails": thumbnail_progress(),
                 }
+                scopes = scope_progress()
+                if scopes is not None:
+                    # A cold index is running: which top-level dirs are searchable yet
+                    out["scopes"] = scopes
                 _json_response(self, 200, out)
             except (URLError, HTTPError):
                 _json_response(self, 503, {"error": f"Cannot reach Elasticsearch at {cfg.elasticsearch.host}"})
@@ -305,8 +314,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 return
             try:
                 # Force refresh to get latest data
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 es.refresh(idx["files_index"])  # Ensure latest changes are visible
                 doc_id = f"{cfg.project.id}:{p}"
                 doc = es.get_doc(idx["files_index"], doc_id)
@@ -322,8 +331,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 return
             try:
                 # Force refresh to get latest versions
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 es.refresh(idx["versions_index"])  # Ensure latest versions are visible
                 body = {
                     "query": {"bool": {"must": [{"term": {"file_path": p}}]}},
@@ -332,7 +341,7 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 }
                 res = es.search(idx["versions_index"], body)
                 hits = res.get("hits", {}).get("hits", [])
-                out = [h.get("_source", {}) for h in hits]
+                out = VersionStore(es, idx["versions_index"]).fill([h.get("_source", {}) for h in hits])
 
                 # Debug logging
                 import logging
@@ -350,10 +359,10 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 self.send_error(400, "Missing hash param")
                 return
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
-                doc = es.get_doc(idx["versions_index"], h)
-                _json_response(self, 200, (doc or {}).get("_source", {}))
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
+                p = qs.get("path", [None])[0]
+                _json_response(self, 200, VersionStore(es, idx["versions_index"]).get(h, file_path=p) or {})
             except (URLError, HTTPError):
                 _json_response(self, 503, {"error": f"Cannot reach Elasticsearch at {cfg.elasticsearch.host}"})
             return
@@ -361,8 +370,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
         if path_only == "/stats/overview":
             # Aggregate stats by language for dashboard view
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
 
                 # Get optional filters from query params
                 path_prefix = qs.get("path_prefix", [None])[0]
@@ -457,8 +466,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 import logging
                 logger = logging.getLogger(__name__)
 
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
 
                 # Check for file path filtering (search-scoped timeline)
                 paths_param = qs.get("paths", [None])[0]
@@ -535,8 +544,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 self.send_error(400, "Invalid ts param")
                 return
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 body = {
                     "query": {
                         "bool": {
@@ -550,7 +559,7 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 res = es.search(idx["versions_index"], body)
                 hits = res.get("hits", {}).get("hits", [])
                 if hits:
-                    _json_response(self, 200, hits[0].get("_source", {}))
+                    _json_response(self, 200, VersionStore(es, idx["versions_index"]).fill([hits[0].get("_source", {})])[0])
                 else:
                     # fallback to current
                     doc_id = f"{cfg.project.id}:{p}"
@@ -563,8 +572,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
         if path_only == "/folders":
             # Get unique folder paths using aggregation (much faster for folder browser)
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
 
                 # Use script to extract folder paths from file_path
                 body = {
@@ -598,8 +607,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
 
         if path_only == "/files":
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 # Check for show_deleted parameter
                 show_deleted = qs.get("show_deleted", ["false"])[0].lower() == "true"
                 query = {"match_all": {}} if show_deleted else {"term": {"is_current": True}}
@@ -626,8 +635,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 self.send_error(400, "Invalid ts param")
                 return
             try:
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 # Get latest version for each path <= ts
                 body = {
                     "query": {"range": {"created_at": {"lte": ts_val}}},
@@ -826,8 +835,8 @@ class RewindexHandler(BaseHTTPRequestHandler):
                 if filters.get("exclude_paths"):
                     logger.info(f"🚫 Received exclude_paths filter: {filters.get('exclude_paths')}")
 
-                es = ESClient(cfg.elasticsearch.host)
-                idx = ensure_indices(es, cfg.resolved_index_prefix())
+                es = get_client(cfg.elasticsearch.host)
+                idx = resolve_indices(es, cfg.resolved_index_prefix())
                 as_of_ms = filters.get("as_of_ms") or filters.get("created_before_ms")
                 index_name = idx["versions_index"] if as_of_ms else idx["files_index"]
                 res = simple_search_es(
@@ -1161,6 +1170,15 @@ def run(host: str = "127.0.0.1", port: int = 8899, beads_root: str | None = None
         RewindexHandler.watcher_thread = watcher_thread
         watcher_thread.start()
         print(f"[rewindex] File watcher started (auto-watching project)")
+
+        if cfg.versioning.compact_interval_minutes > 0:
+            threading.Thread(
+                target=run_compactor,
+                args=(root, cfg, RewindexHandler.watcher_stop),
+                name="rewindex-compactor",
+                daemon=True,
+            ).start()
+            print(f"[rewindex] Version compaction every {cfg.versioning.compact_interval_minutes} min")
     except Exception as e:
         print(f"[rewindex] WARNING: Could not start file watcher: {e}")
 
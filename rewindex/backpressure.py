@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+def jittered_backoff(attempt: int, base_s: float = 0.2, cap_s: float = 10.0) -> float:
+    """Seconds to wait before retry ``attempt`` (1-based): "full jitter" exponential backoff.
+
+    A random point in ``[0, min(cap, base * 2**attempt)]``, so writers that were
+    rejected together don't all come back at the same moment.
+    """
+    return random.uniform(0.0, min(cap_s, base_s * (2 ** max(0, attempt))))
+
+
+class AIMDController:
+    """Adaptive limit on concurrent requests to Elasticsearch (additive increase, multiplicative decrease).
+
+    Callers :meth:`acquire` a slot before a request, :meth:`record` how each
+    round trip went and :meth:`release` the slot afterwards. Every ``limit``
+    healthy round trips raise the limit by one, up to ``max_limit``. A
+    rejection (429, timeout, connection error) or a round trip slower than
+    ``target_latency_s`` or much slower than the usual halves it, at most once
+    per round trip so one burst of rejections counts once, down to
+    ``min_limit``. A small cluster thereby settles where it stops pushing
+    back, and a big one is driven up to ``max_limit``.
+    """
+
+    # Round trips this many times the usual latency count as congestion (if over MIN_SLOW_S)
+    SLOW_FACTOR = 3.0
+    MIN_SLOW_S = 0.25
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 4,
+        initial: Optional[int] = None,
+        target_latency_s: float = 2.0,
+        decrease: float = 0.5,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_latency_s = target_latency_s
+        self.decrease = decrease
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial if initial is not None else self.min_limit)))
+        self.in_flight = 0
+        self.stats = {"requests": 0, "rejected": 0, "slow": 0, "decreases": 0}
+
+        self._cond = threading.Condition()
+        self._baseline: Optional[float] = None  # Slow EWMA of healthy latencies
+        self._no_decrease_until = 0.0
+
+    @classmethod
+    def from_config(cls, writes) -> "AIMDController":
+        return cls(
+            min_limit=writes.min_in_flight,
+            max_limit=writes.max_in_flight,
+            target_latency_s=writes.target_latency_ms / 1000.0,
+        )
+
+    def acquire(self) -> None:
+        """Block until fewer than ``limit`` requests are in flight, then take a slot."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, latency_s: float, rejected: bool = False) -> bool:
+        """Feed back one round trip; returns True if it lowered the limit."""
+        now = time.monotonic()
+        with self._cond:
+            self.stats["requests"] += 1
+            baseline = self._baseline
+            slow = latency_s > self.target_latency_s or (
+                baseline is not None and latency_s > max(self.MIN_SLOW_S, baseline * self.SLOW_FACTOR)
+            )
+            if not (rejected or slow):
+                self._baseline = latency_s if baseline is None else 0.95 * baseline + 0.05 * latency_s
+                if self.limit < self.max_limit:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                    self._cond.notify_all()
+                return False
+
+            self.stats["rejected" if rejected else "slow"] += 1
+            if now < self._no_decrease_until:
+                return False
+            self._no_decrease_until = now + max(latency_s, 0.05)
+            before = int(self.limit)
+            self.limit = max(float(self.min_limit), self.limit * self.decrease)
+            if int(self.limit) < before:
+                self.stats["decreases"] += 1
+                return True
+            return False
+
+    def scale(self, workers: int) -> int:
+        """How many of ``workers`` should be busy at the current limit (at least one)."""
+        with self._cond:
+            share = self.limit / self.max_limit
+        return max(1, min(workers, math.ceil(workers * share)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"limit": int(self.limit), "in_flight": self.in_flight, **self.stats}
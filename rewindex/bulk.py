@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+
+from .backpressure import AIMDController, jittered_backoff
+from .es import ESClient, forget_indices, index_missing
+
+
+# Per-item statuses worth retrying (rejected execution, timeouts, transient 5xx)
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+# Painless for BulkWriter.update(if_match=...): apply params.doc only while
+# every params.if_match field still has its value
+IF_MATCH_SCRIPT = (
+    "boolean match = true;"
+    " for (e in params.if_match.entrySet()) { if (ctx._source[e.getKey()] != e.getValue()) { match = false; } }"
+    " if (match) { ctx._source.putAll(params.doc); } else { ctx.op = 'none'; }"
+)
+
+
+class BulkWriter:
+    """Buffered writer on top of the ``_bulk`` API.
+
+    Operations are queued and sent as one request when any of these limits is
+    reached: ``max_docs`` operations, ``max_bytes`` of NDJSON, or ``max_age_s``
+    since the oldest queued operation (checked by a background flusher thread,
+    so a quiet watcher still gets its writes out promptly).
+
+    Items (or whole requests) rejected with a retryable status, and requests
+    that hit a connection error or timeout, are re-sent with jittered backoff
+    up to ``max_retries`` times; anything else is recorded in ``failures``.
+
+    Without a ``controller`` requests are sent one at a time by whichever
+    thread fills the buffer. With one, full batches go out on sender threads,
+    as many at once as the controller allows (queueing more blocks, which is
+    the backpressure), and a batch waits for in-flight batches that touch the
+    same docs so each doc's operations still apply in order. :meth:`flush`
+    returns once everything queued before it is acknowledged either way.
+    """
+
+    def __init__(
+        self,
+        es: ESClient,
+        max_docs: int = 500,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_age_s: float = 1.0,
+        max_retries: int = 3,
+        refresh: Optional[str] = None,
+        controller: Optional[AIMDController] = None,
+        backoff_base_s: float = 0.2,
+        backoff_max_s: float = 10.0,
+    ) -> None:
+        self.es = es
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.max_retries = max_retries
+        self.refresh = refresh
+        self.controller = controller
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+
+        # Each op: (action_line, source_line or None, (index, doc_id), on_stored or None)
+        self._ops: List[Tuple[str, Optional[str], Tuple[str, str], Optional[Callable[[], None]]]] = []
+        self._bytes = 0
+        self._oldest: Optional[float] = None
+        # Latest buffered source per (index, id) so readers can see unsent writes
+        self._pending: Dict[Tuple[str, str], dict] = {}
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+        # Batches on sender threads and the docs they touch (controller mode)
+        self._sending = threading.Condition()
+        self._in_flight_batches = 0
+        self._in_flight_keys: Counter = Counter()
+        self._last_backoff_log = 0.0
+
+        self.stats = {"requests": 0, "docs": 0, "bytes": 0, "retries": 0, "failed": 0}
+        self.failures: List[Dict[str, Any]] = []
+
+    # Queueing
+    def index(self, index: str, doc_id: str, body: dict) -> None:
+        action = json.dumps({"index": {"_index": index, "_id": doc_id}})
+        self._add(action, json.dumps(body), (index, doc_id), body)
+
+    def create(self, index: str, doc_id: str, body: dict, on_stored: Optional[Callable[[], None]] = None) -> None:
+        """Queue a write that only happens if the doc doesn't exist yet.
+
+        ``on_stored`` is called (on the sending thread) once Elasticsearch
+        confirms the doc exists, whether this write created it or not.
+        """
+        action = json.dumps({"create": {"_index": index, "_id": doc_id}})
+        self._add(action, json.dumps(body), (index, doc_id), body, on_stored)
+
+    def update(self, index: str, doc_id: str, partial: dict, if_match: Optional[Dict[str, Any]] = None) -> None:
+        """Queue a partial-document update; a missing target doc is not an error.
+
+        With ``if_match`` (field -> value) the update is a script that only
+        applies while the stored doc still has those values, and is a no-op
+        otherwise.
+        """
+        action = json.dumps({"update": {"_index": index, "_id": doc_id}})
+        key = (index, doc_id)
+        with self._lock:
+            buffered = self._pending.get(key)
+        if not if_match:
+            merged = {**buffered, **partial} if buffered is not None else None
+            self._add(action, json.dumps({"doc": partial}), key, merged)
+            return
+        if buffered is not None and any(buffered.get(k) != v for k, v in if_match.items()):
+            merged = buffered
+        else:
+            merged = {**buffered, **partial} if buffered is not None else None
+        script = {"script": {"source": IF_MATCH_SCRIPT, "params": {"if_match": if_match, "doc": partial}}}
+        self._add(action, json.dumps(script), key, merged)
+
+    def delete(self, index: str, doc_id: str) -> None:
+        action = json.dumps({"delete": {"_index": index, "_id": doc_id}})
+        self._add(action, None, (index, doc_id), None)
+
+    def peek(self, index: str, doc_id: str) -> Optional[dict]:
+        """Return the buffered (not yet flushed) source for a doc, if any."""
+        with self._lock:
+            return self._pending.get((index, doc_id))
+
+    def _add(
+        self,
+        action: str,
+        source: Optional[str],
+        key: Tuple[str, str],
+        body: Optional[dict],
+        on_stored: Optional[Callable[[], None]] = None,
+    ) -> None:
+        size = len(action) + 1 + (len(source) + 1 if source is not None else 0)
+        with self._lock:
+            self._ops.append((action, source, key, on_stored))
+            self._bytes += size
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if body is not None:
+                self._pending[key] = body
+            else:
+                self._pending.pop(key, None)
+            full = len(self._ops) >= self.max_docs or self._bytes >= self.max_bytes
+        self._ensure_flusher()
+        if full:
+            self._dispatch()
+
+    # Flushing
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None or self.max_age_s <= 0:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            t = threading.Thread(target=self._flush_loop, name="rewindex-bulk-flusher", daemon=True)
+            self._flusher = t
+        t.start()
+
+    def _flush_loop(self) -> None:
+        interval = max(0.05, self.max_age_s / 2.0)
+        while not self._stop.wait(interval):
+            with self._lock:
+                due = self._oldest is not None and (time.monotonic() - self._oldest) >= self.max_age_s
+            if due:
+                try:
+                    self._dispatch()
+                except Exception as e:
+                    print(f"[rewindex] WARNING: background bulk flush failed: {e}")
+
+    def flush(self) -> None:
+        """Send everything buffered and wait until all of it has been acknowledged."""
+        self._dispatch()
+        with self._sending:
+            while self._in_flight_batches:
+                self._sending.wait()
+
+    def _dispatch(self) -> None:
+        # One dispatcher at a time keeps batches leaving in the order they were queued
+        with self._flush_lock:
+            with self._lock:
+                ops = self._ops
+                self._ops = []
+                self._bytes = 0
+                self._oldest = None
+                # What peek() shows for each doc now; a newer write replaces it
+                sent = {op[2]: self._pending.get(op[2]) for op in ops}
+            if not ops:
+                return
+            if self.controller is None:
+                try:
+                    self._send(ops)
+                finally:
+                    self._settle(sent)
+                return
+
+            keys = Counter(op[2] for op in ops)
+            with self._sending:
+                while any(key in self._in_flight_keys for key in keys):
+                    self._sending.wait()
+                self._in_flight_keys.update(keys)
+                self._in_flight_batches += 1
+            try:
+                self.controller.acquire()
+                threading.Thread(
+                    target=self._send_batch, args=(ops, keys, sent), name="rewindex-bulk-sender", daemon=True,
+                ).start()
+            except BaseException:
+                self._batch_done(keys, sent, acquired=False)
+                raise
+
+    def _send_batch(self, ops, keys: Counter, sent: Dict[Tuple[str, str], Optional[dict]]) -> None:
+        try:
+            self._send(ops)
+        except Exception as e:
+            for op in ops:
+                index, doc_id = op[2]
+                self._record_failure(index, doc_id, None, str(e))
+        finally:
+            self._batch_done(keys, sent, acquired=True)
+
+    def _batch_done(self, keys: Counter, sent: Dict[Tuple[str, str], Optional[dict]], acquired: bool) -> None:
+        if acquired:
+            self.controller.release()
+        self._settle(sent)
+        with self._sending:
+            self._in_flight_keys.subtract(keys)
+            for key in keys:
+                if self._in_flight_keys[key] <= 0:
+                    del self._in_flight_keys[key]
+            self._in_flight_batches -= 1
+            self._sending.notify_all()
+
+    def _settle(self, sent: Dict[Tuple[str, str], Optional[dict]]) -> None:
+        with self._lock:
+            # Docs written again since this batch was taken stay visible to peek()
+            for key, body in sent.items():
+                if self._pending.get(key) is body:
+                    self._pending.pop(key, None)
+
+    def _observe(self, started: float, rejected: bool) -> None:
+        if self.controller is None:
+            return
+        before = int(self.controller.limit)
+        if self.controller.record(time.monotonic() - started, rejected) and time.monotonic() - self._last_backoff_log >= 10.0:
+            self._last_backoff_log = time.monotonic()
+            print(f"[rewindex] Elasticsearch is {'rejecting writes' if rejected else 'slow'}; "
+                  f"bulk concurrency {before} -> {int(self.controller.limit)}")
+
+    def _send(self, ops: List[Tuple[str, Optional[str], Tuple[str, str], Optional[Callable[[], None]]]]) -> None:
+        attempt = 0
+        while ops:
+            lines = []
+            for action, source, _key, _cb in ops:
+                lines.append(action)
+                if source is not None:
+                    lines.append(source)
+            payload = "\n".join(lines) + "\n"
+            started = time.monotonic()
+            try:
+                res = self.es.bulk(payload, refresh=self.refresh)
+            except (HTTPError, URLError, OSError) as e:
+                # Whole request failed (429 on the endpoint, timeout, connection reset).
+                # Other statuses (400 on a malformed payload, 413) fail the same way
+                # again, and aren't Elasticsearch pushing back.
+                retryable = not isinstance(e, HTTPError) or e.code in RETRYABLE_STATUSES
+                if retryable:
+                    self._observe(started, rejected=True)
+                if retryable and attempt < self.max_retries:
+                    attempt += 1
+                    with self._lock:
+                        self.stats["retries"] += len(ops)
+                    time.sleep(jittered_backoff(attempt, self.backoff_base_s, self.backoff_max_s))
+                    continue
+                for op in ops:
+                    index, doc_id = op[2]
+                    self._record_failure(index, doc_id, getattr(e, "code", None), str(e))
+                return
+
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["bytes"] += len(payload)
+
+            retry = []
+            failed = 0
+            rejected = False
+            items = res.get("items", []) if res.get("errors") else []
+            # Without errors every op went through
+            stored = [] if res.get("errors") else [op[3] for op in ops]
+            for op, item in zip(ops, items):
+                result = next(iter(item.values()), {}) if item else {}
+                status = int(result.get("status", 200))
+                if status < 300:
+                    stored.append(op[3])
+                    continue
+                if index_missing(result):
+                    # Deleted behind our back; the next resolve_indices recreates it
+                    forget_indices(self.es, op[2][0])
+                elif status == 404 and not op[0].startswith(('{"index"', '{"create"')):
+                    # Deleting/updating a doc that isn't there: nothing to do
+                    continue
+                elif status == 409 and op[0].startswith('{"create"'):
+                    # Already stored; create-once writes expect this
+                    stored.append(op[3])
+                    continue
+                if status in RETRYABLE_STATUSES:
+                    rejected = True
+                if status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                    retry.append(op)
+                else:
+                    failed += 1
+                    index, doc_id = op[2]
+                    self._record_failure(index, doc_id, status, result.get("error"))
+            self._observe(started, rejected)
+            with self._lock:
+                self.stats["docs"] += len(ops) - len(retry) - failed
+            for cb in stored:
+                if cb is not None:
+                    cb()
+
+            if not retry:
+                return
+            attempt += 1
+            with self._lock:
+                self.stats["retries"] += len(retry)
+            time.sleep(jittered_backoff(attempt, self.backoff_base_s, self.backoff_max_s))
+            ops = retry
+
+    def _record_failure(self, index: str, doc_id: str, status: Any, error: Any) -> None:
+        with self._lock:
+            self.stats["failed"] += 1
+            self.failures.append({"index": index, "id": doc_id, "status": status, "error": error})
+            failed = self.stats["failed"]
+        if failed <= 5:
+            print(f"[rewindex] ERROR bulk write failed for {doc_id} ({status}): {error}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5.0)
+            self._flusher = None
+        self.flush()
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .config import ensure_rewindex_dir
+
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FILENAME = "checkpoint.json"
+CHECKPOINT_LOG_FILENAME = "checkpoint.log"
+
+
+def walk_key(rel_path: str) -> Tuple[Tuple[int, str], ...]:
+    """Sort key matching the walk order of ``iter_candidate_entries``.
+
+    Each directory's files come first (by name), then its subdirectories'
+    subtrees (by name), so comparing keys tells which of two paths the walk
+    reaches first.
+    """
+    parts = rel_path.split("/")
+    return tuple((1, p) for p in parts[:-1]) + ((0, parts[-1]),)
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class IndexCheckpoint:
+    """Persisted progress of a full index run, so an interrupted one can resume.
+
+    Two files under ``.rewindex/``: an append-only log of finished files
+    (``content_hash<TAB>rel_path`` per line) and a small JSON header with the
+    walk cursor, counters and how much of the log is valid (anything past
+    that was written after the last save and is ignored).
+
+    The cursor is the last file such that it and everything the walk
+    yielded before it are finished, so a resumed walk can skip straight past
+    it; files finished out of order after it are skipped via the log. Files
+    handed out ahead of the walk (see ``priority``) are tracked unordered:
+    they hold the cursor back until they finish but never become it.
+    :meth:`save` must only be called once everything logged is in
+    Elasticsearch, which is why it takes the writer's flush.
+    """
+
+    def __init__(self, directory: Path, project_id: str, files_index: str) -> None:
+        self.header_path = directory / CHECKPOINT_FILENAME
+        self.log_path = directory / CHECKPOINT_LOG_FILENAME
+        self.project_id = project_id
+        self.files_index = files_index
+
+        self.cursor: Optional[str] = None
+        self.completed = 0  # Files in the valid part of the log
+        self.log_bytes = 0  # Length of the valid part of the log
+        self.counters: Dict[str, int] = {"added": 0, "updated": 0, "skipped": 0}
+        self.total_hint = 0
+        self.elapsed_s = 0.0  # Active indexing time over all sessions
+        self.started_at = int(time.time() * 1000)
+        self.complete = False
+        self.scopes: Optional[Dict[str, Any]] = None  # Per top-level dir progress of a prioritized run
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._low = 0  # Lowest walk sequence number not finished yet
+        self._inflight: Dict[str, Tuple[int, bool]] = {}
+        self._finished_seqs: Dict[int, Tuple[str, bool]] = {}
+        self._lines: List[str] = []
+        self._session_start = time.monotonic()
+        self._session_completed = 0
+        self._last_save = time.monotonic()
+        self._broken = False
+
+    # Loading and starting
+    @classmethod
+    def read_header(cls, project_root: Path) -> Optional[Dict[str, Any]]:
+        path = project_root / ".rewindex" / CHECKPOINT_FILENAME
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == CHECKPOINT_VERSION else None
+
+    @classmethod
+    def load(cls, project_root: Path, project_id: str, files_index: str) -> Optional["IndexCheckpoint"]:
+        """The unfinished checkpoint for this project and index, if there is one."""
+        data = cls.read_header(project_root)
+        if (
+            data is None
+            or data.get("complete")
+            or data.get("project_id") != project_id
+            or data.get("files_index") != files_index
+        ):
+            return None
+        ckpt = cls(ensure_rewindex_dir(project_root), project_id, files_index)
+        ckpt.cursor = data.get("cursor")
+        ckpt.completed = int(data.get("completed", 0))
+        ckpt.log_bytes = int(data.get("log_bytes", 0))
+        ckpt.counters.update(data.get("counters") or {})
+        ckpt.total_hint = int(data.get("total_hint", 0))
+        ckpt.elapsed_s = float(data.get("elapsed_s", 0.0))
+        ckpt.started_at = int(data.get("started_at", ckpt.started_at))
+        ckpt._session_completed = ckpt.completed
+        return ckpt
+
+    @classmethod
+    def start(cls, project_root: Path, project_id: str, files_index: str, total_hint: int = 0) -> "IndexCheckpoint":
+        """A fresh checkpoint; the last complete run's size is kept as the total estimate."""
+        previous = cls.read_header(project_root) or {}
+        ckpt = cls(ensure_rewindex_dir(project_root), project_id, files_index)
+        if previous.get("complete") and previous.get("project_id") == project_id:
+            total_hint = max(total_hint, int(previous.get("total_hint", 0)))
+        ckpt.total_hint = total_hint
+        ckpt.log_path.write_text("", encoding="utf-8")
+        ckpt._write_header()
+        return ckpt
+
+    def restore(self) -> Tuple[Set[str], Dict[str, str]]:
+        """Paths finished by earlier sessions, and content hash -> path for them."""
+        paths: Set[str] = set()
+        hashes: Dict[str, str] = {}
+        try:
+            with open(self.log_path, "r+b") as f:
+                data = f.read(self.log_bytes)
+                if len(data) < self.log_bytes:
+                    raise OSError("checkpoint log is shorter than recorded")
+                for line in data.decode("utf-8").splitlines():
+                    h, _, rel = line.partition("\t")
+                    if not rel:
+                        continue
+                    paths.add(rel)
+                    if h:
+                        hashes[h] = rel
+                # Whatever follows was never confirmed by a save; new lines go after the valid part
+                f.truncate(self.log_bytes)
+        except (OSError, UnicodeDecodeError):
+            # Unreadable: start the log over (everything is redone, cheaply via the manifest).
+            # The cursor goes too: files before it are only known to be present through the log
+            paths, hashes = set(), {}
+            self.cursor = None
+            self.log_bytes = 0
+            self.log_path.write_text("", encoding="utf-8")
+        self.completed = len(paths)
+        self._session_completed = self.completed
+        return paths, hashes
+
+    # Tracking
+    def track(self, rel_path: str, ordered: bool = True) -> None:
+        """Note a file the walk yielded (call in the order files are handed out).
+
+        ``ordered`` files come in walk order and may become the cursor.
+        """
+        with self._lock:
+            self._inflight[rel_path] = (self._seq, ordered)
+            self._seq += 1
+
+    def done(self, rel_path: str, content_hash: Optional[str] = "") -> None:
+        with self._lock:
+            tracked = self._inflight.pop(rel_path, None)
+            self._lines.append(f"{content_hash or ''}\t{rel_path}\n")
+            if tracked is None:
+                return
+            seq, ordered = tracked
+            self._finished_seqs[seq] = (rel_path, ordered)
+            while self._low in self._finished_seqs:
+                rel, ordered = self._finished_seqs.pop(self._low)
+                if ordered:
+                    self.cursor = rel
+                self._low += 1
+
+    def due(self, interval_s: float) -> bool:
+        return time.monotonic() - self._last_save >= interval_s
+
+    def save(
+        self,
+        flush: Callable[[], None],
+        counters: Optional[Dict[str, int]] = None,
+        scopes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Persist what's finished so far; ``flush`` must get it all into Elasticsearch first."""
+        if self._broken:
+            return
+        with self._lock:
+            lines, self._lines = self._lines, []
+            cursor = self.cursor
+        try:
+            flush()
+            if lines:
+                with open(self.log_path, "ab") as f:
+                    # Drop anything an interrupted save left behind
+                    f.truncate(self.log_bytes)
+                    f.write("".join(lines).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    log_bytes = f.tell()
+            else:
+                log_bytes = self.log_bytes
+        except BaseException:
+            # An interrupted flush may have dropped writes for files already
+            # marked done, so nothing after the last good save can be trusted
+            self._broken = True
+            raise
+        now = time.monotonic()
+        self.completed += len(lines)
+        self.log_bytes = log_bytes
+        self.elapsed_s += now - self._last_save
+        self._last_save = now
+        if counters:
+            self.counters.update(counters)
+        if scopes is not None:
+            self.scopes = scopes
+        self._write_header(cursor)
+
+    def finish(self) -> None:
+        """Mark the run complete; its size becomes the next run's total estimate."""
+        with self._lock:
+            self.completed += len(self._lines)
+            self._lines = []
+        self.elapsed_s += time.monotonic() - self._last_save
+        self.complete = True
+        self.total_hint = self.completed
+        self.scopes = None
+        self._write_header(None)
+        try:
+            self.log_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    # Progress
+    def progress(self, completed: Optional[int] = None) -> str:
+        """e.g. "12,345/~50,000 files (24.7%), 210 files/s, ETA 3m12s"."""
+        with self._lock:
+            done = (self.completed + len(self._lines)) if completed is None else completed
+        total = max(self.total_hint, done)
+        rate_elapsed = time.monotonic() - self._session_start
+        rate = (done - self._session_completed) / rate_elapsed if rate_elapsed > 0 else 0.0
+        out = f"{done:,}/~{total:,} files" if self.total_hint else f"{done:,} files"
+        if self.total_hint:
+            out += f" ({100.0 * done / total:.1f}%)"
+        if rate > 0:
+            out += f", {rate:.0f} files/s"
+            if self.total_hint and total > done:
+                out += f", ETA {_format_duration((total - done) / rate)}"
+        return out
+
+    def _write_header(self, cursor: Optional[str] = None) -> None:
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "project_id": self.project_id,
+            "files_index": self.files_index,
+            "started_at": self.started_at,
+            "updated_at": int(time.time() * 1000),
+            "cursor": cursor,
+            "completed": self.completed,
+            "log_bytes": self.log_bytes,
+            "counters": self.counters,
+            "total_hint": self.total_hint,
+            "elapsed_s": round(self.elapsed_s, 1),
+            "complete": self.complete,
+        }
+        if self.scopes is not None:
+            data["scopes"] = self.scopes
+        tmp = self.header_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.header_path)
+
+
+def checkpoint_status(project_root: Path) -> Optional[Dict[str, Any]]:
+    """Progress of the last checkpointed run, from the persisted header."""
+    data = IndexCheckpoint.read_header(project_root)
+    if data is None:
+        return None
+    done = int(data.get("completed", 0))
+    total = max(int(data.get("total_hint", 0)), done)
+    out: Dict[str, Any] = {
+        "complete": bool(data.get("complete")),
+        "completed": done,
+        "total_estimate": total or None,
+        "cursor": data.get("cursor"),
+        "elapsed_s": data.get("elapsed_s"),
+        "updated_at": data.get("updated_at"),
+    }
+    elapsed = float(data.get("elapsed_s") or 0)
+    if not out["complete"] and total > done and done and elapsed > 0:
+        out["percent"] = round(100.0 * done / total, 1)
+        out["eta_s"] = int((total - done) / (done / elapsed))
+    scopes = data.get("scopes")
+    if not out["complete"] and scopes:
+        # Which top-level dirs are already fully searchable
+        out["scopes_complete"] = sorted(s for s, v in scopes.items() if v.get("complete"))
+        out["scopes_partial"] = {
+            s: f"{v.get('done', 0)}/{v.get('total', 0)}" for s, v in sorted(scopes.items()) if not v.get("complete")
+        }
+    return out
+
+
+def clear_checkpoint(project_root: Path) -> None:
+    """Remove a persisted checkpoint (e.g. after the indices were deleted)."""
+    for name in (CHECKPOINT_FILENAME, CHECKPOINT_LOG_FILENAME):
+        try:
+            (project_root / ".rewindex" / name).unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+
+from .bulk import BulkWriter
+from .es import ESClient
+
+
+# File doc fields copied onto each chunk (for filters and name matches)
+CHUNK_FIELDS = ("file_path", "file_name", "extension", "language", "project_id", "content_hash")
+
+# file_ids per delete-by-query in drop_chunks
+DROP_BATCH_SIZE = 1000
+
+
+def chunks_index_for(files_index: str) -> str:
+    """Chunks index paired with a files index (see :func:`~rewindex.es.ensure_indices`)."""
+    base = files_index[: -len("_files")] if files_index.endswith("_files") else files_index
+    return f"{base}_chunks"
+
+
+def chunk_id(file_id: str, n: int) -> str:
+    return f"{file_id}#{n}"
+
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode("utf-8", "surrogatepass"))
+
+
+def _chars_within(text: str, max_bytes: int) -> int:
+    """Longest prefix of ``text`` (in characters, at least one) that fits in ``max_bytes`` of UTF-8."""
+    lo, hi = 1, min(len(text), max_bytes)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _utf8_len(text[:mid]) <= max_bytes:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def split_chunks(content: str, max_lines: int = 200, max_bytes: int = 32 * 1024) -> Iterator[Tuple[int, int, str]]:
+    """Cut ``content`` into (start_line, end_line, text) windows of at most ``max_lines`` lines.
+
+    Lines are counted by "\\n" (like ``line_count`` and the search-side line
+    mapping) and are 1-based and inclusive. A window also ends before its
+    UTF-8 encoding would pass ``max_bytes``; a single line longer than that
+    (minified code, logs) is split into several chunks that all carry its
+    line number.
+    """
+    max_lines = max(1, max_lines)
+    max_bytes = max(4, max_bytes)
+    pos, line, n = 0, 1, len(content)
+    while pos < n:
+        start, first = pos, line
+        count = size = 0
+        while pos < n and count < max_lines:
+            nl = content.find("\n", pos)
+            end = n if nl < 0 else nl + 1
+            room = max_bytes - size
+            # Every character is at least a byte, so only short lines need encoding
+            line_bytes = _utf8_len(content[pos:end]) if end - pos <= room else room + 1
+            if line_bytes > room:
+                if count == 0:
+                    # Mid-line cut; the rest of the line starts the next chunk
+                    pos = start + _chars_within(content[start:min(end, start + max_bytes)], max_bytes)
+                break
+            pos = end
+            size += line_bytes
+            count += 1
+            if nl >= 0:
+                line += 1
+        text = content[start:pos]
+        last = first + text.count("\n") - (1 if text.endswith("\n") else 0)
+        yield first, max(first, last), text
+
+
+def queue_chunks(writer: BulkWriter, files_index: str, file_id: str, body: Dict[str, Any], cfg) -> bool:
+    """Queue chunk docs for a file doc about to be written; returns whether it's chunked.
+
+    Only text files of at least ``indexing.chunk_min_kb`` are chunked. Chunk
+    ids are stable per position, so a rewrite replaces the old chunks in
+    place; any surplus from longer old content no longer matches the file's
+    content hash and is dropped by :func:`drop_stale_chunks`, as are all of
+them once the file is no longer chunked.
+    """
+    icfg = cfg.indexing
+    content = body.get("content") or ""
+    if not icfg.chunk_min_kb or int(body.get("size_bytes") or 0) < icfg.chunk_min_kb * 1024 or not content:
+        return False
+    chunks_index = chunks_index_for(files_index)
+    shared = {k: body.get(k) for k in CHUNK_FIELDS}
+    for n, (start_line, end_line, text) in enumerate(split_chunks(content, icfg.chunk_lines, icfg.chunk_max_kb * 1024)):
+        writer.index(chunks_index, chunk_id(file_id, n), {
+            **shared,
+            "file_id": file_id,
+            "chunk": n,
+            "start_line": start_line,
+            "end_line": end_line,
+            "content": text,
+        })
+    return True
+
+
+def drop_stale_chunks(es: ESClient, files_index: str, file_id: str, content_hash: Optional[str]) -> None:
+    """Delete a file's chunks of any content but ``content_hash`` (all of them for None).
+
+    Best-effort: stale chunks never match anyway.
+    """
+    try:
+        es.delete_by_query(chunks_index_for(files_index), {
+            "query": {
+                "bool": {
+                    "filter": [{"term": {"file_id": file_id}}],
+                    "must_not": [{"term": {"content_hash": content_hash or ""}}],
+                }
+            }
+        })
+    except (HTTPError, URLError):
+        pass
+
+
+def drop_chunks(es: ESClient, files_index: str, file_ids: List[str]) -> None:
+    """Delete every chunk of ``file_ids`` (deleted files), best-effort."""
+    for i in range(0, len(file_ids), DROP_BATCH_SIZE):
+        try:
+            es.delete_by_query(chunks_index_for(files_index), {
+                "query": {"terms": {"file_id": file_ids[i:i + DROP_BATCH_SIZE]}}
+            })
+        except (HTTPError, URLError):
+            pass
+
+
+def drop_chunks_under(es: ESClient, files_index: str, project_id: str, rel_dir: str) -> None:
+    """Delete the chunks of every file under ``rel_dir`` (a deleted directory), best-effort."""
+    try:
+        es.delete_by_query(chunks_index_for(files_index), {"query": {"bool": {"filter": [
+            {"term": {"project_id": project_id}},
+            {"prefix": {"file_path": rel_dir.rstrip("/") + "/"}},
+        ]}}})
+    except (HTTPError, URLError):
+        pass
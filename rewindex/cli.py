@@ -14,6 +14,8 @@ from .config import Config, find_project_root, ensure_project_config
 from .indexing import index_project, poll_watch
 from .search import SearchFilters, SearchOptions, simple_search_es
 from .es import ESClient, ensure_indices
+from .checkpoint import checkpoint_status, clear_checkpoint
+from .versions import VersionStore
 
 
 def parse_relative_time(time_str: str) -> int:
@@ -114,8 +116,8 @@ def cmd_index_start(args: argparse.Namespace) -> int:
     root = _project_root(Path.cwd())
     cfg = Config.load(root)
     try:
-        # Enable verbose logging for manual index runs
-        res = index_project(root, cfg, verbose=True)
+        # Enable verbose logging for manual index runs; checkpointed so --resume can pick up after an interruption
+        res = index_project(root, cfg, verbose=True, checkpoint=True, resume=args.resume)
         print(json.dumps(res))
         if args.watch:
             poll_watch(root, cfg, interval_s=1.0)
@@ -125,6 +127,21 @@ def cmd_index_start(args: argparse.Namespace) -> int:
     return 0
 
 
+def cmd_index_previews(args: argparse.Namespace) -> int:
+    """Generate missing image previews (backfill)."""
+    from .indexing import backfill_previews
+
+    root = _project_root(Path.cwd())
+    cfg = Config.load(root)
+    try:
+        res = backfill_previews(root, cfg, limit=args.limit)
+        print(json.dumps(res))
+    except (URLError, HTTPError):
+        print(f"Error: could not reach Elasticsearch at {cfg.elasticsearch.host}. Is it running?", file=sys.stderr)
+        return 1
+    return 0
+
+
 def cmd_index_status(args: argparse.Namespace) -> int:
     root = _project_root(Path.cwd())
     cfg = Config.load(root)
@@ -142,6 +159,9 @@ def cmd_index_status(args: argparse.Namespace) -> int:
                 "versions": es.count(idx["versions_index"]) if es.index_exists(idx["versions_index"]) else 0,
             }
         }
+        progress = checkpoint_status(root)
+        if progress is not None:
+            out["last_full_index"] = progress
         print(json.dumps(out, indent=2))
     except (URLError, HTTPError):
         print(f"Error: could not reach Elasticsearch at {cfg.elasticsearch.host}. Is it running?", file=sys.stderr)
@@ -149,6 +169,21 @@ def cmd_index_status(args: argparse.Namespace) -> int:
     return 0
 
 
+def cmd_index_compact(args: argparse.Namespace) -> int:
+    """Apply version retention and the index size budget."""
+    from .retention import compact
+
+    root = _project_root(Path.cwd())
+    cfg = Config.load(root)
+    try:
+        res = compact(root, cfg, dry_run=args.dry_run)
+        print(json.dumps(res, indent=2))
+    except (URLError, HTTPError):
+        print(f"Error: could not reach Elasticsearch at {cfg.elasticsearch.host}. Is it running?", file=sys.stderr)
+        return 1
+    return 0
+
+
 def cmd_index_rebuild(args: argparse.Namespace) -> int:
     root = _project_root(Path.cwd())
     cfg = Config.load(root)
@@ -158,6 +193,8 @@ def cmd_index_rebuild(args: argparse.Namespace) -> int:
         idx = ensure_indices(es, prefix)
         files_index = idx["files_index"]
         versions_index = idx["versions_index"]
+        blobs_index = idx["blobs_index"]
+        chunks_index = idx["chunks_index"]
         if args.clean:
             # Delete and recreate indices with current schema
             print(f"🗑️  [rebuild --clean] Deleting indices...")
@@ -171,12 +208,25 @@ def cmd_index_rebuild(args: argparse.Namespace) -> int:
                 print(f"   ✅ Deleted {versions_index}")
             except Exception as e:
                 print(f"   ⚠️  Could not delete {versions_index}: {e}")
+            try:
+                es.delete_index(blobs_index)
+                print(f"   ✅ Deleted {blobs_index}")
+            except Exception as e:
+                print(f"   ⚠️  Could not delete {blobs_index}: {e}")
+            try:
+                es.delete_index(chunks_index)
+                print(f"   ✅ Deleted {chunks_index}")
+            except Exception as e:
+                print(f"   ⚠️  Could not delete {chunks_index}: {e}")
+            from .manifest import clear_manifest
+            clear_manifest(root)
+            clear_checkpoint(root)
             print(f"🔄 [rebuild --clean] Recreating indices...")
             idx = ensure_indices(es, prefix)
             print(f"   ✅ Indices recreated")
         # Reindex content (with verbose output to see binary files)
         print(f"📂 [rebuild] Scanning and indexing files...")
-        res = index_project(root, cfg, verbose=True)
+        res = index_project(root, cfg, verbose=True, checkpoint=True)
         print(json.dumps({"indices": idx, "result": res}, indent=2))
     except (URLError, HTTPError):
         print(f"Error: could not reach Elasticsearch at {cfg.elasticsearch.host}. Is it running?", file=sys.stderr)
@@ -253,6 +303,8 @@ def cmd_search(args: argparse.Namespace) -> int:
             )
             if not args.json and res.get("total_hits", 0) > 0:
                 print("[rewindex] No results with language filter; showing all languages.")
+        if not args.json and res.get("truncated"):
+            print("[rewindex] Too many distinct matching versions; some older ones were not searched.", file=sys.stderr)
         # Notify UI server about this query (best-effort)
         try:
             payload = {
@@ -431,10 +483,8 @@ def cmd_show(args: argparse.Namespace) -> int:
         es = ESClient(cfg.elasticsearch.host)
         idx = ensure_indices(es, cfg.resolved_index_prefix())
         if args.version:
-            # fetch from versions index by hash
-            doc = es.get_doc(idx["versions_index"], args.version)
-            src = (doc or {}).get("_source", {})
-            print(src.get("content", ""))
+            # fetch the content blob by hash
+            print(VersionStore(es, idx["versions_index"]).content(args.version) or "")
         else:
             # fetch current version from files index by path id
             doc_id = f"{cfg.project.id}:{args.path}"
@@ -454,10 +504,9 @@ def cmd_diff(args: argparse.Namespace) -> int:
     try:
         es = ESClient(cfg.elasticsearch.host)
         idx = ensure_indices(es, cfg.resolved_index_prefix())
-        d1 = es.get_doc(idx["versions_index"], args.hash1)
-        d2 = es.get_doc(idx["versions_index"], args.hash2)
-        s1 = ((d1 or {}).get("_source", {}) or {}).get("content", "").splitlines()
-        s2 = ((d2 or {}).get("_source", {}) or {}).get("content", "").splitlines()
+        store = VersionStore(es, idx["versions_index"])
+        s1 = (store.content(args.hash1) or "").splitlines()
+        s2 = (store.content(args.hash2) or "").splitlines()
         for line in difflib.unified_diff(s1, s2, fromfile=args.hash1, tofile=args.hash2, lineterm=""):
             print(line)
         return 0
@@ -502,7 +551,7 @@ def cmd_view(args: argparse.Namespace) -> int:
             res = es.search(idx["versions_index"], body)
             hits = res.get("hits", {}).get("hits", [])
             if hits:
-                src = hits[0].get("_source", {})
+                src = VersionStore(es, idx["versions_index"]).fill([hits[0].get("_source", {})])[0]
         else:
             # Current: fetch from files index
             doc_id = f"{cfg.project.id}:{args.path}"
@@ -538,7 +587,7 @@ def cmd_view(args: argparse.Namespace) -> int:
                     res = es.search(idx["versions_index"], body)
                     hits = res.get("hits", {}).get("hits", [])
                     if hits:
-                        src = hits[0].get("_source", {})
+                        src = VersionStore(es, idx["versions_index"]).fill([hits[0].get("_source", {})])[0]
                 else:
                     doc_id = f"{cfg.project.id}:{matched_path}"
                     doc = es.get_doc(idx["files_index"], doc_id)
@@ -919,7 +968,7 @@ def cmd_restore(args: argparse.Namespace) -> int:
             res = es.search(idx["versions_index"], body)
             hits = res.get("hits", {}).get("hits", [])
             if hits:
-                src = hits[0].get("_source", {})
+                src = VersionStore(es, idx["versions_index"]).fill([hits[0].get("_source", {})])[0]
         else:
             # Current: fetch from files index
             doc_id = f"{cfg.project.id}:{args.path}"
@@ -953,7 +1002,7 @@ def cmd_restore(args: argparse.Namespace) -> int:
                     res = es.search(idx["versions_index"], body)
                     hits = res.get("hits", {}).get("hits", [])
                     if hits:
-                        src = hits[0].get("_source", {})
+                        src = VersionStore(es, idx["versions_index"]).fill([hits[0].get("_source", {})])[0]
                 else:
                     doc_id = f"{cfg.project.id}:{matched_path}"
                     doc = es.get_doc(idx["files_index"], doc_id)
@@ -1023,6 +1072,7 @@ def build_parser() -> argparse.ArgumentParser:
 
     sp_start = sub_index.add_parser("start", help="Start indexing")
     sp_start.add_argument("--watch", action="store_true", help="Run simple polling watcher")
+    sp_start.add_argument("--resume", action="store_true", help="Continue an interrupted index run from its checkpoint")
     sp_start.set_defaults(func=cmd_index_start)
 
     sp_rebuild = sub_index.add_parser("rebuild", help="Rebuild index from scratch")
@@ -1032,6 +1082,14 @@ def build_parser() -> argparse.ArgumentParser:
     sp_status = sub_index.add_parser("status", help="Show indexing status")
     sp_status.set_defaults(func=cmd_index_status)
 
+    sp_previews = sub_index.add_parser("previews", help="Generate missing image previews")
+    sp_previews.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    sp_previews.set_defaults(func=cmd_index_previews)
+
+    sp_compact = sub_index.add_parser("compact", help="Thin old versions and reclaim space per the versioning settings")
+    sp_compact.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    sp_compact.set_defaults(func=cmd_index_compact)
+
     # purge-ignored (cleanup utility)
     sp_purge = sub.add_parser("purge-ignored", help="Remove indexed files matching current ignore patterns")
     sp_purge.add_argument("--dry-run", action="store_true", help="Show what would be deleted without deleting")
@@ -1126,6 +1184,10 @@ def build_parser() -> argparse.ArgumentParser:
 
 
 def main(argv: list[str] | None = None) -> int:
+    # Lets indexing's process-pool workers start from a frozen (PyInstaller) binary
+    import multiprocessing
+    multiprocessing.freeze_support()
+
     argv = argv if argv is not None else sys.argv[1:]
 
     # Search shorthand: if first arg doesn't match a subcommand, assume it's a search query
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class CoalescingQueue:
+    """Debounces events per key and hands them to a worker pool in batches.
+
+    ``push`` records the latest value for a key and (re)starts its debounce
+    timer, so a burst of events for one path produces a single call ``debounce_s``
+    after the last of them (trailing edge). A key that keeps changing still
+    fires once ``max_delay_s`` has passed since its first pending event.
+
+    Due keys are passed to ``handler`` as lists of ``(key, value)`` of at most
+    ``batch_size`` items, on ``workers`` threads. A key is never handled by two
+    batches at once: events arriving while it's in flight are held until that
+    batch finishes. ``push`` only takes a lock, so callers (the watchdog
+    observer thread) never wait on the handler.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Tuple[Hashable, Any]]], None],
+        debounce_s: float,
+        batch_size: int = 50,
+        workers: int = 2,
+        max_delay_s: Optional[float] = None,
+    ) -> None:
+        self.handler = handler
+        self.debounce_s = max(0.0, debounce_s)
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_delay_s = max_delay_s if max_delay_s is not None else max(5.0, 10 * self.debounce_s)
+
+        self._cond = threading.Condition()
+        self._values: Dict[Hashable, Any] = {}
+        self._deadline: Dict[Hashable, float] = {}
+        self._first_seen: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = 0
+        self._inflight: Set[Hashable] = set()
+        # Due entries for keys that were in flight; requeued when their batch finishes
+        self._parked: Dict[Hashable, Tuple[float, int, Hashable]] = {}
+        self._inflight_batches = 0
+        self._closed = False
+        self.stats = {"events": 0, "coalesced": 0, "handled": 0, "batches": 0, "errors": 0}
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rewindex-events")
+        self._thread = threading.Thread(target=self._run, name="rewindex-coalesce", daemon=True)
+        self._thread.start()
+
+    def push(self, key: Hashable, value: Any, merge: Optional[Callable[[Any, Any], Any]] = None) -> None:
+        """Queue ``value`` for ``key``, replacing (or ``merge``-ing with) a pending one."""
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                return
+            self.stats["events"] += 1
+            if key in self._values:
+                self.stats["coalesced"] += 1
+                if merge is not None:
+                    value = merge(self._values[key], value)
+            else:
+                self._first_seen[key] = now
+            self._values[key] = value
+            deadline = min(now + self.debounce_s, self._first_seen[key] + self.max_delay_s)
+            self._deadline[key] = deadline
+            self._seq += 1
+            heapq.heappush(self._heap, (deadline, self._seq, key))
+            self._cond.notify()
+
+    def pending(self) -> int:
+        """Events waiting for their debounce window or a worker."""
+        with self._cond:
+            return len(self._values) + len(self._inflight)
+
+    def flush(self) -> None:
+        """Make everything pending due now."""
+        with self._cond:
+            now = time.monotonic()
+            for key in self._values:
+                self._deadline[key] = now
+                self._seq += 1
+                heapq.heappush(self._heap, (now, self._seq, key))
+            self._cond.notify()
+
+    def close(self, wait: bool = True, timeout: Optional[float] = None) -> None:
+        """Stop accepting events; by default handle what's pending first."""
+        if wait:
+            self.flush()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._cond:
+                while self._values or self._inflight_batches:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+        with self._cond:
+            self._closed = True
+            self._values.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=1.0)
+        self._pool.shutdown(wait=wait)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    due = self._take_due(time.monotonic())
+                    if due:
+                        break
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(None if wait is None else max(0.0, wait))
+                for i in range(0, len(due), self.batch_size):
+                    self._inflight_batches += 1
+                    self._pool.submit(self._handle, due[i:i + self.batch_size])
+
+    def _take_due(self, now: float) -> List[Tuple[Hashable, Any]]:
+        due: List[Tuple[Hashable, Any]] = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            key = entry[2]
+            if self._deadline.get(key) != entry[0]:
+                continue  # superseded by a later push
+            if key in self._inflight:
+                self._parked[key] = entry
+                continue
+            due.append((key, self._values.pop(key)))
+            del self._deadline[key]
+            del self._first_seen[key]
+            self._inflight.add(key)
+        return due
+
+    def _handle(self, batch: List[Tuple[Hashable, Any]]) -> None:
+        try:
+            self.handler(batch)
+        except Exception as e:
+            print(f"[rewindex] ERROR handling {len(batch)} queued events: {e}")
+            import traceback
+            traceback.print_exc()
+            with self._cond:
+                self.stats["errors"] += 1
+        finally:
+            with self._cond:
+                for key, _ in batch:
+                    self._inflight.discard(key)
+                    parked = self._parked.pop(key, None)
+                    if parked is not None:
+                        heapq.heappush(self._heap, parked)
+                self._inflight_batches -= 1
+                self.stats["handled"] += len(batch)
+                self.stats["batches"] += 1
+                self._cond.notify_all()
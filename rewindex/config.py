@@ -14,6 +14,7 @@ DEFAULT_IGNORE_PATTERNS = [
     "node_modules/**",
     "venv/**",
     ".git/**",
+    ".rewindex/**",
     "*.pyc",
     "__pycache__/**",
     "dist/**",
@@ -65,9 +66,8 @@ def parse_gitignore(gitignore_path: Path) -> List[str]:
     - Comments (lines starting with #)
     - Blank lines
     - Directory patterns (ending with /)
+    - Negation patterns (starting with !), kept with their "!" prefix
     - Converts to glob-style patterns compatible with our matcher
-
-    Note: Negation patterns (starting with !) are currently ignored.
     """
     patterns = []
 
@@ -87,9 +87,14 @@ def parse_gitignore(gitignore_path: Path) -> List[str]:
         if not line or line.startswith('#'):
             continue
 
-        # Skip negation patterns (would require complex logic to handle properly)
+        # Negations re-include what earlier patterns excluded; convert the
+        # pattern itself the same way and put the "!" back on each result
+        negate = ''
         if line.startswith('!'):
-            continue
+            negate = '!'
+            line = line[1:]
+            if not line:
+                continue
 
         # Convert gitignore patterns to our glob format
         pattern = line
@@ -99,13 +104,13 @@ def parse_gitignore(gitignore_path: Path) -> List[str]:
             pattern = pattern.rstrip('/') + '/**'
         # If pattern doesn't contain /, it matches at any level
         elif '/' not in pattern:
-            patterns.append(pattern)  # Match filename anywhere
+            patterns.append(negate + pattern)  # Match filename anywhere
             pattern = '**/' + pattern  # Also match as path pattern
         # If pattern starts with /, it's from root (our root is project root)
         elif pattern.startswith('/'):
             pattern = pattern.lstrip('/')
 
-        patterns.append(pattern)
+        patterns.append(negate + pattern)
 
     return patterns
 
@@ -127,6 +132,7 @@ class IndexingWatch:
     enabled: bool = True
     debounce_ms: int = 500
     batch_size: int = 50
+    workers: int = 2
 
 
 @dataclass
@@ -137,19 +143,55 @@ class IndexingExtract:
     todos: bool = True
 
 
+@dataclass
+class IndexingPipeline:
+    read_workers: int = 0  # Threads reading files and indexing binaries (0 = parallel_workers)
+    cpu_workers: int = 0  # Processes hashing/extracting text (0 = CPU count, max 8; 1 = no process pool)
+    queue_size: int = 256  # Max files buffered between pipeline stages
+
+
+@dataclass
+class IndexingWrites:
+    max_in_flight: int = 4  # Most concurrent _bulk requests while indexing; lowered automatically when ES pushes back
+    min_in_flight: int = 1
+    target_latency_ms: int = 2000  # Bulk round trips slower than this count as ES struggling
+    max_retries: int = 5  # Re-sends of rejected (429/503) items, with jittered backoff
+    backoff_base_ms: int = 200
+    backoff_max_ms: int = 10000
+
+
+@dataclass
+class IndexingPriority:
+    enabled: bool = True  # On cold runs, index likely-wanted files first (recent, under the cwd, git repos)
+    recent_hours: int = 24  # Files modified this recently go first
+    max_recent: int = 5000  # At most this many of the newest files get the head start
+
+
 @dataclass
 class IndexingConfig:
     # Empty include_patterns = index all files (rely on exclude patterns + binary detection)
     include_patterns: List[str] = field(default_factory=list)
     exclude_patterns: List[str] = field(default_factory=lambda: [*DEFAULT_IGNORE_PATTERNS])
     max_file_size_mb: int = 10
+    chunk_min_kb: int = 256  # Text files at least this large are also searched as line-window chunks (0 = off)
+    chunk_lines: int = 200  # Lines per chunk
+    chunk_max_kb: int = 32  # Chunks are cut short (a very long line split) past this many KB of UTF-8
     max_index_size_gb: int = 5
     index_binaries: bool = False  # Index binary files (metadata only, no content)
+    binary_fingerprint: str = "full"  # "full" sha256, or "sparse": size + head/middle/tail blocks for big binaries
+    sparse_fingerprint_min_mb: int = 8  # Binaries at least this large use the sparse fingerprint (when enabled)
     binary_preview_max_kb: int = 50  # Max image size for base64 preview generation (not enforced for thumbnails)
+    thumbnail_workers: int = 2  # Background threads rendering image previews
+    thumbnail_queue_size: int = 10000  # Images waiting for a preview; overflow is left for `rewindex index previews`
     watch: IndexingWatch = field(default_factory=IndexingWatch)
     extract: IndexingExtract = field(default_factory=IndexingExtract)
+    pipeline: IndexingPipeline = field(default_factory=IndexingPipeline)
+    writes: IndexingWrites = field(default_factory=IndexingWrites)
+    priority: IndexingPriority = field(default_factory=IndexingPriority)
     parallel_workers: int = 4  # Parallel workers for faster indexing (images, metadata extraction)
     use_cache: bool = True
+    checkpoint_interval_s: int = 30  # How often a checkpointed full index saves its progress (index start --resume)
+    nested_gitignore: bool = True  # Honor .gitignore files in subdirectories (root ones are always merged)
 
 
 @dataclass
@@ -173,6 +215,15 @@ class VersioningConfig:
     keep_all_versions: bool = True
     max_versions_per_file: int = 50
     cleanup_after_days: int = 90
+    storage: str = "full"  # "full" or "delta" (keyframes + line diffs)
+    keyframe_interval: int = 20
+    # Thinning when keep_all_versions is off: every version for keep_all_hours,
+    # then the newest per hour up to hourly_days, then per day until cleanup_after_days
+    keep_all_hours: int = 24
+    hourly_days: int = 7
+    compact_interval_minutes: int = 60  # Background compaction while serving (0 = off)
+    # Watcher: changes within this many seconds of a file's last version replace it (0 = every change)
+    coalesce_window_s: float = 30.0
 
 
 @dataclass
@@ -236,7 +287,8 @@ class Config:
             # Merge gitignore patterns with existing exclude patterns (avoid duplicates)
             existing = set(cfg.indexing.exclude_patterns)
             for pattern in gitignore_patterns:
-                if pattern not in existing:
+                # Negations are order-sensitive, so they're never deduplicated
+                if pattern.startswith('!') or pattern not in existing:
                     cfg.indexing.exclude_patterns.append(pattern)
 
         # Load .rewindexignore patterns (same format as .gitignore)
@@ -244,7 +296,8 @@ class Config:
         if rewindexignore_patterns:
             existing = set(cfg.indexing.exclude_patterns)
             for pattern in rewindexignore_patterns:
-                if pattern not in existing:
+                # Negations are order-sensitive, so they're never deduplicated
+                if pattern.startswith('!') or pattern not in existing:
                     cfg.indexing.exclude_patterns.append(pattern)
             #print(f"[config] Loaded {len(rewindexignore_patterns)} patterns from .rewindexignore")
 
@@ -291,7 +344,7 @@ def _apply_dict(obj: Any, data: Dict[str, Any]) -> None:
             continue
         cur = getattr(obj, k)
         if isinstance(cur, (ProjectConfig, ElasticConfig, IndexingConfig, IndexingWatch,
-                            IndexingExtract, SearchConfig, SearchDefaults, VersioningConfig,
+                            IndexingExtract, IndexingPipeline, IndexingPriority, IndexingWrites, SearchConfig, SearchDefaults, VersioningConfig,
                             MonitoringConfig)):
             if isinstance(v, dict):
                 _apply_dict(cur, v)
@@ -2,12 +2,16 @@ from __future__ import annotations
 
 import json
 import ssl
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from urllib.error import HTTPError, URLError
 from urllib.parse import quote, urljoin, urlparse
 from urllib.request import Request, urlopen
 
+from .backpressure import jittered_backoff
+
 
 def _normalize_base(host: str) -> str:
     if host.startswith("http://") or host.startswith("https://"):
@@ -20,7 +24,22 @@ def _normalize_base(host: str) -> str:
     return base
 
 
+# Rejected before doing anything (queue full, node busy), so resending is safe
+RETRY_STATUSES = {429, 503}
+REQUEST_RETRIES = 3
+
+
 def _json_request(method: str, url: str, body: Optional[dict] = None, timeout: int = 30) -> Dict[str, Any]:
+    """Send a JSON request; a rejection (429/503) is retried with jittered backoff first."""
+    for attempt in range(1, REQUEST_RETRIES + 1):
+        res = _json_request_once(method, url, body, timeout)
+        if res.get("error") not in RETRY_STATUSES:
+            return res
+        time.sleep(jittered_backoff(attempt))
+    return _json_request_once(method, url, body, timeout)
+
+
+def _json_request_once(method: str, url: str, body: Optional[dict], timeout: int) -> Dict[str, Any]:
     data = None
     if body is not None:
         data = json.dumps(body).encode("utf-8")
@@ -50,6 +69,16 @@ def _json_request(method: str, url: str, body: Optional[dict] = None, timeout: i
         raise
 
 
+def index_missing(res: Any) -> bool:
+    """True if a response (or a bulk item result) reports a missing index."""
+    if not isinstance(res, dict):
+        return False
+    err = res.get("error")
+    if err == 404 and isinstance(res.get("body"), dict):
+        err = res["body"].get("error")
+    return isinstance(err, dict) and err.get("type") == "index_not_found_exception"
+
+
 @dataclass
 class ESInfo:
     base: str
@@ -62,6 +91,11 @@ class ESClient:
     def _url(self, path: str) -> str:
         return urljoin(self.base, path)
 
+    def _checked(self, index: str, res: Dict[str, Any]) -> Dict[str, Any]:
+        if index_missing(res):
+            forget_indices(self, index)
+        return res
+
     # Index management
     def index_exists(self, index: str) -> bool:
         url = self._url(index)
@@ -77,21 +111,42 @@ class ESClient:
     def create_index(self, index: str, body: dict) -> dict:
         return _json_request("PUT", self._url(index), body)
 
+    def put_mapping(self, index: str, body: dict) -> dict:
+        return self._checked(index, _json_request("PUT", self._url(f"{index}/_mapping"), body))
+
+    def analyzers(self, index: str) -> set:
+        """Names of the custom analyzers defined in ``index``'s settings."""
+        res = self._checked(index, _json_request("GET", self._url(f"{index}/_settings")))
+        names: set = set()
+        for v in res.values():
+            if isinstance(v, dict):
+                analysis = ((v.get("settings") or {}).get("index") or {}).get("analysis") or {}
+                names.update(analysis.get("analyzer") or {})
+        return names
+
+    def has_field(self, index: str, field: str) -> bool:
+        """Whether ``field`` (e.g. a subfield newer than the index) is mapped in ``index``."""
+        res = self._checked(index, _json_request("GET", self._url(f"{index}/_mapping/field/{field}")))
+        return any((v.get("mappings") or {}).get(field) for v in res.values() if isinstance(v, dict))
+
     def delete_index(self, index: str) -> dict:
+        forget_indices(self, index)
         return _json_request("DELETE", self._url(index))
 
     def refresh(self, index: str) -> dict:
-        return _json_request("POST", self._url(f"{index}/_refresh"))
+        return self._checked(index, _json_request("POST", self._url(f"{index}/_refresh")))
 
     def count(self, index: str) -> int:
-        res = _json_request("GET", self._url(f"{index}/_count"))
+        res = self._checked(index, _json_request("GET", self._url(f"{index}/_count")))
         return int(res.get("count", 0))
 
     # Documents
-    def get_doc(self, index: str, doc_id: str) -> Optional[dict]:
+    def get_doc(self, index: str, doc_id: str, source_includes: Optional[List[str]] = None) -> Optional[dict]:
         url = self._url(f"{index}/_doc/{quote(doc_id, safe='')}")
+        if source_includes:
+            url += "?_source_includes=" + ",".join(quote(f, safe='') for f in source_includes)
         try:
-            res = _json_request("GET", url)
+            res = self._checked(index, _json_request("GET", url))
             if res.get("found"):
                 return res
             return None
@@ -104,31 +159,232 @@ class ESClient:
         url = self._url(f"{index}/_doc/{quote(doc_id, safe='')}")
         return _json_request("PUT", url, body)
 
+    def update_doc(self, index: str, doc_id: str, partial: dict, retry_on_conflict: int = 3) -> Optional[dict]:
+        """Merge ``partial`` into an existing doc server-side; None if the doc doesn't exist."""
+        url = self._url(f"{index}/_update/{quote(doc_id, safe='')}?retry_on_conflict={retry_on_conflict}")
+        res = self._checked(index, _json_request("POST", url, {"doc": partial}))
+        if res.get("error") == 404:
+            return None
+        return res
+
     def post_doc(self, index: str, body: dict) -> dict:
         url = self._url(f"{index}/_doc")
         return _json_request("POST", url, body)
 
+    def mget(self, index: str, ids: List[str], source_includes: Optional[List[str]] = None) -> List[dict]:
+        """Fetch many docs in one request; ``source_includes`` limits the returned fields."""
+        path = f"{index}/_mget"
+        if source_includes:
+            path += "?_source_includes=" + ",".join(quote(f, safe='') for f in source_includes)
+        res = self._checked(index, _json_request("POST", self._url(path), {"ids": list(ids)}))
+        return res.get("docs", [])
+
+    def update_by_query(self, index: str, body: dict, refresh: bool = False, conflicts: str = "proceed") -> dict:
+        """Apply ``body["script"]`` to every doc matching ``body["query"]``."""
+        path = f"{index}/_update_by_query?conflicts={conflicts}"
+        if refresh:
+            path += "&refresh=true"
+        return self._checked(index, _json_request("POST", self._url(path), body, timeout=300))
+
+    def delete_by_query(self, index: str, body: dict, refresh: bool = False, conflicts: str = "proceed") -> dict:
+        path = f"{index}/_delete_by_query?conflicts={conflicts}"
+        if refresh:
+            path += "&refresh=true"
+        return self._checked(index, _json_request("POST", self._url(path), body, timeout=300))
+
+    def store_size(self, index: str) -> int:
+        """Bytes ``index`` takes on disk (all copies); 0 if it doesn't exist."""
+        res = self._checked(index, _json_request("GET", self._url(f"{index}/_stats/store")))
+        return int((((res.get("_all") or {}).get("total") or {}).get("store") or {}).get("size_in_bytes", 0))
+
+    def expunge_deletes(self, index: str) -> dict:
+        """Merge away segments' deleted docs so their space is actually freed."""
+        path = f"{index}/_forcemerge?only_expunge_deletes=true"
+        return self._checked(index, _json_request("POST", self._url(path), timeout=600))
+
     def search(self, index: str, body: dict) -> dict:
-        return _json_request("POST", self._url(f"{index}/_search"), body)
+        return self._checked(index, _json_request("POST", self._url(f"{index}/_search"), body))
+
+    # Point-in-time iteration
+    def open_pit(self, index: str, keep_alive: str = "2m") -> Optional[str]:
+        """Open a point in time on ``index``; None if the cluster doesn't support it."""
+        res = self._checked(index, _json_request("POST", self._url(f"{index}/_pit?keep_alive={keep_alive}")))
+        return res.get("id")
 
-    # Bulk API (optional)
-    def bulk(self, ndjson: str) -> dict:
-        req = Request(self._url("_bulk"), method="POST", data=ndjson.encode("utf-8"))
+    def close_pit(self, pit_id: str) -> None:
+        try:
+            _json_request("DELETE", self._url("_pit"), {"id": pit_id})
+        except (HTTPError, URLError):
+            pass  # expires on its own after keep_alive
+
+    def iter_hits(
+        self,
+        index: str,
+        query: dict,
+        sort: List[dict],
+        source_includes: Optional[List[str]] = None,
+        size: int = 5000,
+        keep_alive: str = "2m",
+    ) -> Iterator[dict]:
+        """Yield every hit matching ``query``, page by page, without the 10k window limit.
+
+        Pages through a point in time with ``search_after`` (sorted by
+        ``_shard_doc``, the cheapest order). Clusters without PIT support
+        fall back to plain ``search_after`` on ``sort``, which must be unique
+        per doc.
+        """
+        pit_id = self.open_pit(index, keep_alive)
+        body: Dict[str, Any] = {"query": query, "size": size, "track_total_hits": False}
+        if source_includes is not None:
+            body["_source"] = source_includes
+        if pit_id:
+            body["sort"] = [{"_shard_doc": "asc"}]
+        else:
+            body["sort"] = sort
+        try:
+            while True:
+                if pit_id:
+                    body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+                    res = _json_request("POST", self._url("_search"), body)
+                else:
+                    res = self.search(index, body)
+                if res.get("error"):
+                    raise RuntimeError(f"search on {index} failed: {res.get('body') or res.get('error')}")
+                hits = res.get("hits", {}).get("hits", [])
+                yield from hits
+                if len(hits) < size:
+                    return
+                pit_id = res.get("pit_id") or pit_id
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            if pit_id:
+                self.close_pit(pit_id)
+
+    # Bulk API (see bulk.BulkWriter for buffering/retries)
+    def bulk(self, ndjson: str, refresh: Optional[str] = None) -> dict:
+        path = "_bulk" if not refresh else f"_bulk?refresh={refresh}"
+        req = Request(self._url(path), method="POST", data=ndjson.encode("utf-8"))
         req.add_header("Content-Type", "application/x-ndjson")
         with urlopen(req, timeout=60) as resp:
             raw = resp.read()
             return json.loads(raw.decode("utf-8"))
 
 
+def bulk_update(es: ESClient, index: str, updates, refresh: Optional[str] = None) -> dict:
+    """Send ``(doc_id, partial)`` pairs as one _bulk request of partial updates.
+
+    For streams of updates use :class:`~rewindex.bulk.BulkWriter`, which
+    buffers, splits and retries; this is for a known, small batch.
+    """
+    lines = []
+    for doc_id, partial in updates:
+        lines.append(json.dumps({"update": {"_index": index, "_id": doc_id}}))
+        lines.append(json.dumps({"doc": partial}))
+    if not lines:
+        return {"errors": False, "items": []}
+    return es.bulk("\n".join(lines) + "\n", refresh=refresh)
+
+
+def _without_analyzers(mapping: dict, analyzers: set) -> dict:
+    """``mapping`` minus the fields (and subfields) that use any of ``analyzers``."""
+    if not analyzers:
+        return mapping
+    out = {}
+    for key, value in mapping.items():
+        if key in ("properties", "fields") and isinstance(value, dict):
+            value = {
+                name: _without_analyzers(field, analyzers)
+                for name, field in value.items()
+                if not ({field.get("analyzer"), field.get("search_analyzer")} & analyzers)
+            }
+        out[key] = value
+    return out
+
+
 def ensure_indices(es: ESClient, index_prefix: str) -> dict:
-    from .es_schema import FILES_INDEX_BODY, VERSIONS_INDEX_BODY
+    from .es_schema import BLOBS_INDEX_BODY, CHUNKS_INDEX_BODY, FILES_INDEX_BODY, VERSIONS_INDEX_BODY
 
     files_index = f"{index_prefix}_files"
     versions_index = f"{index_prefix}_versions"
+    blobs_index = f"{index_prefix}_blobs"
+    chunks_index = f"{index_prefix}_chunks"
     created = {}
-    if not es.index_exists(files_index):
-        created[files_index] = es.create_index(files_index, FILES_INDEX_BODY)
-    if not es.index_exists(versions_index):
-        created[versions_index] = es.create_index(versions_index, VERSIONS_INDEX_BODY)
-    return {"files_index": files_index, "versions_index": versions_index, "created": created}
+    for index, body in (
+        (files_index, FILES_INDEX_BODY),
+        (versions_index, VERSIONS_INDEX_BODY),
+        (blobs_index, BLOBS_INDEX_BODY),
+        (chunks_index, CHUNKS_INDEX_BODY),
+    ):
+        if not es.index_exists(index):
+            created[index] = es.create_index(index, body)
+        else:
+            # Fields added since the index was created, and content.keyword's
+            # ignore_above; adding fields is always allowed, unless they need
+            # analyzers the index's settings predate
+            try:
+                defined = set(body["settings"]["analysis"]["analyzer"])
+                missing = defined - es.analyzers(index)
+                res = es.put_mapping(index, _without_analyzers(body["mappings"], missing))
+                if res.get("error"):
+                    err = res.get("body", {}).get("error") if isinstance(res.get("body"), dict) else None
+                    reason = err.get("reason") if isinstance(err, dict) else err
+                    print(f"[rewindex] WARNING: could not update the mapping of {index}: {reason or res['error']}")
+            except (HTTPError, URLError) as e:
+                print(f"[rewindex] WARNING: could not update the mapping of {index}: {e}")
+    with _CACHE_LOCK:
+        _RESOLVED[(es.base, index_prefix)] = (files_index, versions_index, blobs_index, chunks_index)
+    return {
+        "files_index": files_index,
+        "versions_index": versions_index,
+        "blobs_index": blobs_index,
+        "chunks_index": chunks_index,
+        "created": created,
+    }
+
+
+# Process-wide clients and resolved index names. The watcher, indexer and API
+# server all go through these, so steady-state requests skip the HEAD checks.
+_CACHE_LOCK = threading.Lock()
+_CLIENTS: Dict[str, ESClient] = {}
+_RESOLVED: Dict[Tuple[str, str], Tuple[str, str, str, str]] = {}
+
+
+def get_client(host: str) -> ESClient:
+    """Shared client for ``host`` (ESClient holds no connection state, so it's thread-safe)."""
+    base = _normalize_base(host)
+    with _CACHE_LOCK:
+        es = _CLIENTS.get(base)
+        if es is None:
+            es = _CLIENTS[base] = ESClient(host)
+        return es
+
+
+def resolve_indices(es: ESClient, index_prefix: str) -> dict:
+    """Like :func:`ensure_indices`, but only checks Elasticsearch the first time.
+
+    The result is cached until a request reports one of the indices missing
+    (or it is deleted through :meth:`ESClient.delete_index`).
+    """
+    with _CACHE_LOCK:
+        cached = _RESOLVED.get((es.base, index_prefix))
+    if cached is not None:
+        return {
+            "files_index": cached[0],
+            "versions_index": cached[1],
+            "blobs_index": cached[2],
+            "chunks_index": cached[3],
+            "created": {},
+        }
+    return ensure_indices(es, index_prefix)
+
+
+def forget_indices(es: ESClient, index: Optional[str] = None) -> None:
+    """Drop cached resolutions involving ``index`` (all of ``es``'s if None)."""
+    with _CACHE_LOCK:
+        for key, names in list(_RESOLVED.items()):
+            if key[0] == es.base and (index is None or index in names):
+                del _RESOLVED[key]
+    # Blobs we remember writing may be gone with it
+    from .versions import forget_blobs
+    forget_blobs(index if index is not None and index.endswith("_blobs") else None)
 
@@ -1,3 +1,8 @@
+# Characters kept in content.keyword: at most 4 UTF-8 bytes each, so this
+# stays under Lucene's 32766-byte term limit
+KEYWORD_IGNORE_ABOVE = 8191
+
+
 FILES_INDEX_BODY = {
     "settings": {
         "analysis": {
@@ -17,6 +22,21 @@ FILES_INDEX_BODY = {
                     "tokenizer": "whitespace",
                     "filter": ["lowercase"],
                 },
+                # Every 3 characters, punctuation and whitespace included, so any
+                # substring of 3+ characters is a phrase of consecutive trigrams
+                "code_trigram_analyzer": {
+                    "type": "custom",
+                    "tokenizer": "code_trigram",
+                    "filter": ["lowercase"],
+                },
+            },
+            "tokenizer": {
+                "code_trigram": {
+                    "type": "ngram",
+                    "min_gram": 3,
+                    "max_gram": 3,
+                    "token_chars": [],
+                },
             },
             "filter": {
                 "word_parts": {
@@ -46,12 +66,22 @@ FILES_INDEX_BODY = {
                 "search_analyzer": "code_search_analyzer",
                 "term_vector": "with_positions_offsets",
                 "fields": {
-                    "keyword": {"type": "keyword"},  # No limit for exact phrase matching
+                    # Whole-text term for substring scans. Lucene rejects a doc
+                    # with a term over 32766 bytes, so longer texts (chunked
+                    # large files among them) are left out of it; the trigram
+                    # subfield covers them
+                    "keyword": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
                     "exact": {
                         "type": "text",
                         "analyzer": "exact_phrase_analyzer",
                         "search_analyzer": "exact_phrase_analyzer",
-                    }
+                    },
+                    # Substring search with punctuation (see search._substring_query)
+                    "trigram": {
+                        "type": "text",
+                        "analyzer": "code_trigram_analyzer",
+                        "norms": False,
+                    },
                 },
             },
             "file_path": {"type": "keyword"},
@@ -65,12 +95,16 @@ FILES_INDEX_BODY = {
             "content_hash": {"type": "keyword"},
             "previous_hash": {"type": "keyword"},
             "is_current": {"type": "boolean"},
+            "chunked": {"type": "boolean"},  # Large file: searched through the chunks index
             "imports": {"type": "keyword"},
             "exports": {"type": "keyword"},
             "defined_functions": {"type": "keyword"},
             "defined_classes": {"type": "keyword"},
             "todos": {"type": "text"},
             "has_tests": {"type": "boolean"},
+            "is_binary": {"type": "boolean"},
+            "binary_type": {"type": "keyword"},
+            "preview_pending": {"type": "boolean"},
             "git_commit": {"type": "keyword"},
             "git_branch": {"type": "keyword"},
             "git_author": {"type": "keyword"},
@@ -96,7 +130,8 @@ VERSIONS_INDEX_BODY = {
                 "search_analyzer": "code_search_analyzer",
                 "term_vector": "with_positions_offsets",
                 "fields": {
-                    "keyword": {"type": "keyword"},  # No limit for exact phrase matching
+                    # Bounded like the files index's; longer texts aren't substring-scanned
+                    "keyword": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
                     "exact": {
                         "type": "text",
                         "analyzer": "exact_phrase_analyzer",
@@ -106,7 +141,77 @@ VERSIONS_INDEX_BODY = {
             },
             "language": {"type": "keyword"},
             "project_id": {"type": "keyword"},
+            "size_bytes": {"type": "long"},
+            "line_count": {"type": "integer"},
+            "is_binary": {"type": "boolean"},
         }
     },
 }
 
+
+# Version text, stored once per content hash (the doc _id) and shared by
+# every path and version that has that content. Version docs written before
+# this index existed still carry their own content.
+BLOBS_INDEX_BODY = {
+    "settings": FILES_INDEX_BODY["settings"],
+    "mappings": {
+        "properties": {
+            "content_hash": {"type": "keyword"},
+            "created_at": {"type": "date"},
+            "size_bytes": {"type": "long"},
+            "content": VERSIONS_INDEX_BODY["mappings"]["properties"]["content"],
+            # Delta storage (versioning.storage = "delta"): keyframes carry
+            # content, deltas replay `delta` onto the blob at base_hash
+            "storage": {"type": "keyword"},
+            "base_hash": {"type": "keyword"},
+            "delta": {"type": "object", "enabled": False},
+            "added_lines": {
+                "type": "text",
+                "analyzer": "code_index_analyzer",
+                "search_analyzer": "code_search_analyzer",
+                "term_vector": "with_positions_offsets",
+                "fields": {
+                    "exact": {
+                        "type": "text",
+                        "analyzer": "exact_phrase_analyzer",
+                        "search_analyzer": "exact_phrase_analyzer",
+                    }
+                },
+            },
+        }
+    },
+}
+
+
+
+# Line windows of large text files (see chunks.py). Search matches these
+# instead of the whole file's content, then joins back to the files index on
+# file_id + content_hash, so chunks of older content never match.
+CHUNKS_INDEX_BODY = {
+    "settings": FILES_INDEX_BODY["settings"],
+    "mappings": {
+        "properties": {
+            "file_id": {"type": "keyword"},
+            "file_path": {"type": "keyword"},
+            "file_name": FILES_INDEX_BODY["mappings"]["properties"]["file_name"],
+            "extension": {"type": "keyword"},
+            "language": {"type": "keyword"},
+            "project_id": {"type": "keyword"},
+            "content_hash": {"type": "keyword"},
+            "chunk": {"type": "integer"},
+            "start_line": {"type": "integer"},
+            "end_line": {"type": "integer"},
+            # As in the files index, minus content.keyword: a chunk (up to
+            # chunk_max_kb) as one term can pass Lucene's 32766-byte limit,
+            # which rejects the whole doc
+            "content": {
+                **FILES_INDEX_BODY["mappings"]["properties"]["content"],
+                "fields": {
+                    name: sub
+                    for name, sub in FILES_INDEX_BODY["mappings"]["properties"]["content"]["fields"].items()
+                    if name != "keyword"
+                },
+            },
+        }
+    },
+}
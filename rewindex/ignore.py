@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+
+GITIGNORE_FILENAME = ".gitignore"
+
+_GLOB_CHARS = set("*?[")
+
+
+def _glob_regex(pat: str, star: str, one: str, escapes: bool = False) -> str:
+    """Translate a glob to a regex body (no anchors).
+
+    ``star``/``one`` are the expansions of ``*`` and ``?`` so the same code
+    serves fnmatch-style globs (``.*``) and path-segment globs (``[^/]*``).
+    With ``escapes`` a backslash quotes the next character (gitignore syntax).
+    """
+    out: List[str] = []
+    i, n = 0, len(pat)
+    while i < n:
+        c = pat[i]
+        i += 1
+        if c == "*":
+            while i < n and pat[i] == "*":
+                i += 1
+            out.append(star)
+        elif c == "?":
+            out.append(one)
+        elif c == "\\" and escapes and i < n:
+            out.append(re.escape(pat[i]))
+            i += 1
+        elif c == "[":
+            j = i
+            if j < n and pat[j] == "!":
+                j += 1
+            if j < n and pat[j] == "]":
+                j += 1
+            while j < n and pat[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            body = pat[i:j].replace("\\", "\\\\")
+            i = j + 1
+            if body.startswith("!"):
+                # A negated class must not swallow a separator when '*' doesn't
+                body = "^" + ("/" if one != "." else "") + body[1:]
+            elif body.startswith("^"):
+                body = "\\" + body
+            out.append(f"[{body}]")
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+def _alternation(parts: Sequence[str], prefix: str = "") -> Optional[Pattern[str]]:
+    if not parts:
+        return None
+    return re.compile(prefix + "(?:" + "|".join(f"(?:{p})" for p in parts) + r")\Z", re.S)
+
+
+class _Run:
+    """Consecutive patterns of the same polarity, compiled together.
+
+    Reproduces the historical matcher, where a pattern hit if any of
+    ``PurePath.match``, ``fnmatch`` on the full path or ``fnmatch`` on the
+    basename (also with a leading ``**/`` removed) did. Plain ``*.ext``,
+    bare names and ``dir/**`` patterns are peeled off into string/set checks;
+    everything else goes into three combined regexes.
+    """
+
+    __slots__ = ("negate", "suffixes", "names", "dir_names", "full_re", "name_re", "seg_re")
+
+    def __init__(self, negate: bool, patterns: List[str]) -> None:
+        self.negate = negate
+        suffixes: List[str] = []
+        names = set()
+        dir_names = set()
+        full: List[str] = []
+        name: List[str] = []
+        seg: List[str] = []
+        for pat in patterns:
+            literal = pat[1:] if pat.startswith("*") else None
+            if literal and not (_GLOB_CHARS & set(literal)) and "/" not in literal:
+                suffixes.append(literal)
+                continue
+            bare = pat[3:] if pat.startswith("**/") else pat
+            if bare and "/" not in bare and not (_GLOB_CHARS & set(bare)):
+                names.add(bare)
+                continue
+            if pat.endswith("/**"):
+                head = pat[:-3]
+                if head and "/" not in head and not (_GLOB_CHARS & set(head)):
+                    dir_names.add(head)
+                    continue
+
+            full.append(_glob_regex(pat, ".*", "."))
+            # A literal '/' can never match a basename
+            if "/" not in pat:
+                name.append(_glob_regex(pat, ".*", "."))
+            if bare != pat and "/" not in bare:
+                name.append(_glob_regex(bare, ".*", "."))
+            # PurePath.match: right-anchored, component by component. A
+            # single component is already covered by the basename check.
+            parts = [p for p in pat.split("/") if p and p != "."]
+            if len(parts) > 1 and not pat.startswith("/"):
+                seg.append("/".join(_glob_regex(p, "[^/]*", "[^/]") for p in parts))
+        self.suffixes = tuple(suffixes)
+        self.names = frozenset(names)
+        self.dir_names = frozenset(dir_names)
+        self.full_re = _alternation(full)
+        self.name_re = _alternation(name)
+        self.seg_re = _alternation(seg, prefix="(?:.*/)?")
+
+    def hit(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if self.suffixes and name.endswith(self.suffixes):
+            return True
+        if name in self.names:
+            return True
+        if self.dir_names:
+            first, sep, _rest = rel_path.partition("/")
+            if (sep or is_dir) and first in self.dir_names:
+                return True
+            parent = rel_path.rpartition("/")[0]
+            if parent and parent.rpartition("/")[2] in self.dir_names:
+                return True
+        full = rel_path + "/" if is_dir else rel_path
+        if self.full_re is not None and self.full_re.match(full):
+            return True
+        if self.name_re is not None and self.name_re.match(name):
+            return True
+        if self.seg_re is not None and self.seg_re.match(rel_path):
+            return True
+        return False
+
+
+class PatternSet:
+    """A compiled list of glob patterns (``exclude_patterns``/``include_patterns``).
+
+    Patterns prefixed with ``!`` re-include paths matched by earlier patterns;
+    the last matching pattern wins, as in .gitignore.
+    """
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns = list(patterns)
+        self.runs: List[_Run] = []
+        group: List[str] = []
+        negate = False
+        for raw in self.patterns:
+            if not raw:
+                continue
+            neg = raw.startswith("!")
+            pat = raw[1:] if neg else raw
+            if not pat:
+                continue
+            if neg != negate and group:
+                self.runs.append(_Run(negate, group))
+                group = []
+            negate = neg
+            group.append(pat)
+        if group:
+            self.runs.append(_Run(negate, group))
+
+    def match(self, rel_path: str, is_dir: bool = False) -> Optional[bool]:
+        """True if excluded, False if re-included by a negation, None if nothing matched."""
+        name = rel_path.rpartition("/")[2]
+        for run in reversed(self.runs):
+            if run.hit(rel_path, name, is_dir):
+                return not run.negate
+        return None
+
+    def matches(self, rel_path: str, is_dir: bool = False) -> bool:
+        return bool(self.match(rel_path, is_dir))
+
+
+@lru_cache(maxsize=64)
+def _compile_cached(patterns: Tuple[str, ...]) -> PatternSet:
+    return PatternSet(patterns)
+
+
+def compile_patterns(patterns: Sequence[str]) -> PatternSet:
+    """Compile (and cache) a pattern list."""
+    return _compile_cached(tuple(patterns))
+
+
+class GitignoreRules:
+    """Rules from one .gitignore file, matched against paths relative to its directory."""
+
+    def __init__(self, lines: Sequence[str]) -> None:
+        # (negate, dir_only, regex source) in file order
+        rules: List[Tuple[bool, bool, str]] = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            # Trailing spaces are ignored unless escaped
+            while line.endswith(" ") and not line.endswith("\\ "):
+                line = line[:-1]
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            parts = line.lstrip("/").split("/")
+            body = "" if anchored else "(?:.*/)?"
+            for i, part in enumerate(parts):
+                last = i == len(parts) - 1
+                if part == "**":
+                    body += ".*" if last else "(?:.*/)?"
+                    continue
+                body += _glob_regex(part, "[^/]*", "[^/]", escapes=True)
+                if not last:
+                    body += "/"
+            rules.append((negate, dir_only, body))
+
+        # Group consecutive rules with the same flags into one regex
+        self.runs: List[Tuple[bool, bool, Pattern[str]]] = []
+        start = 0
+        for i in range(1, len(rules) + 1):
+            if i == len(rules) or rules[i][:2] != rules[start][:2]:
+                if i > start:
+                    negate, dir_only, _ = rules[start]
+                    regex = _alternation([r[2] for r in rules[start:i]])
+                    self.runs.append((negate, dir_only, regex))
+                start = i
+
+    @classmethod
+    def from_file(cls, path: Path) -> Optional["GitignoreRules"]:
+        try:
+            text = path.read_text(encoding="utf-8", errors="ignore")
+        except OSError:
+            return None
+        rules = cls(text.splitlines())
+        return rules if rules.runs else None
+
+    def match(self, rel_path: str, is_dir: bool = False) -> Optional[bool]:
+        for negate, dir_only, regex in reversed(self.runs):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negate
+        return None
+
+
+class IgnoreMatcher:
+    """Decides whether a project-relative path is excluded from indexing.
+
+    Combines the compiled ``exclude_patterns`` (built-in defaults plus the
+    root .gitignore/.rewindexignore, see ``Config.load``) with the .gitignore
+    files found in subdirectories. Results for directories are memoized, and
+    anything under an excluded directory is excluded without further
+    matching, so checking a file costs one dict lookup for its directory plus
+    a match on the file itself.
+
+    Negations in a nested .gitignore only re-include paths excluded by
+    .gitignore files below the project root; they can't override the
+    project's own exclude patterns.
+    """
+
+    def __init__(self, patterns: Sequence[str], root: Optional[Path] = None, nested_gitignore: bool = True) -> None:
+        self.patterns = compile_patterns(patterns)
+        self.root = root
+        self.nested_gitignore = nested_gitignore and root is not None
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forget memoized results (e.g. after a .gitignore changed)."""
+        self._dirs: Dict[str, bool] = {"": False}
+        # rel_dir -> ((base_dir, rules), ...) for every nested .gitignore that applies inside it.
+        # The root .gitignore is already part of exclude_patterns.
+        self._chains: Dict[str, Tuple[Tuple[str, GitignoreRules], ...]] = {"": ()}
+
+    def is_excluded(self, rel_path: str, is_dir: bool = False) -> bool:
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        rel_path = rel_path.strip("/")
+        if not rel_path:
+            return False
+        parent = rel_path.rpartition("/")[0]
+        if self._dir_excluded(parent):
+            return True
+        if is_dir:
+            return self._dir_excluded(rel_path)
+        return self._decide(rel_path, parent, False)
+
+    def _dir_excluded(self, rel_dir: str) -> bool:
+        cached = self._dirs.get(rel_dir)
+        if cached is not None:
+            return cached
+        parent = rel_dir.rpartition("/")[0]
+        result = self._dir_excluded(parent) or self._decide(rel_dir, parent, True)
+        self._dirs[rel_dir] = result
+        return result
+
+    def _decide(self, rel_path: str, parent: str, is_dir: bool) -> bool:
+        if self.patterns.match(rel_path, is_dir):
+            return True
+        if not self.nested_gitignore:
+            return False
+        result = None
+        for base, rules in self._chain(parent):
+            r = rules.match(rel_path[len(base) + 1:], is_dir)
+            if r is not None:
+                result = r
+        return bool(result)
+
+    def _chain(self, rel_dir: str) -> Tuple[Tuple[str, GitignoreRules], ...]:
+        chain = self._chains.get(rel_dir)
+        if chain is None:
+            chain = self._chain(rel_dir.rpartition("/")[0])
+            rules = GitignoreRules.from_file(self.root / rel_dir / GITIGNORE_FILENAME)
+            if rules is not None:
+                chain = chain + ((rel_dir, rules),)
+            self._chains[rel_dir] = chain
+        return chain
+
+
+_MATCHERS: Dict[tuple, IgnoreMatcher] = {}
+
+
+def matcher_for(cfg, root: Optional[Path] = None) -> IgnoreMatcher:
+    """Return the shared matcher for ``cfg``'s exclude patterns under ``root``.
+
+    Matchers (and their per-directory memo) are reused across calls as long as
+    the pattern list is unchanged.
+    """
+    nested = cfg.indexing.nested_gitignore
+    key = (str(root) if root is not None else None, tuple(cfg.indexing.exclude_patterns), nested)
+    matcher = _MATCHERS.get(key)
+    if matcher is None:
+        if len(_MATCHERS) >= 16:
+            _MATCHERS.clear()
+        matcher = IgnoreMatcher(cfg.indexing.exclude_patterns, root=root, nested_gitignore=nested)
+        _MATCHERS[key] = matcher
+    return matcher
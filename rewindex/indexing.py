@@ -4,15 +4,24 @@ import hashlib
 import os
 import time
 import threading
-from pathlib import PurePath
-from fnmatch import fnmatch
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional, Callable
+from typing import Dict, Iterator, List, Optional, Callable, Set, Tuple
 
 from .config import Config
 from .extractor import SimpleExtractor
 from .language import detect_language
-from .es import ESClient, ensure_indices
+from .es import ESClient, get_client, resolve_indices
+from .backpressure import AIMDController
+from .bulk import BulkWriter
+from .checkpoint import IndexCheckpoint, walk_key
+from .chunks import drop_chunks, drop_chunks_under, drop_stale_chunks, queue_chunks
+from .manifest import FileManifest
+from .priority import PriorityPlan, ScopeProgress, plan_priorities
+from .thumbnails import ThumbnailCache, ThumbnailQueue, preview_fields
+from .pipeline import IndexPipeline, TextAnalysis, analyze_text, default_cpu_workers
+from .ignore import IgnoreMatcher, compile_patterns, matcher_for, GITIGNORE_FILENAME
+from .coalesce import CoalescingQueue
+from .versions import STORAGE_DELTA, VersionCoalescer, build_version, supersede_version, version_id, write_version
 
 try:
     from watchdog.observers import Observer
@@ -26,31 +35,121 @@ def sha256_hex(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
+HASH_CHUNK_SIZE = 1024 * 1024
+SPARSE_BLOCK_SIZE = 64 * 1024
+
+# One reusable read buffer per thread (reader threads hash concurrently)
+_hash_buffers = threading.local()
+
+
+def sha256_file(path: Path) -> str:
+    """sha256 of a file, streamed through a fixed per-thread buffer."""
+    buf = getattr(_hash_buffers, "buf", None)
+    if buf is None:
+        buf = _hash_buffers.buf = memoryview(bytearray(HASH_CHUNK_SIZE))
+    h = hashlib.sha256()
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(buf[:n])
+    return h.hexdigest()
+
+
+def sparse_fingerprint(path: Path, size: int) -> str:
+    """Cheap stand-in for a full hash: the size plus the first, middle and last blocks.
+
+    Only suitable for large media/archives, where an edit that keeps the size
+    and misses all three blocks is unrealistic.
+    """
+    h = hashlib.sha256(b"rewindex-sparse-v1:%d:" % size)
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - SPARSE_BLOCK_SIZE // 2), max(0, size - SPARSE_BLOCK_SIZE)):
+            f.seek(offset)
+            h.update(f.read(SPARSE_BLOCK_SIZE))
+    return h.hexdigest()
+
+
+def _binary_content_hash(path: Path, size: int, cfg: Config) -> str:
+    if (
+        cfg.indexing.binary_fingerprint == "sparse"
+        and size >= cfg.indexing.sparse_fingerprint_min_mb * 1024 * 1024
+    ):
+        return sparse_fingerprint(path, size)
+    return sha256_file(path)
+
+
+# Only these fields are needed to decide whether a file changed; never pull `content`
+EXISTING_STATE_FIELDS = ["content_hash", "version_count", "previous_hash", "is_current", "deleted", "chunked"]
+MGET_BATCH_SIZE = 500
+
+# (content_hash, version_count, previous_hash, deleted, chunked) of the indexed doc, or None if it isn't indexed
+ExistingState = Optional[tuple]
+
+
+def _state_of(src: dict) -> tuple:
+    deleted = bool(src.get("deleted")) or src.get("is_current") is False
+    return (src.get("content_hash"), src.get("version_count", 1), src.get("previous_hash"), deleted, bool(src.get("chunked")))
+
+
+def _fetch_existing_state(es: ESClient, files_index: str, doc_ids: List[str]) -> Dict[str, ExistingState]:
+    """Batched _mget of just the hash/version fields for ``doc_ids``."""
+    out: Dict[str, ExistingState] = {}
+    for i in range(0, len(doc_ids), MGET_BATCH_SIZE):
+        batch = doc_ids[i:i + MGET_BATCH_SIZE]
+        for d in es.mget(files_index, batch, source_includes=EXISTING_STATE_FIELDS):
+            src = d.get("_source") or {}
+            if d.get("found"):
+                out[d.get("_id")] = _state_of(src)
+        for doc_id in batch:
+            out.setdefault(doc_id, None)
+    return out
+
+
+def _existing_state(
+    es: ESClient,
+    writer: Optional[BulkWriter],
+    files_index: str,
+    doc_id: str,
+    prefetched: Optional[Dict[str, ExistingState]] = None,
+) -> ExistingState:
+    """Look up a doc's :data:`ExistingState`: buffered write, then prefetch table, then _mget."""
+    if writer is not None:
+        body = writer.peek(files_index, doc_id)
+        if body is not None:
+            return _state_of(body)
+    if prefetched is not None and doc_id in prefetched:
+        return prefetched.pop(doc_id)
+    return _fetch_existing_state(es, files_index, [doc_id]).get(doc_id)
+
+
+def _previous_content(es: ESClient, writer: BulkWriter, cfg: Config, files_index: str, file_id: str, prev_hash: Optional[str]) -> Optional[str]:
+    """Text of the file's previous version, needed to store the next one as a delta."""
+    if not prev_hash or getattr(cfg.versioning, "storage", None) != STORAGE_DELTA:
+        return None
+    src = writer.peek(files_index, file_id)
+    if src is None:
+        src = (es.get_doc(files_index, file_id, source_includes=["content", "content_hash"]) or {}).get("_source")
+    if src and src.get("content_hash") == prev_hash:
+        return src.get("content")
+    return None
+
+
 def _match_any(patterns: List[str], rel_path: str) -> bool:
-    pp = PurePath(rel_path)
-    name = pp.name
-    for pat in patterns:
-        # Try Path.match (supports ** semantics)
-        try:
-            if pp.match(pat):
-                return True
-        except Exception:
-            pass
-        # Try fnmatch on full path
-        if fnmatch(rel_path, pat):
-            return True
-        # Try basename against the pattern
-        if fnmatch(name, pat):
-            return True
-        # If pattern starts with '**/', also test without it against basename
-        if pat.startswith("**/") and fnmatch(name, pat[3:]):
-            return True
-    return False
-
-
-def _should_index_file(path: Path, rel_path: str, cfg: Config, debug: bool = False) -> bool:
-    # Exclude patterns first
-    if _match_any(cfg.indexing.exclude_patterns, rel_path):
+    return compile_patterns(patterns).matches(rel_path)
+
+
+def _should_index_file(
+    path: Path,
+    rel_path: str,
+    cfg: Config,
+    debug: bool = False,
+    st: Optional[os.stat_result] = None,
+    matcher: Optional[IgnoreMatcher] = None,
+) -> bool:
+    # Exclude patterns (and nested .gitignore files, when the matcher knows the root) first
+    if (matcher or matcher_for(cfg)).is_excluded(rel_path):
         if debug: print(f"       ❌ Excluded by pattern")
         return False
 
@@ -61,7 +160,7 @@ def _should_index_file(path: Path, rel_path: str, cfg: Config, debug: bool = Fal
             return False
 
     try:
-        size_mb = path.stat().st_size / (1024 * 1024)
+        size_mb = (st or path.stat()).st_size / (1024 * 1024)
         if size_mb > cfg.indexing.max_file_size_mb:
             if debug: print(f"       ❌ File too large: {size_mb:.1f}MB > {cfg.indexing.max_file_size_mb}MB")
             return False
@@ -95,166 +194,23 @@ def _get_binary_type(extension: str) -> str:
     return 'binary'
 
 
-def _generate_image_preview(path: Path, max_size_kb: int = 50) -> Optional[str]:
-    """Generate base64 thumbnail using ImageMagick's convert command."""
-    import subprocess
-    import base64
-    import tempfile
-    import logging
-
-    logger = logging.getLogger(__name__)
-
+def _looks_binary(chunk: bytes) -> bool:
+    # Check for null bytes (common indicator of binary content)
+    if b'\x00' in chunk:
+        return True
+    # Check if we can decode as UTF-8
     try:
-        # Check file size
-        size_kb = path.stat().st_size / 1024
-        print(f"📸 [preview] Generating for {path.name} ({size_kb:.1f}KB)")
-        logger.info(f"📸 [preview] Generating for {path.name} ({size_kb:.1f}KB)")
-
-        # No size limit! We're generating thumbnails (max 200x200), so output is always small
-        # ImageMagick can handle multi-MB images efficiently
-
-        # Try ImageMagick convert first (handles images + videos!)
-        try:
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                tmp_path = tmp.name
-
-            # Use convert to generate 200x200 thumbnail (keep aspect ratio)
-            # Supports: images, PDFs, videos (first frame)
-            result = subprocess.run([
-                'convert',
-                str(path) + '[0]',  # [0] gets first frame for videos/PDFs
-                '-thumbnail', '200x200',  # Max dimensions (maintains aspect)
-                '-quality', '85',
-                '-strip',  # Remove metadata
-                tmp_path
-            ], capture_output=True, timeout=5, check=False)
-
-            if result.returncode == 0:
-                print(f"✅ [preview] ImageMagick success: {path.name}")
-                logger.info(f"✅ [preview] ImageMagick success: {path.name}")
-
-                # Get ORIGINAL image dimensions (before thumbnailing)
-                original_result = subprocess.run([
-                    'identify',
-                    '-format', '%w %h',
-                    str(path)
-                ], capture_output=True, timeout=2, check=False)
-
-                original_width = None
-                original_height = None
-                if original_result.returncode == 0:
-                    try:
-                        w, h = original_result.stdout.decode().strip().split()
-                        original_width = int(w)
-                        original_height = int(h)
-                        print(f"   📐 Original dimensions: {original_width}x{original_height}")
-                    except:
-                        pass
-
-                # Get actual dimensions of generated thumbnail
-                size_result = subprocess.run([
-                    'identify',
-                    '-format', '%w %h',
-                    tmp_path
-                ], capture_output=True, timeout=2, check=False)
-
-                thumb_width = 200
-                thumb_height = 200
-                if size_result.returncode == 0:
-                    try:
-                        w, h = size_result.stdout.decode().strip().split()
-                        thumb_width = int(w)
-                        thumb_height = int(h)
-                        print(f"   📐 Thumbnail dimensions: {thumb_width}x{thumb_height}")
-                    except:
-                        pass
-
-                # Read generated thumbnail
-                with open(tmp_path, 'rb') as f:
-                    thumbnail_data = f.read()
-
-                # Cleanup temp file
-                try:
-                    Path(tmp_path).unlink()
-                except:
-                    pass
-
-                # Convert to base64
-                b64 = base64.b64encode(thumbnail_data).decode('utf-8')
-                return {
-                    'data': f"data:image/png;base64,{b64}",
-                    'width': thumb_width,
-                    'height': thumb_height,
-                    'original_width': original_width,
-                    'original_height': original_height
-                }
-            else:
-                # ImageMagick failed
-                stderr = result.stderr.decode('utf-8', errors='ignore').strip()
-                print(f"❌ [preview] ImageMagick failed for {path.name}: {stderr[:100]}")
-                logger.warning(f"❌ [preview] ImageMagick failed for {path.name}: {stderr[:100]}")
-
-        except subprocess.TimeoutExpired:
-            print(f"⏱️  [preview] ImageMagick timeout for {path.name}")
-            logger.warning(f"⏱️  [preview] ImageMagick timeout for {path.name}")
-        except FileNotFoundError:
-            print(f"🔧 [preview] ImageMagick not installed (convert command not found)")
-            logger.warning(f"🔧 [preview] ImageMagick not installed (convert command not found)")
-
-        # Fallback to PIL if available
-        try:
-            print(f"🔄 [preview] Trying PIL fallback for {path.name}")
-            logger.info(f"🔄 [preview] Trying PIL fallback for {path.name}")
-            from PIL import Image
-            from io import BytesIO
-
-            # No size limit - PIL can handle large images, we're thumbnailing to 150x150
-            img = Image.open(path)
-            original_size = img.size
-            print(f"   📐 Original dimensions: {original_size[0]}x{original_size[1]}")
-
-            img.thumbnail((150, 150))
-            final_size = img.size
-            print(f"   📐 Thumbnail dimensions: {final_size[0]}x{final_size[1]}")
-
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            print(f"✅ [preview] PIL success: {path.name}")
-            logger.info(f"✅ [preview] PIL success: {path.name}")
-            return {
-                'data': f"data:image/png;base64,{b64}",
-                'width': final_size[0],
-                'height': final_size[1],
-                'original_width': original_size[0],
-                'original_height': original_size[1]
-            }
-        except ImportError:
-            logger.warning(f"📦 [preview] PIL not available (pip install Pillow)")
-        except Exception as pil_error:
-            logger.warning(f"❌ [preview] PIL failed for {path.name}: {pil_error}")
-
-        return None
-
-    except Exception as e:
-        logger.error(f"💥 [preview] Unexpected error for {path.name}: {e}")
-        return None
+        chunk.decode('utf-8')
+        return False
+    except UnicodeDecodeError:
+        return True
 
 
 def _is_binary_file(path: Path) -> bool:
     """Detect if a file is binary by checking for null bytes in the first 8KB."""
     try:
         with open(path, 'rb') as f:
-            chunk = f.read(8192)
-            # Check for null bytes (common indicator of binary content)
-            if b'\x00' in chunk:
-                return True
-            # Check if we can decode as UTF-8
-            try:
-                chunk.decode('utf-8')
-                return False
-            except UnicodeDecodeError:
-                return True
+            return _looks_binary(f.read(8192))
     except Exception:
         return True  # If we can't read it, treat as binary
 
@@ -274,23 +230,170 @@ def _read_text(path: Path) -> Optional[str]:
         return None
 
 
+def _should_descend(rel_dir: str, cfg: Config, matcher: Optional[IgnoreMatcher] = None) -> bool:
+    """Check whether a directory (relative path ending in '/') may contain indexable files."""
+    return not (matcher or matcher_for(cfg)).is_excluded(rel_dir, is_dir=True)
+
+
+def _index_writer(es: ESClient, cfg: Config) -> BulkWriter:
+    """Bulk writer for full index runs, sending concurrently as far as Elasticsearch keeps up."""
+    writes = cfg.indexing.writes
+    return BulkWriter(
+        es,
+        max_retries=writes.max_retries,
+        controller=AIMDController.from_config(writes) if writes.max_in_flight > 1 else None,
+        backoff_base_s=writes.backoff_base_ms / 1000.0,
+        backoff_max_s=writes.backoff_max_ms / 1000.0,
+    )
+
+
+def _project_file_count(es: ESClient, files_index: str, project_id: str) -> int:
+    """Current files indexed for the project: a first estimate of a full run's size."""
+    try:
+        res = es.search(files_index, {
+            "size": 0,
+            "track_total_hits": True,
+            "query": {"bool": {"filter": [{"term": {"project_id": project_id}}, {"term": {"is_current": True}}]}},
+        })
+        return int(((res.get("hits") or {}).get("total") or {}).get("value", 0))
+    except Exception:
+        return 0
+
+
+def iter_candidate_entries(
+    root: Path,
+    cfg: Config,
+    start_after: Optional[str] = None,
+    under: Optional[str] = None,
+    skip_dirs: Optional[Set[str]] = None,
+) -> Iterator[Tuple[Path, str, os.stat_result]]:
+    """Walk ``root`` with os.scandir and yield (path, rel_path, stat) for indexable files.
+
+    Excluded directories (node_modules/, .git/, build dirs, ...) are pruned before
+    descending, so nothing beneath them is listed or stat'ed. Symlinked
+    directories are not followed (same as rglob), which also rules out link
+    loops; symlinked files are followed.
+
+    The order is deterministic (each directory's files by name, then its
+    subdirectories by name; see ``checkpoint.walk_key``), so ``start_after``
+    can resume a walk: files up to and including that rel path are not
+    yielded, and subtrees entirely before it are not listed.
+
+    ``under`` (a rel dir ending in "/") walks just that subtree, and
+    ``skip_dirs`` (rel dirs ending in "/") are left out; rel paths stay
+    relative to ``root`` either way.
+    """
+    matcher = matcher_for(cfg, root)
+    # A fresh walk re-reads nested .gitignore files
+    matcher.invalidate()
+    cursor = walk_key(start_after) if start_after else None
+    if under:
+        if not _should_descend(under, cfg, matcher):
+            return
+        stack: List[Tuple[str, str]] = [(str(root / under), under)]
+    else:
+        stack = [(str(root), "")]
+    while stack:
+        dir_path, rel_dir = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel = rel_dir + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if cursor is not None:
+                        # Skip subtrees the walk finished before the cursor
+                        prefix = tuple((1, part) for part in rel.split("/"))
+                        if prefix < cursor[:len(prefix)]:
+                            continue
+                    if skip_dirs and rel + "/" in skip_dirs:
+                        continue
+                    if _should_descend(rel + "/", cfg, matcher):
+                        subdirs.append((entry.path, rel + "/"))
+                    continue
+                if cursor is not None and walk_key(rel) <= cursor:
+                    continue
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            path = Path(entry.path)
+            if _should_index_file(path, rel, cfg, st=st, matcher=matcher):
+                yield path, rel, st
+        # Depth-first, in name order
+        stack.extend(reversed(subdirs))
+
+
 def iter_candidate_files(root: Path, cfg: Config) -> Iterator[Path]:
-    for p in root.rglob("*"):
-        if p.is_file():
-            rel = str(p.relative_to(root))
-            if _should_index_file(p, rel, cfg):
-                yield p
+    for path, _rel, _st in iter_candidate_entries(root, cfg):
+        yield path
 
 
-def index_project(project_root: Path, cfg: Config, on_event: Optional[Callable[[Dict[str, object]], None]] = None, verbose: bool = False) -> Dict[str, int]:
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+def iter_prioritized_entries(
+    root: Path,
+    cfg: Config,
+    plan: PriorityPlan,
+    start_after: Optional[str] = None,
+) -> Iterator[Tuple[Path, str, os.stat_result, bool]]:
+    """Candidates in ``plan`` order, as (path, rel_path, stat, in_walk_order).
+
+    Only the final, plain walk is in walk order (and resumes after
+    ``start_after``); the phases before it are walked in full every time and
+    rely on the checkpoint log to skip what's finished.
+    """
+    seen: Set[str] = set()
+    for path, rel, st in plan.recent:
+        seen.add(rel)
+        yield path, rel, st, False
+    subtrees = ([plan.focus] if plan.focus else []) + plan.git_roots
+    for i, under in enumerate(subtrees):
+        # A repo holding the focus leaves it out; it was walked already
+        for path, rel, st in iter_candidate_entries(root, cfg, under=under, skip_dirs=set(subtrees[:i])):
+            if rel not in seen:
+                yield path, rel, st, False
+    for path, rel, st in iter_candidate_entries(root, cfg, start_after=start_after, skip_dirs=plan.skip_dirs()):
+        if rel not in seen:
+            yield path, rel, st, True
+
+
+def index_project(
+    project_root: Path,
+    cfg: Config,
+    on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    verbose: bool = False,
+    checkpoint: bool = False,
+    resume: bool = False,
+    focus: Optional[Path] = None,
+    coalescer: Optional[VersionCoalescer] = None,
+) -> Dict[str, int]:
+    """Index every candidate file under ``project_root`` and reconcile deletions.
+
+    With ``checkpoint``, progress is saved under ``.rewindex/`` every
+    ``indexing.checkpoint_interval_s`` so that a later call with ``resume``
+    continues where an interrupted run stopped instead of walking (and
+    hashing) everything again. Files that change in the already-finished
+    part of the tree in between are left to the watcher or the next run.
+
+    A cold run (nothing in the manifest) goes in ``indexing.priority`` order:
+    recently modified files, then ``focus`` (default: the cwd), then git
+    repos, then the rest, reporting each top-level directory as it becomes
+    fully searchable.
+
+    A watcher running the pass passes its ``coalescer``: held versions are
+    written first, so the versions this run adds follow them.
+    """
     import threading
 
     extractor = SimpleExtractor()
     root = project_root.resolve()
 
-    es = ESClient(cfg.elasticsearch.host)
-    idx = ensure_indices(es, cfg.resolved_index_prefix())
+    es = get_client(cfg.elasticsearch.host)
+    idx = resolve_indices(es, cfg.resolved_index_prefix())
     files_index = idx["files_index"]
     versions_index = idx["versions_index"]
 
@@ -301,6 +404,60 @@ def index_project(project_root: Path, cfg: Config, on_event: Optional[Callable[[
     new_hash_to_path: dict[str, str] = {}
     project_id = cfg.project.id
 
+    # All document writes go through one buffered _bulk writer
+    writer = _index_writer(es, cfg)
+    if coalescer is not None and coalescer.pending():
+        # Acknowledged before any file is read, so a held version is never superseded unwritten
+        coalescer.flush(writer)
+        writer.flush()
+
+    # Stat manifest: lets unchanged files skip reading/hashing/ES lookups entirely
+    manifest: Optional[FileManifest] = None
+    if getattr(cfg.indexing, 'use_cache', False):
+        manifest = FileManifest.load(root, project_id, files_index)
+        if files_index in idx.get("created", {}):
+            # Index was (re)created, so nothing recorded in the manifest is in ES anymore
+            manifest.clear()
+
+    # Resumable progress; a checkpoint from before the index was (re)created is useless
+    ckpt: Optional[IndexCheckpoint] = None
+    resumed: set[str] = set()
+    if resume and files_index not in idx.get("created", {}):
+        ckpt = IndexCheckpoint.load(root, project_id, files_index)
+        if ckpt is not None:
+            resumed, restored_hashes = ckpt.restore()
+            present_paths |= resumed
+            new_hash_to_path.update(restored_hashes)
+            print(f"[rewindex] Resuming: {len(resumed)} files already done, continuing after {ckpt.cursor or 'the start'}")
+        else:
+            print("[rewindex] No interrupted run to resume; indexing from the start")
+    if (checkpoint or resume) and ckpt is None:
+        ckpt = IndexCheckpoint.start(root, project_id, files_index, total_hint=_project_file_count(es, files_index, project_id))
+
+    # Cold run: a stat-only pre-walk decides what gets indexed first. Warm runs
+    # mostly skip via the manifest, where the extra walk would cost more than it saves
+    plan: Optional[PriorityPlan] = None
+    scopes: Optional[ScopeProgress] = None
+    priority_cfg = cfg.indexing.priority
+    if priority_cfg.enabled and (manifest is None or not manifest.entries):
+        plan = plan_priorities(
+            root,
+            iter_candidate_entries(root, cfg),
+            focus=focus if focus is not None else Path.cwd(),
+            recent_hours=priority_cfg.recent_hours,
+            max_recent=priority_cfg.max_recent,
+        )
+        scopes = ScopeProgress(plan.totals)
+        for rel in resumed:
+            scopes.add(rel)
+        if ckpt is not None:
+            ckpt.total_hint = plan.total
+        print(f"[rewindex] {plan.total} files in {len(plan.totals)} top-level dirs; "
+              f"indexing {plan.describe()} first (planned in {plan.elapsed_s:.1f}s)")
+
+    # Image previews render in the background while indexing carries on
+    thumbnails = _thumbnail_queue(writer, root, cfg) if cfg.indexing.index_binaries else None
+
     # Thread-safe counters
     lock = threading.Lock()
 
@@ -309,40 +466,107 @@ def index_project(project_root: Path, cfg: Config, on_event: Optional[Callable[[
         print(f"[rewindex] Binary indexing: {'ENABLED' if cfg.indexing.index_binaries else 'DISABLED'}")
         print(f"[rewindex] Config check: index_binaries = {getattr(cfg.indexing, 'index_binaries', 'NOT SET')}")
 
-    # Collect all files first
-    all_files = list(iter_candidate_files(root, cfg))
-    print(f"[rewindex] Found {len(all_files)} candidate files")
+    # Candidates are streamed from the walker rather than collected up front
+    scanned = 0
 
     # Determine worker count
     max_workers = getattr(cfg.indexing, 'parallel_workers', 1)
     if max_workers > 1:
         print(f"[rewindex] Using {max_workers} parallel workers for indexing")
 
-    # Helper function to process a single file (for parallel execution)
-    def process_file(path):
-        nonlocal added, updated, skipped
-        rel_path = str(path.relative_to(root))
+    # Existing (content_hash, version_count) per file id, filled in batches via _mget
+    prefetched: Dict[str, ExistingState] = {}
+
+    def mark_done(rel_path: str, content_hash: Optional[str] = "") -> None:
+        if ckpt is not None:
+            ckpt.done(rel_path, content_hash)
+        if scopes is not None:
+            scopes.add(rel_path)
 
+    def announce_scopes() -> None:
+        if scopes is None:
+            return
+        for scope in scopes.newly_complete():
+            label = "files in the project root" if scope == "." else f"{scope}/"
+            print(f"[rewindex] Searchable: {label} fully indexed ({scopes.summary()})")
+
+    def precheck(path, rel_path, stat, ordered=True):
+        """Short-circuit a candidate via the manifest; returns work or None.
+
+        ``stat`` comes from the walker, taken before any reads, so a concurrent
+        write can only make the recorded stat look older than the content.
+        """
+        nonlocal skipped, scanned
         with lock:
             present_paths.add(rel_path)
+            scanned += 1
+        if rel_path in resumed:
+            # Finished by the interrupted run
+            return None
+        if ckpt is not None:
+            ckpt.track(rel_path, ordered)
+
+        if manifest is not None:
+            entry = manifest.lookup(rel_path, stat)
+            if entry is not None:
+                with lock:
+                    new_hash_to_path[entry[3]] = rel_path
+                    skipped += 1
+                mark_done(rel_path, entry[3])
+                return None
+
+        return path, rel_path, stat
+
+    def iter_work_batches():
+        """Yield prechecked files in batches, after prefetching their existing state."""
+        batch = []
+        start_after = ckpt.cursor if ckpt is not None else None
+        if plan is not None:
+            entries = iter_prioritized_entries(root, cfg, plan, start_after=start_after)
+        else:
+            entries = ((path, rel, st, True) for path, rel, st in iter_candidate_entries(root, cfg, start_after=start_after))
+        for path, rel_path, stat, ordered in entries:
+            item = precheck(path, rel_path, stat, ordered)
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= MGET_BATCH_SIZE:
+                prefetched.update(_fetch_existing_state(es, files_index, [f"{project_id}:{b[1]}" for b in batch]))
+                yield batch
+                batch = []
+        if batch:
+            prefetched.update(_fetch_existing_state(es, files_index, [f"{project_id}:{b[1]}" for b in batch]))
+            yield batch
+
+    def read_file(item) -> Optional[Tuple[Path, bytes]]:
+        """Read stage: index binaries here; hand text bytes on for analysis."""
+        nonlocal added, updated, skipped
+        path, rel_path, stat = item
+
+        # Sniff the first block to tell binaries apart without reading them
+        try:
+            with open(path, "rb") as f:
+                head = f.read(8192)
+                is_binary = _looks_binary(head)
+                data = head + f.read() if not is_binary else b""
+        except OSError:
+            is_binary = True
+            data = b""
 
-        # Check if binary first
-        is_binary = _is_binary_file(path)
         if is_binary and not cfg.indexing.index_binaries:
             with lock:
                 skipped += 1
-            return
+            return None
 
         if is_binary:
             # Index binary file with preview generation
-            stat = path.stat()
             binary_type = _get_binary_type(path.suffix)
             if verbose:
                 print(f"  [BINARY-{binary_type.upper()}] {rel_path}")
 
             action = _index_binary_file(
                 path, rel_path, stat, root, cfg, es,
-                files_index, versions_index, project_id, on_event
+                files_index, versions_index, project_id, on_event,
+                manifest=manifest, writer=writer, prefetched=prefetched, thumbnails=thumbnails,
             )
 
             if verbose:
@@ -355,33 +579,38 @@ def index_project(project_root: Path, cfg: Config, on_event: Optional[Callable[[
                     updated += 1
                 else:
                     skipped += 1
-            return
+            return None
+
+        return path, data
 
-        # Text file processing
-        content = _read_text(path)
-        if content is None:
+    def write_text(item, analysis: Optional[TextAnalysis]) -> None:
+        """Write stage: compare with the indexed state and queue bulk writes."""
+        nonlocal added, updated, skipped
+        path, rel_path, stat = item
+
+        if analysis is None:
+            # Looked like text in the sample but isn't valid UTF-8
             with lock:
                 skipped += 1
             if verbose:
                 print(f"  [SKIPPED] {rel_path} (could not read)")
             return
+        content, h, lang, metas = analysis
 
-        h = sha256_hex(content.encode("utf-8", errors="ignore"))
-        stat = path.stat()
-        lang = detect_language(path)
-        metas = extractor.extract_metadata(content, lang)
-
-        # Retrieve existing doc by file path as doc id
+        # Existing hash/version for this path (prefetched in batches, no content)
         file_id = f"{project_id}:{rel_path}"
-        existing = es.get_doc(files_index, file_id)
+        existing = _existing_state(es, writer, files_index, file_id, prefetched)
         prev_hash = None
         existing_version_count = 1
-        if existing and existing.get("_source"):
-            prev_hash = existing["_source"].get("content_hash")
-            existing_version_count = existing["_source"].get("version_count", 1)
+        previous_hash = None
+        deleted = was_chunked = False
+        if existing is not None:
+            prev_hash, existing_version_count, previous_hash, deleted, was_chunked = existing
 
         # Increment version count if content changed
         version_count = existing_version_count + 1 if (prev_hash and prev_hash != h) else existing_version_count
+        # Read before the files doc below replaces it in the writer's buffer
+        prev_content = _previous_content(es, writer, cfg, files_index, file_id, prev_hash) if prev_hash != h else None
 
         body = {
             "content": content,
@@ -394,20 +623,30 @@ def index_project(project_root: Path, cfg: Config, on_event: Optional[Callable[[
             "last_modified": int(stat.st_mtime * 1000),
             "indexed_at": int(time.time() * 1000),
             "content_hash": h,
-            "previous_hash": prev_hash,
+            # Unchanged content keeps its link to the version before it
+            "previous_hash": previous_hash if prev_hash == h else prev_hash,
             "is_current": True,
+            "deleted": False,
             "version_count": version_count,  # Track version history depth
             "project_id": project_id,
             "project_root": str(root),
             **metas,
         }
 
-        es.put_doc(files_index, file_id, body)
+        # Large files are also searched as line windows
+        body["chunked"] = queue_chunks(writer, files_index, file_id, body, cfg)
+        writer.index(files_index, file_id, body)
+        if was_chunked and not body["chunked"]:
+            drop_stale_chunks(es, files_index, file_id, None)
+        elif body["chunked"] and prev_hash and prev_hash != h:
+            drop_stale_chunks(es, files_index, file_id, h)
+        if manifest is not None:
+            manifest.record(rel_path, stat, h, version_count)
 
         with lock:
             new_hash_to_path[h] = rel_path
 
-            if prev_hash is None:
+            if prev_hash is None or deleted:
                 added += 1
                 if verbose:
                     print(f"  [ADDED] {rel_path} ({lang})")
@@ -430,78 +669,158 @@ def index_project(project_root: Path, cfg: Config, on_event: Optional[Callable[[
 
         # Versioning: add a new version if changed
         if prev_hash != h:
-            # mark previous not current (best-effort)
+            # mark previous not current (best-effort; its blob already holds its content)
             if prev_hash:
-                try:
-                    es.put_doc(
-                        versions_index,
-                        prev_hash,
-                        {
-                            "file_path": rel_path,
-                            "content_hash": prev_hash,
-                            "previous_hash": None,
-                            "created_at": int(time.time() * 1000),
-                            "is_current": False,
-                            "content": existing["_source"].get("content", "") if existing else "",
-                            "language": lang,
-                            "project_id": project_id,
-                        },
-                    )
-                except Exception:
-                    pass
+                supersede_version(writer, versions_index, project_id, rel_path, prev_hash)
             # insert current version
-            es.put_doc(
-                versions_index,
-                h,
-                {
-                    "file_path": rel_path,
-                    "content_hash": h,
-                    "previous_hash": prev_hash,
-                    "created_at": int(time.time() * 1000),
-                    "is_current": True,
-                    "content": content,
-                    "language": lang,
-                    "project_id": project_id,
-                },
-            )
-
-    # Execute indexing with parallel workers if configured
-    if max_workers > 1:
-        # Parallel execution with progress tracking
-        print(f"[rewindex] Starting parallel indexing with {max_workers} workers...")
-        completed_count = 0
-        progress_interval = max(1, len(all_files) // 20)  # Report every 5%
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(process_file, path) for path in all_files]
-
-            # Wait for all to complete with progress reporting
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                    completed_count += 1
+            write_version(writer, versions_index, *build_version(
+                cfg.versioning,
+                file_path=rel_path,
+                content=content,
+                content_hash=h,
+                previous_hash=prev_hash,
+                previous_content=prev_content,
+                version_count=version_count,
+                language=lang,
+                project_id=project_id,
+                created_at=int(time.time() * 1000),
+            ))
+
+    def read_stage(item) -> Optional[Tuple[Path, bytes]]:
+        try:
+            data = read_file(item)
+        except Exception:
+            mark_done(item[1])
+            raise
+        if data is None:
+            mark_done(item[1])
+        return data
+
+    def write_stage(item, analysis: Optional[TextAnalysis]) -> None:
+        # A file that fails with an error would fail again, so it counts as done too
+        try:
+            write_text(item, analysis)
+        except Exception:
+            mark_done(item[1])
+            raise
+        mark_done(item[1], analysis[1] if analysis is not None else "")
 
-                    # Progress reporting (every 5% or so)
-                    if completed_count % progress_interval == 0 or completed_count == len(all_files):
-                        pct = (completed_count / len(all_files)) * 100
-                        print(f"[rewindex] Progress: {completed_count}/{len(all_files)} ({pct:.0f}%) - added: {added}, updated: {updated}, skipped: {skipped}")
-                except Exception as e:
-                    print(f"[rewindex] ERROR indexing file: {e}")
-                    import traceback
-                    traceback.print_exc()
-    else:
-        # Sequential execution (original behavior)
-        for i, path in enumerate(all_files, 1):
-            process_file(path)
-            if verbose and i % 100 == 0:
-                print(f"[rewindex] Progress: {i}/{len(all_files)}")
+    def save_checkpoint(force: bool = False) -> None:
+        if ckpt is None or not (force or ckpt.due(cfg.indexing.checkpoint_interval_s)):
+            return
+        try:
+            ckpt.save(
+                writer.flush,
+                {"added": added, "updated": updated, "skipped": skipped},
+                scopes=scopes.snapshot() if scopes is not None else None,
+            )
+        except Exception as e:
+            print(f"[rewindex] WARNING: could not save checkpoint: {e}")
+
+    def run_stages() -> None:
+        if max_workers > 1:
+            # Staged pipeline: the walk feeds reader threads, text analysis runs on
+            # a process pool, and a single writer thread builds docs and bulk-writes
+            pcfg = cfg.indexing.pipeline
+            read_workers = pcfg.read_workers or max_workers
+            controller = writer.controller
+            pipeline = IndexPipeline(
+                read_stage,
+                write_stage,
+                read_workers=read_workers,
+                cpu_workers=pcfg.cpu_workers or default_cpu_workers(),
+                queue_size=pcfg.queue_size,
+                # Fewer readers while Elasticsearch is pushing back
+                active_readers=(lambda: controller.scale(read_workers)) if controller is not None else None,
+            )
+            print(
+                f"[rewindex] Starting indexing pipeline: {pipeline.read_workers} readers, "
+                f"{pipeline.cpu_workers} analyzer processes"
+            )
+            last_report = time.monotonic()
+
+            def report_progress():
+                # Without a checkpoint the total is unknown while walking, so report every few seconds
+                nonlocal last_report
+                save_checkpoint()
+                announce_scopes()
+                if time.monotonic() - last_report >= 5.0:
+                    last_report = time.monotonic()
+                    if ckpt is not None:
+                        print(f"[rewindex] Progress: {ckpt.progress()} - added: {added}, updated: {updated}, skipped: {skipped}")
+                    else:
+                        print(f"[rewindex] Progress: {pipeline.completed} indexed, {scanned} scanned - added: {added}, updated: {updated}, skipped: {skipped}")
+
+            pipeline.run(iter_work_batches(), on_progress=report_progress)
+        else:
+            # Sequential execution: same stages, one file at a time
+            i = 0
+            for batch in iter_work_batches():
+                for item in batch:
+                    try:
+                        data = read_stage(item)
+                        if data is not None:
+                            write_stage(item, analyze_text(*data))
+                    except Exception as e:
+                        print(f"[rewindex] ERROR indexing file: {e}")
+                    i += 1
+                    if verbose and i % 100 == 0:
+                        if ckpt is not None:
+                            print(f"[rewindex] Progress: {ckpt.progress()}")
+                        else:
+                            print(f"[rewindex] Progress: {i} indexed, {scanned} scanned")
+                save_checkpoint()
+                announce_scopes()
 
-    # Handle deletions/renames: mark any previously-current docs not present on disk as not current/deleted
-    _mark_missing_as_deleted(es, files_index, project_id, present_paths, new_hash_to_path)
+    try:
+        run_stages()
+    except BaseException:
+        # Interrupted: keep what was finished for --resume
+        if ckpt is not None:
+            print(f"[rewindex] Indexing interrupted at {ckpt.progress()}; continue with `rewindex index start --resume`")
+            save_checkpoint(force=True)
+        raise
+
+    print(f"[rewindex] Scanned {scanned} candidate files")
+
+    # Preview patches go through the writer, so let the thumbnail queue drain first
+    if thumbnails is not None:
+        thumbnails.close()
+
+    # Handle deletions/renames: mark any previously-current docs not present on disk as not current/deleted.
+    # Renamed files' new docs may still be buffered; their renamed_from patch queues behind them.
+    _mark_missing_as_deleted(es, files_index, project_id, present_paths, new_hash_to_path, writer=writer)
+
+    writer.close()
+    if writer.stats["failed"]:
+        print(f"[rewindex] WARNING: {writer.stats['failed']} documents failed to index")
+    if writer.controller is not None and verbose:
+        c = writer.controller.snapshot()
+        print(f"[rewindex] Bulk requests: {c['requests']}, rejected {c['rejected']}, slow {c['slow']}; "
+              f"concurrency ended at {c['limit']}/{writer.controller.max_limit}")
+
+    if ckpt is not None:
+        ckpt.finish()
+    if scopes is not None:
+        scopes.finish()
+        announce_scopes()
+
+    if manifest is not None:
+        # Don't trust the manifest for files whose writes never made it to ES
+        for failure in writer.failures:
+            if failure["index"] == files_index:
+                manifest.discard(str(failure["id"]).split(":", 1)[-1])
+        manifest.retain_only(present_paths)
+        try:
+            manifest.save()
+        except Exception as e:
+            print(f"[rewindex] WARNING: could not save manifest: {e}")
 
     # make results immediately visible
     es.refresh(files_index)
     es.refresh(versions_index)
+    es.refresh(idx["blobs_index"])
+    es.refresh(idx["chunks_index"])
 
     return {"added": added, "updated": updated, "skipped": skipped}
 
@@ -510,6 +829,79 @@ def _get_file_hash(*args, **kwargs):  # kept for compatibility
     return None
 
 
+# Re-run a full (manifest-assisted) index_project this often while polling, to
+# pick up anything the directory snapshot could have missed
+POLL_FULL_RESYNC_S = 3600.0
+
+
+def _queue_deletions(
+    writer: BulkWriter,
+    files_index: str,
+    project_id: str,
+    rel_paths,
+    on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+) -> int:
+    """Flag files as deleted with partial updates (docs that don't exist are ignored) and drop their chunks."""
+    now_ms = int(time.time() * 1000)
+    file_ids = []
+    for rel_path in rel_paths:
+        file_id = f"{project_id}:{rel_path}"
+        # Its chunks go below, so clear chunked: search then matches the doc's own content
+        writer.update(files_index, file_id, {"is_current": False, "deleted": True, "deleted_at": now_ms, "chunked": False})
+        file_ids.append(file_id)
+        if on_event:
+            try:
+                on_event({"action": "deleted", "file_path": rel_path})
+            except Exception:
+                pass
+    if file_ids:
+        # Chunk writes still buffered for these files must land before the delete
+        writer.flush()
+        drop_chunks(writer.es, files_index, file_ids)
+    return len(file_ids)
+
+
+def _version_coalescer(cfg: Config) -> Optional[VersionCoalescer]:
+    window = float(getattr(cfg.versioning, "coalesce_window_s", 0) or 0)
+    return VersionCoalescer(cfg.versioning, window) if window > 0 else None
+
+
+def _apply_poll_changes(
+    root: Path,
+    cfg: Config,
+    changed,
+    deleted,
+    on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    coalescer: Optional[VersionCoalescer] = None,
+    flush_all: bool = False,
+) -> Dict[str, int]:
+    """Index the files a poll reported as added/modified and flag the deleted ones.
+
+    Held versions whose window has passed (all of them with ``flush_all``)
+    are written in the same bulk requests.
+    """
+    res = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
+    es = get_client(cfg.elasticsearch.host)
+    idx = resolve_indices(es, cfg.resolved_index_prefix())
+    writer = BulkWriter(es, max_age_s=0)
+    try:
+        for rel_path in sorted(changed):
+            action = index_single_file(root / rel_path, root, cfg, on_event=on_event, writer=writer, coalescer=coalescer)
+            if action in res:
+                res[action] += 1
+        res["deleted"] = _queue_deletions(writer, idx["files_index"], cfg.project.id, sorted(deleted), on_event)
+        if coalescer is not None:
+            (coalescer.flush if flush_all else coalescer.flush_due)(writer)
+    finally:
+        writer.close()
+    if writer.stats["docs"]:
+        es.refresh(idx["files_index"])
+        es.refresh(idx["versions_index"])
+        es.refresh(idx["blobs_index"])
+        es.refresh(idx["chunks_index"])
+    return res
+
+
 def poll_watch(
     project_root: Path,
     cfg: Config,
@@ -518,17 +910,27 @@ def poll_watch(
     on_update: Optional[Callable[[Dict[str, int]], None]] = None,
     on_event: Optional[Callable[[Dict[str, object]], None]] = None,
 ) -> None:
-    """Very simple polling-based watcher.
+    """Polling-based watcher (no watchdog needed).
 
-    On each tick it performs an incremental index over candidate files.
-    This is naive but dependency-free.
+    The first tick runs a full index_project; after that a
+    :class:`~rewindex.poller.DirectoryPoller` diffs the tree against its
+    snapshot (re-listing only directories whose mtime moved), and just the
+    added/modified files are indexed and the deleted ones flagged. An idle
+    tick costs one stat per directory plus a bounded slice of file stats.
     """
     from datetime import datetime
+    from .poller import DirectoryPoller
 
     print("[rewindex] Polling file watcher started (Ctrl+C to stop)...")
     print(f"[rewindex] Config: interval={interval_s}s, debounce={cfg.indexing.watch.debounce_ms}ms")
     print(f"[rewindex] Project root: {project_root}")
 
+    root = project_root.resolve()
+    matcher = matcher_for(cfg, root)
+    poller = DirectoryPoller(root, matcher, lambda path, rel, st: _should_index_file(path, rel, cfg, st=st, matcher=matcher))
+    coalescer = _version_coalescer(cfg)
+    last_full_sync = None
+
     iteration = 0
     consecutive_errors = 0
     last_update_time = datetime.now()
@@ -549,7 +951,24 @@ def poll_watch(
                 break
 
             try:
-                res = index_project(project_root, cfg, on_event=on_event)
+                if last_full_sync is None or time.monotonic() - last_full_sync >= POLL_FULL_RESYNC_S:
+                    # Snapshot first: anything that changes during the full pass shows up next tick
+                    poller.prime()
+                    res = index_project(project_root, cfg, on_event=on_event, coalescer=coalescer)
+                    last_full_sync = time.monotonic()
+                    print(f"[rewindex] Poller tracking {len(poller)} files")
+                else:
+                    added, modified, deleted = poller.poll()
+                    if added or modified or deleted:
+                        if any(p.endswith(GITIGNORE_FILENAME) for p in added | modified | deleted):
+                            # Ignore rules changed: resync everything on the next tick
+                            matcher.invalidate()
+                            last_full_sync = None
+                        res = _apply_poll_changes(root, cfg, added | modified, deleted, on_event=on_event, coalescer=coalescer)
+                    elif coalescer is not None and coalescer.pending():
+                        res = _apply_poll_changes(root, cfg, (), (), coalescer=coalescer)
+                    else:
+                        res = {}
                 consecutive_errors = 0  # Reset error counter on success
 
                 if any(res.values()):
@@ -569,6 +988,8 @@ def poll_watch(
                 print(f"[rewindex] [{timestamp}] ERROR in watcher loop (error #{consecutive_errors}): {e}")
                 import traceback
                 traceback.print_exc()
+                # The snapshot may be ahead of the index now; resync on the next tick
+                last_full_sync = None
 
                 # If we get too many consecutive errors, something is seriously wrong
                 if consecutive_errors >= 5:
@@ -589,9 +1010,24 @@ def poll_watch(
         import traceback
         traceback.print_exc()
     finally:
+        if coalescer is not None and coalescer.pending():
+            try:
+                _apply_poll_changes(root, cfg, (), (), coalescer=coalescer, flush_all=True)
+            except Exception as e:
+                print(f"[rewindex] WARNING: could not write {coalescer.pending()} held versions: {e}")
         print(f"[rewindex] Watcher loop exiting (ran {iteration} iterations).")
 
 
+def _thumbnail_queue(writer: BulkWriter, project_root: Path, cfg: Config) -> ThumbnailQueue:
+    return ThumbnailQueue(
+        writer,
+        ThumbnailCache.for_project(project_root),
+        workers=cfg.indexing.thumbnail_workers,
+        max_pending=cfg.indexing.thumbnail_queue_size,
+        max_size_kb=cfg.indexing.binary_preview_max_kb,
+    )
+
+
 def _index_binary_file(
     file_path: Path,
     rel_path: str,
@@ -603,12 +1039,35 @@ def _index_binary_file(
     versions_index: str,
     project_id: str,
     on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    manifest: Optional[FileManifest] = None,
+    writer: Optional[BulkWriter] = None,
+    prefetched: Optional[Dict[str, ExistingState]] = None,
+    thumbnails: Optional[ThumbnailQueue] = None,
 ) -> str:
-    """Index a binary file with metadata only (no content)."""
-    # Compute hash of binary content for version tracking
-    with open(file_path, 'rb') as f:
-        binary_data = f.read()
-    h = sha256_hex(binary_data)
+    """Index a binary file with metadata only (no content).
+
+    With ``thumbnails``, an image whose preview isn't cached yet is written
+    with ``preview_pending: true`` and rendered in the background.
+    """
+    put_doc = writer.index if writer is not None else es.put_doc
+    # Hash for version tracking, streamed so large media never sits in memory
+    h = _binary_content_hash(file_path, stat.st_size, cfg)
+
+    file_id = f"{project_id}:{rel_path}"
+    existing = _existing_state(es, writer, files_index, file_id, prefetched)
+    prev_hash = None
+    existing_version_count = 1
+    previous_hash = None
+    deleted = was_chunked = False
+    if existing is not None:
+        prev_hash, existing_version_count, previous_hash, deleted, was_chunked = existing
+
+    # Skip if unchanged (before any thumbnailing); a doc flagged deleted is
+    # rewritten so the file shows up again
+    if prev_hash == h and not deleted:
+        if manifest is not None:
+            manifest.record(rel_path, stat, h, existing_version_count)
+        return "skipped"
 
     # Detect binary type
     extension = file_path.suffix
@@ -616,32 +1075,22 @@ def _index_binary_file(
 
     # Generate preview for images only (skip documents/videos/etc for speed)
     preview_data = None
+    preview_pending = False
     if binary_type == 'image':  # Only actual image files
-        print(f"🎨 [index_binary_file] Attempting preview for {file_path.name} (type: {binary_type})")
         max_kb = getattr(cfg.indexing, 'binary_preview_max_kb', 50)
-        preview_data = _generate_image_preview(file_path, max_size_kb=max_kb)
-        if preview_data:
-            print(f"✅ [index_binary_file] Preview generated successfully for {file_path.name}")
-        else:
-            print(f"⚠️  [index_binary_file] Preview generation returned None for {file_path.name}")
-    elif binary_type in ('document', 'video', 'audio', 'archive'):
-        # Skip preview generation for non-image binaries
-        pass
-
-    file_id = f"{project_id}:{rel_path}"
-    existing = es.get_doc(files_index, file_id)
-    prev_hash = None
-    existing_version_count = 1
-    if existing and existing.get("_source"):
-        prev_hash = existing["_source"].get("content_hash")
-        existing_version_count = existing["_source"].get("version_count", 1)
-
-    # Skip if unchanged
-    if prev_hash == h:
-        return "skipped"
+        # Keyed by content hash: renames and duplicate images reuse the stored thumbnail
+        cache = thumbnails.cache if thumbnails is not None else ThumbnailCache.for_project(project_root)
+        preview_data = cache.get(h)
+        if preview_data is None:
+            if thumbnails is not None:
+                preview_pending = True
+            else:
+                preview_data = cache.preview(file_path, h, max_size_kb=max_kb)
+                if not preview_data:
+                    print(f"⚠️  [index_binary_file] No preview for {file_path.name}")
 
     # Increment version count if this is a change (not first index)
-    version_count = existing_version_count + 1 if prev_hash else 1
+    version_count = existing_version_count + 1 if (prev_hash and prev_hash != h) else existing_version_count
 
     body = {
         "content": "",  # Empty for binaries!
@@ -654,8 +1103,9 @@ def _index_binary_file(
         "last_modified": int(stat.st_mtime * 1000),
         "indexed_at": int(time.time() * 1000),
         "content_hash": h,
-        "previous_hash": prev_hash,
+        "previous_hash": previous_hash if prev_hash == h else prev_hash,
         "is_current": True,
+        "deleted": False,
         "is_binary": True,
         "binary_type": binary_type,
         "version_count": version_count,  # Track version history depth
@@ -670,22 +1120,21 @@ def _index_binary_file(
     }
 
     # Add preview if available (not searchable, just for display)
-    if preview_data:
-        if isinstance(preview_data, dict):
-            # New format with dimensions (thumbnail + original)
-            body["preview_base64"] = preview_data.get('data')
-            body["preview_width"] = preview_data.get('width')  # Thumbnail width
-            body["preview_height"] = preview_data.get('height')  # Thumbnail height
-            body["original_width"] = preview_data.get('original_width')  # Original image width
-            body["original_height"] = preview_data.get('original_height')  # Original image height
-            print(f"   💾 Storing: preview={body['preview_width']}x{body['preview_height']}, original={body.get('original_width')}x{body.get('original_height')}")
-        else:
-            # Old format (string only)
-            body["preview_base64"] = preview_data
-
-    es.put_doc(files_index, file_id, body)
-
-    action = "added" if prev_hash is None else "updated"
+    body.update(preview_fields(preview_data))
+    if preview_pending:
+        body["preview_pending"] = True
+
+    put_doc(files_index, file_id, body)
+    if was_chunked:
+        # Was a large text file
+        drop_stale_chunks(es, files_index, file_id, None)
+    if manifest is not None:
+        manifest.record(rel_path, stat, h, version_count)
+    if preview_pending:
+        # Queued after the doc itself, so the preview patch can't overtake it
+        thumbnails.submit(files_index, file_id, file_path, h)
+
+    action = "added" if (prev_hash is None or deleted) else "updated"
     if on_event:
         try:
             on_event({"action": action, "file_path": rel_path, "language": f"binary-{binary_type}", "is_binary": True})
@@ -700,23 +1149,22 @@ def _index_binary_file(
             "previous_hash": prev_hash,
             "created_at": int(time.time() * 1000),
             "is_current": True,
-            "content": "",  # Empty for binaries
             "language": f"binary-{binary_type}",
             "project_id": project_id,
             "is_binary": True,
             "binary_type": binary_type,
             "size_bytes": stat.st_size,
         }
-        es.put_doc(versions_index, h, version_doc)
+        # No blob: binary versions are tracked by hash only
+        put_doc(versions_index, version_id(project_id, rel_path, h), version_doc)
 
         # Mark old version as not current
         if prev_hash:
             try:
-                old_ver = es.get_doc(versions_index, prev_hash)
-                if old_ver and old_ver.get("_source"):
-                    old_src = old_ver["_source"]
-                    old_src["is_current"] = False
-                    es.put_doc(versions_index, prev_hash, old_src)
+                if writer is not None:
+                    supersede_version(writer, versions_index, project_id, rel_path, prev_hash)
+                else:
+                    es.update_doc(versions_index, version_id(project_id, rel_path, prev_hash), {"is_current": False})
             except:
                 pass
 
@@ -728,13 +1176,23 @@ def index_single_file(
     project_root: Path,
     cfg: Config,
     on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    writer: Optional[BulkWriter] = None,
+    thumbnails: Optional[ThumbnailQueue] = None,
+    coalescer: Optional[VersionCoalescer] = None,
 ) -> Optional[str]:
-    """Index a single file and return 'added', 'updated', 'skipped', or None."""
+    """Index a single file and return 'added', 'updated', 'skipped', or None.
+
+    When ``writer`` is given (the watcher's long-lived bulk writer) writes are
+    queued on it and flushed in the background; otherwise they are sent as a
+    single bulk request before returning. ``thumbnails`` (which must patch
+    through that same writer) defers image previews to the background, and
+    ``coalescer`` holds new text versions for its autosave window.
+    """
     extractor = SimpleExtractor()
     root = project_root.resolve()
 
-    es = ESClient(cfg.elasticsearch.host)
-    idx = ensure_indices(es, cfg.resolved_index_prefix())
+    es = writer.es if writer is not None else get_client(cfg.elasticsearch.host)
+    idx = resolve_indices(es, cfg.resolved_index_prefix())
     files_index = idx["files_index"]
     versions_index = idx["versions_index"]
     project_id = cfg.project.id
@@ -746,24 +1204,51 @@ def index_single_file(
         return None
 
     # Check if file should be indexed
-    if not _should_index_file(file_path, rel_path, cfg):
+    if not _should_index_file(file_path, rel_path, cfg, matcher=matcher_for(cfg, root)):
         return None
 
+    own_writer = writer is None
+    if own_writer:
+        writer = BulkWriter(es, max_age_s=0)
+    try:
+        action = _index_single_file(
+            file_path, rel_path, root, cfg, es, writer, extractor,
+            files_index, versions_index, project_id, on_event,
+            thumbnails=None if own_writer else thumbnails,
+            coalescer=coalescer,
+        )
+    finally:
+        if own_writer:
+            writer.close()
+
+    if own_writer and writer.stats["docs"]:
+        es.refresh(files_index)
+        es.refresh(versions_index)
+        es.refresh(idx["blobs_index"])
+        es.refresh(idx["chunks_index"])
+
+    return action
+
+
+def _index_single_file(
+    file_path: Path,
+    rel_path: str,
+    root: Path,
+    cfg: Config,
+    es: ESClient,
+    writer: BulkWriter,
+    extractor: SimpleExtractor,
+    files_index: str,
+    versions_index: str,
+    project_id: str,
+    on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    thumbnails: Optional[ThumbnailQueue] = None,
+    coalescer: Optional[VersionCoalescer] = None,
+) -> Optional[str]:
+    """Body of index_single_file once the path is known to be indexable."""
     if not file_path.exists():
         # File was deleted
-        file_id = f"{project_id}:{rel_path}"
-        existing = es.get_doc(files_index, file_id)
-        if existing and existing.get("_source"):
-            src = existing["_source"]
-            src["is_current"] = False
-            src["deleted"] = True
-            src["deleted_at"] = int(time.time() * 1000)
-            es.put_doc(files_index, file_id, src)
-            if on_event:
-                try:
-                    on_event({"action": "deleted", "file_path": rel_path})
-                except Exception:
-                    pass
+        _queue_deletions(writer, files_index, project_id, [rel_path], on_event)
         return "skipped"
 
     stat = file_path.stat()
@@ -777,7 +1262,10 @@ def index_single_file(
             return "skipped"
 
         # Index binary file (metadata only)
-        return _index_binary_file(file_path, rel_path, stat, project_root, cfg, es, files_index, versions_index, project_id, on_event)
+        return _index_binary_file(
+            file_path, rel_path, stat, root, cfg, es, files_index, versions_index, project_id, on_event,
+            writer=writer, thumbnails=thumbnails,
+        )
 
     # Read and index text file
     content = _read_text(file_path)
@@ -789,89 +1277,99 @@ def index_single_file(
     metas = extractor.extract_metadata(content, lang)
 
     file_id = f"{project_id}:{rel_path}"
-    existing = es.get_doc(files_index, file_id)
+    existing = _existing_state(es, writer, files_index, file_id)
     prev_hash = None
     existing_version_count = 1
-    if existing and existing.get("_source"):
-        prev_hash = existing["_source"].get("content_hash")
-        existing_version_count = existing["_source"].get("version_count", 1)
-
-    # Skip if unchanged
-    if prev_hash == h:
+    previous_hash = None
+    deleted = was_chunked = False
+    if existing is not None:
+        prev_hash, existing_version_count, previous_hash, deleted, was_chunked = existing
+
+    # Skip if unchanged; a doc flagged deleted (the file came back with the
+    # same bytes, e.g. a checkout away and back) is rewritten to show it again
+    if prev_hash == h and not deleted:
         return "skipped"
 
     # Increment version count if this is a change (not first index)
-    version_count = existing_version_count + 1 if prev_hash else 1
+    version_count = existing_version_count + 1 if (prev_hash and prev_hash != h) else existing_version_count
 
     print(f"🔢 [index_single_file] {rel_path}: prev_hash={bool(prev_hash)}, existing_count={existing_version_count}, new_count={version_count}")
+    # The version this one follows; inside a held version's window that's the held version's base
+    action = "added" if (prev_hash is None or deleted) else "updated"
+    held = coalescer.held(versions_index, project_id, rel_path) if coalescer is not None else None
+    try:
+        if held is not None:
+            prev_hash, version_count, prev_content = held["previous_hash"], held["version_count"], held["previous_content"]
+            if prev_hash == h:
+                # Back to the last written version: nothing new to keep, and the
+                # files doc links to what that version followed
+                coalescer.discard(versions_index, project_id, rel_path)
+                version_count = max(1, version_count - 1)
+                previous_hash = held.get("base_previous_hash")
+        else:
+            prev_content = _previous_content(es, writer, cfg, files_index, file_id, prev_hash) if prev_hash != h else None
 
-    body = {
-        "content": content,
-        "file_path": rel_path,
-        "file_name": file_path.name,
-        "extension": file_path.suffix,
-        "language": lang,
-        "size_bytes": stat.st_size,
-        "line_count": content.count("\n") + 1,
-        "last_modified": int(stat.st_mtime * 1000),
-        "indexed_at": int(time.time() * 1000),
-        "content_hash": h,
-        "previous_hash": prev_hash,
-        "is_current": True,
-        "version_count": version_count,  # Track version history depth
-        "project_id": project_id,
-        "project_root": str(root),
-        **metas,
-    }
-
-    es.put_doc(files_index, file_id, body)
-    print(f"   💾 Saved with version_count={version_count}")
+        body = {
+            "content": content,
+            "file_path": rel_path,
+            "file_name": file_path.name,
+            "extension": file_path.suffix,
+            "language": lang,
+            "size_bytes": stat.st_size,
+            "line_count": content.count("\n") + 1,
+            "last_modified": int(stat.st_mtime * 1000),
+            "indexed_at": int(time.time() * 1000),
+            "content_hash": h,
+            "previous_hash": previous_hash if prev_hash == h else prev_hash,
+            "is_current": True,
+            "deleted": False,
+            "version_count": version_count,  # Track version history depth
+            "project_id": project_id,
+            "project_root": str(root),
+            **metas,
+        }
 
-    action = "added" if prev_hash is None else "updated"
-    if on_event:
-        try:
-            on_event({"action": action, "file_path": rel_path, "language": lang})
-        except Exception:
-            pass
+        body["chunked"] = queue_chunks(writer, files_index, file_id, body, cfg)
+        writer.index(files_index, file_id, body)
+        if was_chunked and not body["chunked"]:
+            drop_stale_chunks(es, files_index, file_id, None)
+        elif body["chunked"] and prev_hash:
+            drop_stale_chunks(es, files_index, file_id, h)
+        print(f"   💾 Queued with version_count={version_count}")
 
-    # Versioning
-    if prev_hash != h:
-        if prev_hash:
+        if on_event:
             try:
-                es.put_doc(
-                    versions_index,
-                    prev_hash,
-                    {
-                        "file_path": rel_path,
-                        "content_hash": prev_hash,
-                        "previous_hash": None,
-                        "created_at": int(time.time() * 1000),
-                        "is_current": False,
-                        "content": existing["_source"].get("content", "") if existing else "",
-                        "language": lang,
-                        "project_id": project_id,
-                    },
-                )
+                on_event({"action": action, "file_path": rel_path, "language": lang})
             except Exception:
                 pass
 
-        es.put_doc(
-            versions_index,
-            h,
-            {
-                "file_path": rel_path,
-                "content_hash": h,
-                "previous_hash": prev_hash,
-                "created_at": int(time.time() * 1000),
-                "is_current": True,
-                "content": content,
-                "language": lang,
-                "project_id": project_id,
-            },
-        )
-
-    es.refresh(files_index)
-    es.refresh(versions_index)
+        # Versioning
+        if prev_hash != h:
+            version = dict(
+                file_path=rel_path,
+                content=content,
+                content_hash=h,
+                previous_hash=prev_hash,
+                previous_content=prev_content,
+                version_count=version_count,
+                language=lang,
+                project_id=project_id,
+                created_at=int(time.time() * 1000),
+            )
+            if coalescer is not None:
+                if held is None:
+                    # Opens a window; the base (prev_hash) followed previous_hash
+                    version["base_previous_hash"] = previous_hash
+                # Written (superseding prev_hash) when its window closes
+                coalescer.offer(versions_index, **version)
+            else:
+                if prev_hash:
+                    supersede_version(writer, versions_index, project_id, rel_path, prev_hash)
+                write_version(writer, versions_index, *build_version(cfg.versioning, **version))
+    finally:
+        if held is not None:
+            # Unless offer()/discard() already settled it
+            coalescer.release(versions_index, project_id, rel_path)
 
     return action
 
@@ -893,16 +1391,13 @@ if WATCHDOG_AVAILABLE:
             self.on_update = on_update
             self.on_event = on_event
 
-            # Debouncing: track last event time per file
-            self.last_event_time: Dict[str, float] = {}
             self.debounce_seconds = cfg.indexing.watch.debounce_ms / 1000.0
 
             # Stats tracking
             self.stats_lock = threading.Lock()
-            self.pending_stats = {"added": 0, "updated": 0, "skipped": 0}
+            self.pending_stats = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
             self.events_processed = 0  # Total events handled
             self.events_ignored = 0  # Events filtered out by patterns
-            self.pending_files: set = set()  # Files waiting to be processed
 
             # Logging
             self.log_indexed_files = True  # Enable file logging for debugging
@@ -910,31 +1405,73 @@ if WATCHDOG_AVAILABLE:
             # Batch processing timer
             self.batch_timer: Optional[threading.Timer] = None
 
-        def _should_process(self, path: str) -> bool:
-            """Check if enough time has passed since last event for this file."""
-            now = time.time()
-            last_time = self.last_event_time.get(path, 0)
+            # Shared with index_single_file, so .gitignore edits invalidate both
+            self.matcher = matcher_for(cfg, project_root.resolve())
 
-            if now - last_time < self.debounce_seconds:
-                return False
-
-            self.last_event_time[path] = now
-            return True
+            # Long-lived bulk writer: events queue writes, a background thread flushes them
+            self.writer = BulkWriter(
+                get_client(cfg.elasticsearch.host),
+                max_docs=max(1, cfg.indexing.watch.batch_size),
+                max_age_s=0.5,
+                refresh="wait_for",
+            )
+            self.thumbnails = _thumbnail_queue(self.writer, project_root, cfg)
+            # Autosave bursts collapse into one version per window (flushed from watch())
+            self.versions = _version_coalescer(cfg)
+
+            # Observer callbacks only queue paths; the last event per path is
+            # handled one debounce window after it arrived, in batches on a worker pool
+            self.queue = CoalescingQueue(
+                self._process_batch,
+                self.debounce_seconds,
+                batch_size=cfg.indexing.watch.batch_size,
+                workers=cfg.indexing.watch.workers,
+            )
 
-        def _process_file(self, file_path: Path):
-            """Process a single file change."""
+        def _process_file(self, file_path: Path, renamed_from: Optional[str] = None, kind: str = "index"):
+            """Queue a change ("index", "delete" or "delete_dir") for when its path has been quiet for the debounce window."""
             self.events_processed += 1
-            path_str = str(file_path)
-
-            if not self._should_process(path_str):
-                # Debounced - add to pending but don't process yet
-                self.pending_files.add(path_str)
-                return
-
-            # Remove from pending (if it was there)
-            self.pending_files.discard(path_str)
-
-            action = index_single_file(file_path, self.project_root, self.cfg, self.on_event)
+            # The last event for a path wins, but a pending rename's old path must still be retired
+            self.queue.push(str(file_path), (kind, renamed_from), merge=lambda old, new: (new[0], new[1] or old[1]))
+
+        def _process_batch(self, batch):
+            """Handle due events on a worker thread."""
+            deleted: List[str] = []
+            dir_prefixes = []
+            for path_str, (kind, renamed_from) in batch:
+                try:
+                    if kind == "delete_dir":
+                        rel_dir = self._rel(path_str)
+                        self._mark_dir_deleted(rel_dir)
+                        dir_prefixes.append(rel_dir + "/")
+                    elif kind == "delete":
+                        deleted.append(self._rel(path_str))
+                        if renamed_from is not None:
+                            deleted.append(renamed_from)
+                    elif renamed_from is not None:
+                        self._index_renamed(renamed_from, Path(path_str))
+                    else:
+                        self._index_path(Path(path_str))
+                except Exception as e:
+                    print(f"[rewindex] ERROR processing {path_str}: {e}")
+                    import traceback
+                    traceback.print_exc()
+            if dir_prefixes:
+                # Per-file events from inside a deleted directory are already covered
+                prefixes = tuple(dir_prefixes)
+                deleted = [p for p in deleted if not p.startswith(prefixes)]
+            if deleted:
+                self._mark_files_deleted(deleted)
+
+        def _rel(self, path_str: str) -> str:
+            return str(Path(path_str).relative_to(self.project_root))
+
+        def _index_path(self, file_path: Path):
+            """Index a single changed file."""
+            action = index_single_file(
+                    file_path, self.project_root, self.cfg, self.on_event,
+                    writer=self.writer, thumbnails=self.thumbnails, coalescer=self.versions,
+                )
 
             # Only log actual changes (added/updated), not skipped files
             if action and action != 'skipped' and self.log_indexed_files:
@@ -953,6 +1490,45 @@ if WATCHDOG_AVAILABLE:
                         self.pending_stats[action] += 1
                     self._schedule_stats_broadcast()
 
+        def _index_renamed(self, src_rel: str, dest_path: Path):
+            """Mark a renamed file's old path deleted and index the new one."""
+            dest_rel = str(dest_path.relative_to(self.project_root))
+
+            # Mark old path as deleted (the on_event below carries the rename hint)
+            self._mark_files_deleted([src_rel], emit=False)
+
+            # Index new path (without auto-emitting events to avoid duplicates)
+            action = index_single_file(
+                dest_path, self.project_root, self.cfg, on_event=None,
+                writer=self.writer, thumbnails=self.thumbnails, coalescer=self.versions,
+            )
+
+            # Manually emit rename-aware events
+            if self.on_event:
+                try:
+                    lang = detect_language(dest_path)
+
+                    # Deletion event for old path (with renamed_to hint)
+                    self.on_event({
+                        "action": "deleted",
+                        "file_path": src_rel,
+                        "language": lang,  # Use same language as new file
+                        "renamed_to": dest_rel
+                    })
+
+                    # Addition event for new path (with renamed_from hint)
+                    if action in ("added", "updated"):
+                        self.on_event({
+                            "action": "added",
+                            "file_path": dest_rel,
+                            "language": lang,
+                            "renamed_from": src_rel
+                        })
+
+                    print(f"   📢 Emitted rename events (deletion + addition)")
+                except Exception as e:
+                    print(f"   ⚠️  Could not emit events: {e}")
+
         def _schedule_stats_broadcast(self):
             """Schedule a broadcast of accumulated stats after a short delay."""
             if self.batch_timer:
@@ -965,33 +1541,60 @@ if WATCHDOG_AVAILABLE:
                             self.on_update(dict(self.pending_stats))
                         except Exception:
                             pass
-                        self.pending_stats = {"added": 0, "updated": 0, "skipped": 0}
+                        self.pending_stats = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
 
             self.batch_timer = threading.Timer(0.5, broadcast)
             self.batch_timer.start()
 
-        def _mark_file_deleted(self, rel_path: str):
-            """Mark a file as deleted in the index."""
-            try:
-                es = ESClient(self.cfg.elasticsearch.host)
-                idx = ensure_indices(es, self.cfg.resolved_index_prefix())
-                files_index = idx["files_index"]
-                project_id = self.cfg.project.id
-
-                file_id = f"{project_id}:{rel_path}"
-                existing = es.get_doc(files_index, file_id)
-
-                if existing and existing.get("_source"):
-                    src = existing["_source"]
-                    src["is_current"] = False
-                    src["deleted"] = True
-                    src["deleted_at"] = int(time.time() * 1000)
-                    es.put_doc(files_index, file_id, src)
-                    print(f"   ✅ Marked {rel_path} as deleted")
-            except Exception as e:
-                print(f"   ⚠️  Could not mark {rel_path} as deleted: {e}")
+        def _mark_files_deleted(self, rel_paths: List[str], emit: bool = True):
+            """Flag files as deleted with partial updates on the shared bulk writer."""
+            idx = resolve_indices(self.writer.es, self.cfg.resolved_index_prefix())
+            count = _queue_deletions(
+                self.writer, idx["files_index"], self.cfg.project.id, rel_paths,
+                on_event=self.on_event if emit else None,
+            )
+            if count:
+                from datetime import datetime
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                print(f"[rewindex] [{timestamp}] DELETED: {count} file(s)")
+                with self.stats_lock:
+                    self.pending_stats["deleted"] += count
+                    self._schedule_stats_broadcast()
 
-        def _should_ignore_path(self, path_str: str) -> bool:
+        def _mark_dir_deleted(self, rel_dir: str):
+            """Flag every current file under a deleted directory with one update-by-query."""
+            # Writes still buffered for files in there must land before they're flagged
+            self.writer.flush()
+            es = self.writer.es
+            idx = resolve_indices(es, self.cfg.resolved_index_prefix())
+            res = es.update_by_query(idx["files_index"], {
+                "query": {"bool": {"filter": [
+                    {"term": {"project_id": self.cfg.project.id}},
+                    {"prefix": {"file_path": rel_dir.rstrip("/") + "/"}},
+                    {"term": {"is_current": True}},
+                ]}},
+                "script": {
+                    "source": "ctx._source.is_current = false; ctx._source.deleted = true; ctx._source.deleted_at = params.now; ctx._source.chunked = false",
+                    "params": {"now": int(time.time() * 1000)},
+                },
+            }, refresh=True)
+            count = int(res.get("updated", 0) or 0)
+            if count:
+                drop_chunks_under(es, idx["files_index"], self.cfg.project.id, rel_dir)
+            from datetime import datetime
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            print(f"[rewindex] [{timestamp}] DELETED DIRECTORY: {rel_dir} ({count} files)")
+            if count:
+                if self.on_event:
+                    try:
+                        self.on_event({"action": "deleted", "file_path": rel_dir, "directory": True, "count": count})
+                    except Exception:
+                        pass
+                with self.stats_lock:
+                    self.pending_stats["deleted"] += count
+                    self._schedule_stats_broadcast()
+
+        def _should_ignore_path(self, path_str: str, is_dir: bool = False, deleted: bool = False) -> bool:
             """Check if path should be ignored by watcher."""
             # Convert absolute path to relative for pattern matching
             try:
@@ -1004,16 +1607,24 @@ if WATCHDOG_AVAILABLE:
                 self.events_ignored += 1
                 return True
 
+            # A changed .gitignore can flip decisions for anything below it
+            if abs_path.name == GITIGNORE_FILENAME:
+                self.matcher.invalidate()
+
             # Use the same exclusion patterns as indexing
             # This respects .gitignore, .rewindexignore, and built-in patterns
-            if _match_any(self.cfg.indexing.exclude_patterns, rel_str):
+            if self.matcher.is_excluded(rel_str, is_dir=is_dir):
                 #print(f"   ⚠️  Matched exclusion pattern: {rel_str}")
                 self.events_ignored += 1
                 return True
 
+            if deleted:
+                # Nothing left to stat; the partial update is a no-op for paths that were never indexed
+                return False
+
             # Also check if _should_index_file would reject it
             # This ensures watcher and indexer are in sync
-            if not _should_index_file(abs_path, rel_str, self.cfg, debug=True):
+            if not _should_index_file(abs_path, rel_str, self.cfg, debug=True, matcher=self.matcher):
                 print(f"   ⚠️  _should_index_file rejected: {rel_str}")
                 self.events_ignored += 1
                 return True
@@ -1045,19 +1656,10 @@ if WATCHDOG_AVAILABLE:
                 traceback.print_exc()
 
         def on_deleted(self, event: FileSystemEvent):
-            if event.is_directory:
-                return
-            if self._should_ignore_path(event.src_path):
+            if self._should_ignore_path(event.src_path, is_dir=event.is_directory, deleted=True):
                 return
             try:
-                self.events_processed += 1
-                # Deletion events are typically handled by _mark_missing_as_deleted in full index scans
-                # Log deletion but don't process (file doesn't exist anymore)
-                
-                if self.events_processed % 50 == 0:
-                    from datetime import datetime
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    print(f"[rewindex] [{timestamp}] Deletion event: {event.src_path}")
+                self._process_file(Path(event.src_path), kind="delete_dir" if event.is_directory else "delete")
             except Exception as e:
                 print(f"[rewindex] ERROR processing deleted event for {event.src_path}: {e}")
                 import traceback
@@ -1093,40 +1695,7 @@ if WATCHDOG_AVAILABLE:
                     dest_rel = str(dest_path.relative_to(self.project_root))
 
                     print(f"[rewindex] [{timestamp}] RENAMED: {src_rel} → {dest_rel}")
-
-                    # Mark old path as deleted
-                    self._mark_file_deleted(src_rel)
-
-                    # Index new path (without auto-emitting events to avoid duplicates)
-                    action = index_single_file(dest_path, self.project_root, self.cfg, on_event=None)
-
-                    # Manually emit rename-aware events
-                    if self.on_event:
-                        try:
-                            lang = detect_language(dest_path)
-
-                            # Deletion event for old path (with renamed_to hint)
-                            self.on_event({
-                                "action": "deleted",
-                                "file_path": src_rel,
-                                "language": lang,  # Use same language as new file
-                                "renamed_to": dest_rel
-                            })
-
-                            # Addition event for new path (with renamed_from hint)
-                            if action in ("added", "updated"):
-                                self.on_event({
-                                    "action": "added",
-                                    "file_path": dest_rel,
-                                    "language": lang,
-                                    "renamed_from": src_rel
-                                })
-
-                            print(f"   📢 Emitted rename events (deletion + addition)")
-                        except Exception as e:
-                            print(f"   ⚠️  Could not emit events: {e}")
-
-                    self.events_processed += 1
+                    self._process_file(dest_path, renamed_from=src_rel)
             except Exception as e:
                 print(f"[rewindex] ERROR processing moved event: {e}")
                 import traceback
@@ -1175,20 +1744,13 @@ def watch(
                 last_heartbeat = datetime.now()
                 last_event_count = event_count
 
-                pending_count = len(event_handler.pending_files)
+                pending_count = event_handler.queue.pending()
 
                 print(f"[rewindex] 💓 Heartbeat (iteration {iteration}, {events_this_period} events/min)")
 
                 # Only warn if there are issues
                 if pending_count > 500:
                     print(f"[rewindex]    ⚠️  {pending_count} files backlogged (watcher may be overwhelmed)")
-                    # Clear stale pending files older than 60 seconds
-                    now = time.time()
-                    stale = [p for p, t in event_handler.last_event_time.items() if now - t > 60]
-                    for p in stale:
-                        event_handler.pending_files.discard(p)
-                    if stale:
-                        print(f"[rewindex]    🧹 Cleared {len(stale)} stale pending files")
 
                 if not observer.is_alive():
                     print(f"[rewindex]    ❌ Observer thread died!")
@@ -1196,6 +1758,8 @@ def watch(
             if stop_event is not None and stop_event.is_set():
                 print("[rewindex] Watcher stop event received")
                 break
+            if event_handler.versions is not None:
+                event_handler.versions.flush_due(event_handler.writer)
             time.sleep(1.0)
     except KeyboardInterrupt:
         print("\n[rewindex] Watcher stopped (keyboard interrupt).")
@@ -1207,6 +1771,13 @@ def watch(
         print(f"[rewindex] Stopping watchdog observer... (processed {event_handler.events_processed} events)")
         observer.stop()
         observer.join(timeout=5.0)
+        # Index what was still waiting out its debounce window
+        event_handler.queue.close(timeout=30.0)
+        if event_handler.versions is not None:
+            event_handler.versions.flush(event_handler.writer)
+        # Whatever doesn't render in time stays preview_pending for `rewindex index previews`
+        event_handler.thumbnails.close(timeout=10.0)
+        event_handler.writer.close()
         if observer.is_alive():
             print("[rewindex] WARNING: Observer did not stop cleanly")
         else:
@@ -1232,7 +1803,7 @@ def purge_ignored_files(
     Returns:
         Dict with counts: {"files_deleted": N, "versions_deleted": N}
     """
-    from .es import ESClient, ensure_indices
+    from .es import get_client, resolve_indices
     import time
     import json
 
@@ -1241,8 +1812,9 @@ def purge_ignored_files(
     print(f"[rewindex] Project root: {project_root}")
     print(f"[rewindex] Project ID: {cfg.project.id}")
 
-    es = ESClient(cfg.elasticsearch.host)
-    idx = ensure_indices(es, cfg.resolved_index_prefix())
+    es = get_client(cfg.elasticsearch.host)
+    idx = resolve_indices(es, cfg.resolved_index_prefix())
+    matcher = matcher_for(cfg, project_root.resolve())
 
     print(f"[rewindex] Files index: {idx['files_index']}")
     print(f"[rewindex] Versions index: {idx['versions_index']}")
@@ -1301,7 +1873,7 @@ def purge_ignored_files(
                 if path:
                     all_file_paths.append(path)
                     # Check if path matches any ignore pattern
-                    if _match_any(cfg.indexing.exclude_patterns, path):
+                    if matcher.is_excluded(path):
                         to_delete.append(path)
                         # Log first few matches
                         if len(to_delete) <= 5:
@@ -1415,6 +1987,16 @@ def purge_ignored_files(
             if i < 5:
                 errors.append(f"Versions for {path}: {str(e)}")
 
+    # Chunks of the large ones among them (no longer reachable without their file docs)
+    for i in range(0, len(to_delete), MGET_BATCH_SIZE):
+        try:
+            es.delete_by_query(idx["chunks_index"], {"query": {"bool": {"filter": [
+                {"terms": {"file_path": to_delete[i:i + MGET_BATCH_SIZE]}},
+                {"term": {"project_id": cfg.project.id}},
+            ]}}})
+        except Exception as e:
+            errors.append(f"Chunks: {str(e)}")
+
     # Show errors if any
     if errors:
         print("\n[rewindex] Sample errors:")
@@ -1433,59 +2015,136 @@ def purge_ignored_files(
     return {"files_deleted": files_deleted, "versions_deleted": versions_deleted}
 
 
+def backfill_previews(project_root: Path, cfg: Config, limit: Optional[int] = None) -> Dict[str, int]:
+    """Render previews for image docs that were indexed without one.
+
+    Covers images still marked ``preview_pending`` (queue overflow, watcher
+    stopped mid-way) and images indexed before previews existed or whose
+    preview failed. Returns counts of queued/done/failed/missing files.
+    """
+    root = project_root.resolve()
+    es = get_client(cfg.elasticsearch.host)
+    idx = resolve_indices(es, cfg.resolved_index_prefix())
+    files_index = idx["files_index"]
+
+    query = {
+        "bool": {
+            "filter": [
+                {"term": {"project_id": cfg.project.id}},
+                {"term": {"is_binary": True}},
+                {"term": {"binary_type": "image"}},
+                {"term": {"is_current": True}},
+            ],
+            "should": [
+                {"term": {"preview_pending": True}},
+                {"bool": {"must_not": [{"exists": {"field": "preview_base64"}}]}},
+            ],
+            "minimum_should_match": 1,
+            "must_not": [{"term": {"deleted": True}}],
+        }
+    }
+
+    writer = BulkWriter(es)
+    thumbnails = _thumbnail_queue(writer, root, cfg)
+    queued = 0
+    missing = 0
+    search_after = None
+    try:
+        while limit is None or queued < limit:
+            body = {
+                "query": query,
+                "size": 500,
+                "sort": [{"file_path": "asc"}],
+                "_source": ["file_path", "content_hash"],
+            }
+            if search_after is not None:
+                body["search_after"] = search_after
+            hits = es.search(files_index, body).get("hits", {}).get("hits", [])
+            if not hits:
+                break
+            for h in hits:
+                src = h.get("_source") or {}
+                path = root / src.get("file_path", "")
+                if not src.get("content_hash") or not path.is_file():
+                    missing += 1
+                    continue
+                # Blocks while the queue is full instead of dropping work
+                while not thumbnails.submit(files_index, h["_id"], path, src["content_hash"]):
+                    time.sleep(0.1)
+                queued += 1
+                if limit is not None and queued >= limit:
+                    break
+            search_after = hits[-1].get("sort")
+            print(f"[rewindex] Previews: {queued} queued, {thumbnails.stats['done']} done")
+    finally:
+        thumbnails.close()
+        writer.close()
+        es.refresh(files_index)
+
+    return {
+        "queued": queued,
+        "done": thumbnails.stats["done"],
+        "failed": thumbnails.stats["failed"],
+        "missing": missing,
+    }
+
+
 def _mark_missing_as_deleted(
     es: ESClient,
     files_index: str,
     project_id: str,
     present_paths: set[str],
     new_hash_to_path: dict[str, str],
-) -> None:
-    # Query all current docs for this project (up to 10k files)
-    body = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"term": {"project_id": project_id}},
-                    {"term": {"is_current": True}},
-                ]
-            }
-        },
-        "size": 10000,
-        "_source": ["file_path", "content_hash"],
+    writer: Optional[BulkWriter] = None,
+) -> int:
+    """Flag current docs whose file wasn't seen by this run's walk as deleted.
+
+    Streams the project's current docs (path and hash only) through a point
+    in time, so there's no cap on project size and only the missing entries
+    are ever held in memory. Flags and rename links (same content hash under
+    a new path in this run) are queued as partial updates on ``writer`` (a
+    private one if None). Returns the number of files flagged.
+    """
+    query = {
+        "bool": {
+            "filter": [
+                {"term": {"project_id": project_id}},
+                {"term": {"is_current": True}},
+            ]
+        }
     }
-    res = es.search(files_index, body)
-    hits = res.get("hits", {}).get("hits", [])
-    missing = []
-    for h in hits:
-        src = h.get("_source", {})
-        path = src.get("file_path")
-        if not path:
-            continue
-        if path not in present_paths:
-            missing.append((h.get("_id"), path, src.get("content_hash")))
-
+    own_writer = writer is None
+    if own_writer:
+        writer = BulkWriter(es)
     now_ms = int(time.time() * 1000)
-    for doc_id, old_path, old_hash in missing:
-        # Load full source, update flags
-        doc = es.get_doc(files_index, doc_id)
-        src = (doc or {}).get("_source", {})
-        if not src:
-            continue
-        src["is_current"] = False
-        src["deleted"] = True
-        src["deleted_at"] = now_ms
-
-        # Rename detection: if same content hash appears under a new path in this run
-        if old_hash and old_hash in new_hash_to_path:
-            new_path = new_hash_to_path[old_hash]
-            if new_path != old_path:
-                src["renamed_to"] = new_path
-                # Update the new doc with renamed_from
-                new_id = f"{project_id}:{new_path}"
-                new_doc = es.get_doc(files_index, new_id)
-                new_src = (new_doc or {}).get("_source", {})
-                if new_src:
-                    new_src["renamed_from"] = old_path
-                    es.put_doc(files_index, new_id, new_src)
-
-        es.put_doc(files_index, doc_id, src)
+    count = 0
+    dropped: List[str] = []
+    try:
+        hits = es.iter_hits(files_index, query, sort=[{"file_path": "asc"}], source_includes=["file_path", "content_hash"])
+        for h in hits:
+            src = h.get("_source") or {}
+            old_path = src.get("file_path")
+            if not old_path or old_path in present_paths:
+                continue
+            partial = {"is_current": False, "deleted": True, "deleted_at": now_ms, "chunked": False}
+
+            # Rename detection: if same content hash appears under a new path in this run
+            old_hash = src.get("content_hash")
+            new_path = new_hash_to_path.get(old_hash) if old_hash else None
+            if new_path and new_path != old_path:
+                partial["renamed_to"] = new_path
+                writer.update(files_index, f"{project_id}:{new_path}", {"renamed_from": old_path})
+
+            writer.update(files_index, h["_id"], partial)
+            dropped.append(h["_id"])
+            count += 1
+    except Exception as e:
+        # The next full index retries; flags queued so far are still sent
+        print(f"[rewindex] WARNING: could not finish checking for deleted files: {e}")
+    finally:
+        if own_writer:
+            writer.close()
+    drop_chunks(es, files_index, dropped)
+    if count:
+        print(f"[rewindex] Marked {count} missing files as deleted")
+    return count
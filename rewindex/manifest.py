@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import ensure_rewindex_dir
+
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+# Files modified this close to the moment we record them may change again
+# within the same mtime tick, so their stat tuple can't be trusted yet.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class FileManifest:
+    """Local record of what each file looked like when it was last indexed.
+
+    Entries are keyed by relative path and store
+    ``[size, mtime_ns, inode, content_hash, version_count]``. When a file's
+    stat tuple still matches its entry, the indexer can skip it without
+    reading the file or asking Elasticsearch anything.
+
+    The manifest is bound to a project id and files index; if either changes
+    (or the index is recreated) the stored entries are discarded.
+    """
+
+    def __init__(self, path: Path, project_id: str, files_index: str) -> None:
+        self.path = path
+        self.project_id = project_id
+        self.files_index = files_index
+        self.entries: Dict[str, List] = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, project_root: Path, project_id: str, files_index: str) -> "FileManifest":
+        path = ensure_rewindex_dir(project_root) / MANIFEST_FILENAME
+        manifest = cls(path, project_id, files_index)
+        if not path.exists():
+            return manifest
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            # Corrupt or partially written manifest: start over
+            manifest.dirty = True
+            return manifest
+        if (
+            data.get("version") != MANIFEST_VERSION
+            or data.get("project_id") != project_id
+            or data.get("files_index") != files_index
+        ):
+            manifest.dirty = True
+            return manifest
+        entries = data.get("files")
+        if isinstance(entries, dict):
+            manifest.entries = entries
+        return manifest
+
+    def lookup(self, rel_path: str, st: os.stat_result) -> Optional[List]:
+        """Return the stored entry if the file's stat tuple is unchanged."""
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            return None
+        if entry[0] != st.st_size or entry[1] != st.st_mtime_ns or entry[2] != st.st_ino:
+            return None
+        return entry
+
+    def record(self, rel_path: str, st: os.stat_result, content_hash: str, version_count: int) -> None:
+        if time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS:
+            # Too fresh to trust; make sure we re-check it next run
+            self.discard(rel_path)
+            return
+        with self._lock:
+            self.entries[rel_path] = [st.st_size, st.st_mtime_ns, st.st_ino, content_hash, version_count]
+            self.dirty = True
+
+    def discard(self, rel_path: str) -> None:
+        with self._lock:
+            if self.entries.pop(rel_path, None) is not None:
+                self.dirty = True
+
+    def retain_only(self, present_paths: set[str]) -> None:
+        """Drop entries for files that no longer exist on disk."""
+        with self._lock:
+            stale = [p for p in self.entries if p not in present_paths]
+            for p in stale:
+                del self.entries[p]
+            if stale:
+                self.dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            if self.entries:
+                self.entries = {}
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        with self._lock:
+            data = {
+                "version": MANIFEST_VERSION,
+                "project_id": self.project_id,
+                "files_index": self.files_index,
+                "files": self.entries,
+            }
+            tmp = self.path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+
+def clear_manifest(project_root: Path) -> None:
+    """Remove the persisted manifest (e.g. after the indices were deleted)."""
+    path = project_root / ".rewindex" / MANIFEST_FILENAME
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .extractor import SimpleExtractor
+from .language import detect_language
+
+
+# Below this many files in a batch the process pool isn't worth starting
+# (a polling tick that finds a couple of edits stays entirely in-process).
+PROCESS_POOL_MIN_FILES = 64
+
+# (content, content_hash, language, metadata) for a decoded text file
+TextAnalysis = Tuple[str, str, str, Dict[str, Any]]
+
+_DONE = object()
+_extractor: Optional[SimpleExtractor] = None
+
+
+def analyze_text(path: Path, data: bytes) -> Optional[TextAnalysis]:
+    """Decode, hash and extract metadata for a text file's raw bytes.
+
+    Runs in the process pool, so it only touches its arguments. Returns None
+    if the bytes aren't valid UTF-8.
+    """
+    global _extractor
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    if _extractor is None:
+        _extractor = SimpleExtractor()
+    lang = detect_language(path)
+    metas = _extractor.extract_metadata(content, lang)
+    # Same digest as hashing content.encode("utf-8"): strict UTF-8 round-trips
+    return content, hashlib.sha256(data).hexdigest(), lang, metas
+
+
+def _process_context():
+    if getattr(sys, "frozen", False):
+        # Frozen builds can only re-launch themselves (with freeze_support)
+        return multiprocessing.get_context("spawn")
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        # Forking a process that already runs the bulk flusher/watcher threads is unsafe
+        return multiprocessing.get_context("forkserver")
+    return None
+
+
+class IndexPipeline:
+    """Walk → read → hash/extract → write, with bounded hand-offs between stages.
+
+    The caller feeds batches of work items (from the walker). ``read`` runs on
+    ``read_workers`` threads and returns ``(path, data)`` for text files that
+    need analysis, or None if it dealt with the item itself (binaries,
+    unreadable files). Analysis (:func:`analyze_text`) runs on a process pool
+    of ``cpu_workers`` processes, started on the first large batch. ``write``
+    receives each item with its analysis on a single writer thread, which owns
+    the bulk writer's flushes.
+
+    At most ``queue_size`` items wait between walk and read, and at most
+    ``queue_size`` are between read and the end of write, so a fast walker
+    can't run ahead of a slow Elasticsearch. ``active_readers``, if given,
+    says how many reader threads may work right now (the rest idle), so
+    readers can be scaled down while Elasticsearch is pushing back.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[Any], Optional[Tuple[Path, bytes]]],
+        write: Callable[[Any, Optional[TextAnalysis]], None],
+        read_workers: int,
+        cpu_workers: int,
+        queue_size: int = 256,
+        active_readers: Optional[Callable[[], int]] = None,
+    ) -> None:
+        self.read = read
+        self.write = write
+        self.read_workers = max(1, read_workers)
+        self.cpu_workers = max(1, cpu_workers)
+        self.queue_size = max(1, queue_size)
+        self.active_readers = active_readers
+        self.completed = 0
+        # Readers and the writer both finish items
+        self._completed_lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._draining = False
+
+    def run(self, batches: Iterable[List[Any]], on_progress: Optional[Callable[[], None]] = None) -> None:
+        read_q: "queue.Queue[Any]" = queue.Queue(maxsize=self.queue_size)
+        # Unbounded, but only ever holds items that got an in_flight slot
+        write_q: "queue.Queue[Any]" = queue.Queue()
+        in_flight = threading.BoundedSemaphore(self.queue_size)
+
+        readers = [
+            threading.Thread(target=self._read_loop, args=(i, read_q, write_q, in_flight), name=f"rewindex-read-{i}", daemon=True)
+            for i in range(self.read_workers)
+        ]
+        writer = threading.Thread(target=self._write_loop, args=(write_q, in_flight), name="rewindex-write", daemon=True)
+        for t in readers:
+            t.start()
+        writer.start()
+
+        self._draining = False
+        try:
+            for batch in batches:
+                if self._pool is None and self.cpu_workers > 1 and len(batch) >= PROCESS_POOL_MIN_FILES:
+                    self._start_pool()
+                for item in batch:
+                    read_q.put(item)
+                if on_progress is not None:
+                    on_progress()
+        finally:
+            # Idle readers must wake up to take their _DONE
+            self._draining = True
+            for _ in readers:
+                read_q.put(_DONE)
+            for t in readers:
+                t.join()
+            # Every remaining slot is free once all analyses have been written
+            for _ in range(self.queue_size):
+                in_flight.acquire()
+            write_q.put(_DONE)
+            writer.join()
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _start_pool(self) -> None:
+        try:
+            self._pool = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=_process_context())
+        except (OSError, ValueError, NotImplementedError, ImportError) as e:
+            print(f"[rewindex] WARNING: process pool unavailable ({e}); analyzing files in threads")
+            self.cpu_workers = 1
+
+    def _read_loop(self, reader: int, read_q, write_q, in_flight) -> None:
+        while True:
+            while self.active_readers is not None and not self._draining and reader >= self.active_readers():
+                time.sleep(0.05)
+            item = read_q.get()
+            if item is _DONE:
+                return
+            try:
+                args = self.read(item)
+            except Exception as e:
+                self._error(item, e)
+                continue
+            if args is None:
+                self._complete()
+                continue
+
+            in_flight.acquire()
+            pool = self._pool
+            if pool is not None:
+                try:
+                    fut = pool.submit(analyze_text, *args)
+                except Exception:
+                    # Pool broke (a worker was killed); finish in-process
+                    pass
+                else:
+                    fut.add_done_callback(lambda f, item=item, args=args: write_q.put((item, args, f)))
+                    continue
+            try:
+                result = analyze_text(*args)
+            except Exception as e:
+                in_flight.release()
+                self._error(item, e)
+                continue
+            write_q.put((item, args, result))
+
+    def _write_loop(self, write_q, in_flight) -> None:
+        while True:
+            entry = write_q.get()
+            if entry is _DONE:
+                return
+            item, args, result = entry
+            try:
+                if isinstance(result, Future):
+                    try:
+                        result = result.result()
+                    except Exception:
+                        result = analyze_text(*args)
+                self.write(item, result)
+            except Exception as e:
+                self._error(item, e)
+            finally:
+                self._complete()
+                in_flight.release()
+
+    def _complete(self) -> None:
+        with self._completed_lock:
+            self.completed += 1
+
+    @staticmethod
+    def _error(item: Any, e: Exception) -> None:
+        print(f"[rewindex] ERROR indexing file: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def default_cpu_workers() -> int:
+    return max(1, min(os.cpu_count() or 1, 8))
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Set, Tuple
+
+from .ignore import IgnoreMatcher
+
+
+# Directory/file mtimes this close to "now" may change again within the same
+# tick without moving, so those entries are re-checked on the next poll.
+RACY_WINDOW_NS = 2_000_000_000
+
+# (size, mtime_ns, inode)
+FileSig = Tuple[int, int, int]
+
+
+def _sig(st: os.stat_result) -> FileSig:
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class DirectoryPoller:
+    """Snapshot of the indexable tree that can be diffed cheaply.
+
+    Creating, deleting or renaming an entry bumps its directory's mtime, so
+    each poll stats every known directory and only re-lists the ones that
+    changed. Editing a file in place doesn't touch the directory, so files
+    that changed recently ("hot", edited within ``hot_window_s``) are stat'ed
+    on every poll and the rest are swept ``files_per_poll`` at a time.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        matcher: IgnoreMatcher,
+        should_index: Callable[[Path, str, os.stat_result], bool],
+        hot_window_s: float = 300.0,
+        files_per_poll: int = 2000,
+    ) -> None:
+        self.root = root
+        self.matcher = matcher
+        self.should_index = should_index
+        self.hot_window_ns = int(hot_window_s * 1e9)
+        self.files_per_poll = files_per_poll
+
+        self._dirs: Dict[str, int] = {}  # rel_dir ('' = root) -> mtime_ns
+        self._subdirs: Dict[str, Set[str]] = {}  # rel_dir -> child dir names
+        self._dir_files: Dict[str, Set[str]] = {}  # rel_dir -> file names
+        self._files: Dict[str, FileSig] = {}  # rel_path -> signature
+        self._racy: Set[str] = set()  # dirs to re-list regardless of mtime
+        self._hot: Dict[str, int] = {}  # rel_path -> time_ns it last changed
+        self._sweep: Iterator[str] = iter(())
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def prime(self) -> None:
+        """Take the initial snapshot (a full walk)."""
+        self._dirs.clear()
+        self._subdirs.clear()
+        self._dir_files.clear()
+        self._files.clear()
+        self._racy.clear()
+        self._hot.clear()
+        self.matcher.invalidate()
+        self._add_tree("", set())
+
+    def poll(self) -> Tuple[Set[str], Set[str], Set[str]]:
+        """Return (added, modified, deleted) relative paths since the last poll."""
+        now = time.time_ns()
+        added: Set[str] = set()
+        modified: Set[str] = set()
+        deleted: Set[str] = set()
+
+        for rel_dir in list(self._dirs):
+            if rel_dir not in self._dirs:
+                continue  # dropped with a parent earlier in this loop
+            try:
+                st = os.stat(self._abs(rel_dir))
+            except OSError:
+                self._drop_tree(rel_dir, deleted)
+                continue
+            if st.st_mtime_ns != self._dirs[rel_dir] or rel_dir in self._racy:
+                self._relist(rel_dir, now, added, modified, deleted)
+
+        for rel_path in self._files_to_check(now, skip=added | modified):
+            self._check_file(rel_path, modified, deleted)
+
+        for rel_path in added | modified:
+            self._hot[rel_path] = now
+        return added, modified, deleted
+
+    # Snapshot maintenance
+    def _abs(self, rel: str) -> str:
+        return os.path.join(self.root, rel) if rel else str(self.root)
+
+    def _list(self, rel_dir: str) -> Tuple[Dict[str, FileSig], Set[str], int]:
+        """Indexable files and descendable subdirectories of one directory."""
+        files: Dict[str, FileSig] = {}
+        subdirs: Set[str] = set()
+        prefix = rel_dir + "/" if rel_dir else ""
+        with os.scandir(self._abs(rel_dir)) as it:
+            for entry in it:
+                rel = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.matcher.is_excluded(rel, is_dir=True):
+                            subdirs.add(entry.name)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if self.should_index(Path(entry.path), rel, st):
+                    files[entry.name] = _sig(st)
+        return files, subdirs, os.stat(self._abs(rel_dir)).st_mtime_ns
+
+    def _add_tree(self, rel_dir: str, added: Set[str]) -> None:
+        stack = [rel_dir]
+        now = time.time_ns()
+        while stack:
+            d = stack.pop()
+            try:
+                files, subdirs, mtime = self._list(d)
+            except OSError:
+                continue
+            self._dirs[d] = mtime
+            if now - mtime < RACY_WINDOW_NS:
+                self._racy.add(d)
+            self._subdirs[d] = subdirs
+            self._dir_files[d] = set(files)
+            prefix = d + "/" if d else ""
+            for name, sig in files.items():
+                self._files[prefix + name] = sig
+                added.add(prefix + name)
+            stack.extend(prefix + name for name in subdirs)
+
+    def _drop_tree(self, rel_dir: str, deleted: Set[str]) -> None:
+        stack = [rel_dir]
+        while stack:
+            d = stack.pop()
+            self._dirs.pop(d, None)
+            self._racy.discard(d)
+            prefix = d + "/" if d else ""
+            for name in self._dir_files.pop(d, ()):
+                self._files.pop(prefix + name, None)
+                self._hot.pop(prefix + name, None)
+                deleted.add(prefix + name)
+            stack.extend(prefix + name for name in self._subdirs.pop(d, ()))
+        parent, _, name = rel_dir.rpartition("/")
+        if rel_dir and parent in self._subdirs:
+            self._subdirs[parent].discard(name)
+
+    def _relist(self, rel_dir: str, now: int, added: Set[str], modified: Set[str], deleted: Set[str]) -> None:
+        try:
+            files, subdirs, mtime = self._list(rel_dir)
+        except OSError:
+            self._drop_tree(rel_dir, deleted)
+            return
+        prefix = rel_dir + "/" if rel_dir else ""
+
+        old_files = self._dir_files.get(rel_dir, set())
+        for name, sig in files.items():
+            rel = prefix + name
+            prev = self._files.get(rel)
+            if prev is None:
+                added.add(rel)
+            elif prev != sig:
+                modified.add(rel)
+            self._files[rel] = sig
+        for name in old_files - files.keys():
+            rel = prefix + name
+            self._files.pop(rel, None)
+            self._hot.pop(rel, None)
+            deleted.add(rel)
+        self._dir_files[rel_dir] = set(files)
+
+        old_subdirs = self._subdirs.get(rel_dir, set())
+        self._subdirs[rel_dir] = set(subdirs)
+        for name in old_subdirs - subdirs:
+            self._drop_tree(prefix + name, deleted)
+        for name in subdirs - old_subdirs:
+            self._add_tree(prefix + name, added)
+
+        self._dirs[rel_dir] = mtime
+        if now - mtime < RACY_WINDOW_NS:
+            self._racy.add(rel_dir)
+        else:
+            self._racy.discard(rel_dir)
+
+    def _files_to_check(self, now: int, skip: Set[str]) -> List[str]:
+        for rel, changed in list(self._hot.items()):
+            if now - changed > self.hot_window_ns:
+                del self._hot[rel]
+        out = [rel for rel in self._hot if rel not in skip]
+        budget = min(self.files_per_poll, len(self._files))
+        for _ in range(budget):
+            rel = next(self._sweep, None)
+            if rel is None:
+                self._sweep = iter(list(self._files))
+                rel = next(self._sweep, None)
+                if rel is None:
+                    break
+            if rel in self._files and rel not in skip and rel not in self._hot:
+                out.append(rel)
+        return out
+
+    def _check_file(self, rel_path: str, modified: Set[str], deleted: Set[str]) -> None:
+        prev = self._files.get(rel_path)
+        if prev is None:
+            return
+        try:
+            st = os.stat(self._abs(rel_path))
+        except OSError:
+            # The directory re-list will report it too; keep the snapshot consistent now
+            parent, _, name = rel_path.rpartition("/")
+            self._files.pop(rel_path, None)
+            self._hot.pop(rel_path, None)
+            self._dir_files.get(parent, set()).discard(name)
+            deleted.add(rel_path)
+            return
+        sig = _sig(st)
+        if sig != prev:
+            self._files[rel_path] = sig
+            modified.add(rel_path)
+        elif time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS:
+            # Too fresh to trust an unchanged signature: keep watching it closely
+            self._hot[rel_path] = time.time_ns()
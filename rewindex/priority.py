@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+# Scope name for files directly in the project root
+ROOT_SCOPE = "."
+
+Entry = Tuple[Path, str, os.stat_result]
+
+
+def scope_of(rel_path: str) -> str:
+    """Top-level directory a rel path belongs to (``ROOT_SCOPE`` for files in the root)."""
+    head, sep, _ = rel_path.partition("/")
+    return head if sep else ROOT_SCOPE
+
+
+@dataclass
+class PriorityPlan:
+    """Order for a cold full index: what to do before the plain walk.
+
+    ``recent`` files (newest first), then the ``focus`` subtree (the cwd),
+    then ``git_roots`` (most recently touched first), then everything else in
+    walk order with those skipped. ``totals`` counts candidates per
+    top-level directory, for :class:`ScopeProgress`.
+    """
+
+    recent: List[Entry] = field(default_factory=list)
+    focus: Optional[str] = None  # rel dir ending in "/"
+    git_roots: List[str] = field(default_factory=list)  # rel dirs ending in "/"
+    totals: Dict[str, int] = field(default_factory=dict)
+    elapsed_s: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return sum(self.totals.values())
+
+    def skip_dirs(self) -> Set[str]:
+        """Subtrees the final walk leaves out because an earlier phase covered them."""
+        dirs = set(self.git_roots)
+        if self.focus:
+            dirs.add(self.focus)
+        return dirs
+
+    def describe(self) -> str:
+        parts = [f"{len(self.recent)} recently modified files"]
+        if self.focus:
+            parts.append(f"then {self.focus}")
+        if self.git_roots:
+            parts.append(f"then {len(self.git_roots)} git repos")
+        return ", ".join(parts)
+
+
+def _focus_dir(root: Path, focus: Optional[Path]) -> Optional[str]:
+    """``focus`` relative to ``root`` as "a/b/", or None if it is the root or outside it."""
+    if focus is None:
+        return None
+    try:
+        rel = focus.resolve().relative_to(root).as_posix()
+    except ValueError:
+        return None
+    return None if rel in ("", ".") else rel + "/"
+
+
+def plan_priorities(
+    root: Path,
+    entries: Iterable[Entry],
+    focus: Optional[Path] = None,
+    recent_hours: float = 24.0,
+    max_recent: int = 5000,
+) -> PriorityPlan:
+    """Walk ``entries`` once (stat only) and work out a :class:`PriorityPlan`.
+
+    Git roots are directories holding a ``.git`` entry; only the outermost of
+    nested ones count (a submodule is covered by its parent repo), and the
+    project root itself doesn't (that would be everything).
+    """
+    started = time.monotonic()
+    focus_rel = _focus_dir(root, focus)
+    cutoff_ns = time.time_ns() - int(recent_hours * 3600 * 1e9)
+    totals: Counter = Counter()
+    newest: List[Tuple[int, str, Path, os.stat_result]] = []  # Min-heap of the newest files
+    # rel dir -> outermost git root containing it ("" when none)
+    outer_root: Dict[str, str] = {"": ""}
+    root_mtime: Dict[str, int] = {}
+
+    def git_root_of(rel_dir: str) -> str:
+        found = outer_root.get(rel_dir)
+        if found is not None:
+            return found
+        parent = rel_dir[:-1].rpartition("/")[0]
+        parent = parent + "/" if parent else ""
+        found = git_root_of(parent)
+        if not found and os.path.lexists(os.path.join(root, rel_dir, ".git")):
+            found = rel_dir
+        outer_root[rel_dir] = found
+        return found
+
+    for path, rel, st in entries:
+        totals[scope_of(rel)] += 1
+        mtime = st.st_mtime_ns
+        if mtime >= cutoff_ns and max_recent > 0:
+            item = (mtime, rel, path, st)
+            if len(newest) < max_recent:
+                heapq.heappush(newest, item)
+            elif item > newest[0]:
+                heapq.heapreplace(newest, item)
+        rel_dir = rel.rpartition("/")[0]
+        repo = git_root_of(rel_dir + "/" if rel_dir else "")
+        if repo and mtime > root_mtime.get(repo, 0):
+            root_mtime[repo] = mtime
+
+    git_roots = [
+        r for r in sorted(root_mtime, key=lambda r: root_mtime[r], reverse=True)
+        # Repos inside the focus are covered by it
+        if not (focus_rel and r.startswith(focus_rel))
+    ]
+    return PriorityPlan(
+        recent=[(path, rel, st) for _m, rel, path, st in sorted(newest, reverse=True)],
+        focus=focus_rel,
+        git_roots=git_roots,
+        totals=dict(totals),
+        elapsed_s=time.monotonic() - started,
+    )
+
+
+# Live runs in this process, for /index/status
+_RUNS: "weakref.WeakSet[ScopeProgress]" = weakref.WeakSet()
+
+
+class ScopeProgress:
+    """How much of each top-level directory a prioritized run has indexed.
+
+    A scope is fully searchable once all of the candidates the plan counted
+    in it are done. Files created or deleted mid-run can make a count miss,
+    so every scope is only guaranteed complete when the run finishes.
+    """
+
+    def __init__(self, totals: Dict[str, int]) -> None:
+        self.totals = dict(totals)
+        self.done: Counter = Counter()
+        self.finished = False
+        self._announced: Set[str] = set()
+        self._lock = threading.Lock()
+        _RUNS.add(self)
+
+    def add(self, rel_path: str) -> None:
+        with self._lock:
+            self.done[scope_of(rel_path)] += 1
+
+    def _complete(self, scope: str) -> bool:
+        return self.finished or self.done[scope] >= self.totals.get(scope, 0)
+
+    def newly_complete(self) -> List[str]:
+        """Scopes that became complete since the last call."""
+        with self._lock:
+            fresh = sorted(s for s in self.totals if s not in self._announced and self._complete(s))
+            self._announced.update(fresh)
+        return fresh
+
+    def finish(self) -> None:
+        with self._lock:
+            self.finished = True
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {
+                scope: {
+                    "done": min(self.done[scope], total),
+                    "total": total,
+                    "complete": self._complete(scope),
+                }
+                for scope, total in sorted(self.totals.items())
+            }
+
+    def summary(self) -> str:
+        """e.g. "3/12 top-level dirs fully indexed"."""
+        with self._lock:
+            complete = sum(1 for s in self.totals if self._complete(s))
+        return f"{complete}/{len(self.totals)} top-level dirs fully indexed"
+
+
+def scope_progress() -> Optional[Dict[str, Dict[str, object]]]:
+    """Per top-level directory progress of the prioritized index run in this process, if any."""
+    for run in list(_RUNS):
+        if not run.finished:
+            return run.snapshot()
+    return None
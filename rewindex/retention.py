@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from .config import Config
+from .es import ESClient, get_client, resolve_indices
+from .versions import DOC_DELTA, DOC_KEYFRAME, VersionStore, forget_blobs
+
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Ids per delete-by-query request
+DELETE_BATCH = 1000
+
+# Blobs this young are never collected: their version doc may not be visible yet
+BLOB_GRACE_MS = HOUR_MS
+
+_VERSION_FIELDS = ["file_path", "content_hash", "created_at", "is_current", "size_bytes", "project_id"]
+
+
+def plan_file_versions(versions: List[Dict[str, Any]], now_ms: int, versioning) -> Set[str]:
+    """Ids of one file's versions that retention would drop.
+
+    ``versions`` are ``{"_id", "created_at", "is_current", ...}``. The current
+    version is always kept. With ``keep_all_versions`` nothing else is
+    dropped; otherwise history is thinned by age (everything for
+    ``keep_all_hours``, then the newest version per hour up to
+    ``hourly_days``, then per day until ``cleanup_after_days``, then nothing)
+    and capped at ``max_versions_per_file``.
+    """
+    if versioning.keep_all_versions:
+        return set()
+    keep_all_ms = max(0, versioning.keep_all_hours) * HOUR_MS
+    hourly_ms = max(0, versioning.hourly_days) * DAY_MS
+    cleanup_ms = max(0, versioning.cleanup_after_days) * DAY_MS
+
+    kept: List[Dict[str, Any]] = []
+    drop: Set[str] = set()
+    buckets: Set[tuple] = set()
+    for v in sorted(versions, key=lambda v: v.get("created_at") or 0, reverse=True):
+        age = now_ms - int(v.get("created_at") or 0)
+        if v.get("is_current"):
+            kept.append(v)
+            continue
+        if age < keep_all_ms:
+            kept.append(v)
+            continue
+        if cleanup_ms and age >= cleanup_ms:
+            drop.add(v["_id"])
+            continue
+        # Newest version in each hour (then day) bucket survives
+        bucket = ("h", age // HOUR_MS) if age < hourly_ms else ("d", age // DAY_MS)
+        if bucket in buckets:
+            drop.add(v["_id"])
+        else:
+            buckets.add(bucket)
+            kept.append(v)
+
+    cap = versioning.max_versions_per_file
+    if cap and cap > 0 and len(kept) > cap:
+        # Oldest beyond the cap go, but never the current version
+        current = [v for v in kept if v.get("is_current")]
+        rest = [v for v in kept if not v.get("is_current")]
+        for v in rest[max(0, cap - len(current)):]:
+            drop.add(v["_id"])
+    return drop
+
+
+def _budget_drops(
+    remaining: List[Dict[str, Any]],
+    excess_bytes: int,
+    history_bytes: int,
+) -> Set[str]:
+    """Oldest non-current versions whose removal should free ``excess_bytes``.
+
+    On-disk size isn't known per version, so each version's share of
+    ``history_bytes`` (the versions and blobs indices) is taken to be
+    proportional to its text size. At most every non-current version goes.
+    """
+    history = sorted((v for v in remaining if not v.get("is_current")), key=lambda v: v.get("created_at") or 0)
+    total_text = sum(int(v.get("size_bytes") or 0) for v in remaining) or 1
+    bytes_per_text_byte = history_bytes / total_text
+    drop: Set[str] = set()
+    freed = 0.0
+    for v in history:
+        if freed >= excess_bytes:
+            break
+        drop.add(v["_id"])
+        freed += int(v.get("size_bytes") or 0) * bytes_per_text_byte
+    return drop
+
+
+def _delete_ids(es: ESClient, index: str, ids: Iterable[str]) -> int:
+    ids = list(ids)
+    deleted = 0
+    for i in range(0, len(ids), DELETE_BATCH):
+        res = es.delete_by_query(index, {"query": {"ids": {"values": ids[i:i + DELETE_BATCH]}}})
+        if res.get("error"):
+            raise RuntimeError(f"delete_by_query on {index} failed: {res.get('body') or res.get('error')}")
+        deleted += int(res.get("deleted", 0))
+    return deleted
+
+
+def _store_bytes(es: ESClient, indices: Iterable[str]) -> int:
+    total = 0
+    for index in indices:
+        try:
+            total += es.store_size(index)
+        except Exception:
+            pass
+    return total
+
+
+def _referenced_among(es: ESClient, versions_index: str, hashes: List[str]) -> Set[str]:
+    """Which of ``hashes`` some version doc points at now."""
+    res = es.search(versions_index, {
+        "query": {"terms": {"content_hash": hashes}},
+        "size": len(hashes),
+        "_source": ["content_hash"],
+        "collapse": {"field": "content_hash"},
+    })
+    if res.get("error"):
+        raise RuntimeError(f"search on {versions_index} failed: {res.get('body') or res.get('error')}")
+    return {
+        h["_source"]["content_hash"]
+        for h in res.get("hits", {}).get("hits", [])
+        if (h.get("_source") or {}).get("content_hash")
+    }
+
+
+def _collect_blobs(
+    es: ESClient,
+    versions_index: str,
+    blobs_index: str,
+    now_ms: int,
+    dry_run: bool,
+    log: Callable[[str], None],
+) -> Dict[str, int]:
+    """Delete blobs no version points at, rebasing deltas built on them first."""
+    referenced: Set[str] = set()
+    for h in es.iter_hits(
+        versions_index, {"match_all": {}},
+        sort=[{"content_hash": "asc"}, {"file_path": "asc"}],
+        source_includes=["content_hash"],
+    ):
+        ch = h.get("_source", {}).get("content_hash")
+        if ch:
+            referenced.add(ch)
+
+    blobs: Dict[str, Dict[str, Any]] = {}
+    for h in es.iter_hits(
+        blobs_index, {"match_all": {}},
+        sort=[{"content_hash": "asc"}],
+        source_includes=["storage", "base_hash", "size_bytes", "created_at"],
+    ):
+        blobs[h["_id"]] = h.get("_source", {})
+
+    garbage = {
+        bh for bh, b in blobs.items()
+        if bh not in referenced and now_ms - int(b.get("created_at") or 0) >= BLOB_GRACE_MS
+    }
+    # A surviving delta can't outlive its base: store it whole first
+    rebase = [
+        bh for bh, b in blobs.items()
+        if bh not in garbage and b.get("storage") == DOC_DELTA and b.get("base_hash") in garbage
+    ]
+    freed = sum(int(blobs[bh].get("size_bytes") or 0) for bh in garbage)
+    out = {"blobs_deleted": len(garbage), "rebased": len(rebase), "content_bytes_freed": freed}
+    if dry_run or not garbage:
+        return out
+
+    store = VersionStore(es, versions_index, blobs_index)
+    lines: List[str] = []
+    for bh in rebase:
+        text = store.content(bh)
+        if text is None:
+            # Can't rebuild it, so its whole chain of bases has to stay
+            log(f"[retention] keeping bases of {bh[:12]}: delta could not be rebuilt")
+            base = blobs[bh].get("base_hash")
+            while base in garbage:
+                garbage.discard(base)
+                base = blobs[base].get("base_hash")
+            continue
+        lines.append(json.dumps({"index": {"_index": blobs_index, "_id": bh}}))
+        lines.append(json.dumps({
+            "content_hash": bh,
+            "created_at": blobs[bh].get("created_at"),
+            "size_bytes": blobs[bh].get("size_bytes"),
+            "storage": DOC_KEYFRAME,
+            "content": text,
+        }))
+        if len(lines) >= 2 * DELETE_BATCH:
+            es.bulk("\n".join(lines) + "\n", refresh="wait_for")
+            lines = []
+    if lines:
+        es.bulk("\n".join(lines) + "\n", refresh="wait_for")
+
+    # Indexing may have reused a blob since the scan (new version, old content,
+    # whose blob create was a no-op), so each batch is checked again right
+    # before it goes
+    es.refresh(versions_index)
+    ordered = sorted(garbage)
+    deleted = 0
+    for i in range(0, len(ordered), DELETE_BATCH):
+        batch = ordered[i:i + DELETE_BATCH]
+        reused = _referenced_among(es, versions_index, batch)
+        if reused:
+            log(f"[retention] keeping {len(reused)} blobs reused since the scan")
+            garbage.difference_update(reused)
+        deleted += _delete_ids(es, blobs_index, [bh for bh in batch if bh not in reused])
+    out["blobs_deleted"] = deleted
+    out["content_bytes_freed"] = sum(int(blobs[bh].get("size_bytes") or 0) for bh in garbage)
+    forget_blobs(blobs_index)
+    return out
+
+
+def compact(
+    project_root: Path,
+    cfg: Config,
+    dry_run: bool = False,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """Apply the versioning retention policy and the index size budget.
+
+    Thins this project's history per :func:`plan_file_versions`, then, if the
+    indices are over ``indexing.max_index_size_gb``, drops the oldest
+    remaining non-current versions until they should fit, unless current files
+    and their chunks alone exceed it, which dropping history can't fix. Blobs
+    left without a version are deleted, and deleted docs are merged away so the
+    space is returned. With ``dry_run`` nothing is changed; the counts are what would go.
+    """
+    started = time.time()
+    now_ms = int(started * 1000)
+    es = get_client(cfg.elasticsearch.host)
+    idx = resolve_indices(es, cfg.resolved_index_prefix())
+    files_index, versions_index, blobs_index = idx["files_index"], idx["versions_index"], idx["blobs_index"]
+    indices = (files_index, versions_index, blobs_index, idx["chunks_index"])
+    # Only history can be dropped; current files and their chunks stay
+    live_bytes = _store_bytes(es, (files_index, idx["chunks_index"]))
+    bytes_before = live_bytes + _store_bytes(es, (versions_index, blobs_index))
+
+    by_path: Dict[str, List[Dict[str, Any]]] = {}
+    for h in es.iter_hits(
+        versions_index, {"term": {"project_id": cfg.project.id}},
+        sort=[{"content_hash": "asc"}, {"file_path": "asc"}],
+        source_includes=_VERSION_FIELDS,
+    ):
+        src = h.get("_source", {})
+        by_path.setdefault(src.get("file_path") or "", []).append({"_id": h["_id"], **src})
+
+    drop: Set[str] = set()
+    for versions in by_path.values():
+        drop |= plan_file_versions(versions, now_ms, cfg.versioning)
+    thinned = len(drop)
+
+    budget = int(float(cfg.indexing.max_index_size_gb or 0) * 1024 ** 3)
+    if budget and live_bytes >= budget:
+        log(f"[retention] WARNING: current files alone take {live_bytes / 1024 ** 3:.2f} GB, over the "
+            f"{cfg.indexing.max_index_size_gb} GB budget; history is only thinned by the retention policy")
+    elif budget and bytes_before > budget:
+        remaining = [v for versions in by_path.values() for v in versions if v["_id"] not in drop]
+        drop |= _budget_drops(remaining, bytes_before - budget, bytes_before - live_bytes)
+        log(f"[retention] {bytes_before / 1024 ** 3:.2f} GB is over the {cfg.indexing.max_index_size_gb} GB budget; "
+            f"dropping {len(drop) - thinned} more old versions")
+
+    res: Dict[str, Any] = {
+        "project_id": cfg.project.id,
+        "dry_run": dry_run,
+        "versions_scanned": sum(len(v) for v in by_path.values()),
+        "versions_deleted": len(drop),
+        "versions_over_budget": len(drop) - thinned,
+        "bytes_before": bytes_before,
+    }
+    if not dry_run and drop:
+        res["versions_deleted"] = _delete_ids(es, versions_index, sorted(drop))
+        es.refresh(versions_index)
+    res.update(_collect_blobs(es, versions_index, blobs_index, now_ms, dry_run, log))
+
+    if not dry_run and (res["versions_deleted"] or res["blobs_deleted"]):
+        for index in (versions_index, blobs_index):
+            try:
+                es.expunge_deletes(index)
+            except Exception as e:
+                log(f"[retention] WARNING: could not expunge deletes from {index}: {e}")
+        es.refresh(versions_index)
+        es.refresh(blobs_index)
+    bytes_after = bytes_before if dry_run else _store_bytes(es, indices)
+    res["bytes_after"] = bytes_after
+    res["bytes_reclaimed"] = max(0, bytes_before - bytes_after)
+    if budget and bytes_after > budget and live_bytes < budget and not dry_run:
+        log(f"[retention] WARNING: still {bytes_after / 1024 ** 3:.2f} GB after compaction "
+            f"(budget {cfg.indexing.max_index_size_gb} GB); the current versions' text may not fit it")
+    res["elapsed_s"] = round(time.time() - started, 2)
+    return res
+
+
+def run_compactor(
+    project_root: Path,
+    cfg: Config,
+    stop_event: threading.Event,
+    interval_s: Optional[float] = None,
+) -> None:
+    """Run :func:`compact` every ``versioning.compact_interval_minutes`` until stopped."""
+    if interval_s is None:
+        interval_s = max(0, cfg.versioning.compact_interval_minutes) * 60
+    if interval_s <= 0:
+        return
+    while not stop_event.wait(interval_s):
+        try:
+            res = compact(project_root, cfg)
+            if res["versions_deleted"] or res["blobs_deleted"]:
+                print(f"[retention] Removed {res['versions_deleted']} versions and {res['blobs_deleted']} blobs, "
+                      f"reclaimed {res['bytes_reclaimed'] / 1024 ** 2:.1f} MB")
+        except Exception as e:
+            print(f"[retention] WARNING: compaction failed: {e}")
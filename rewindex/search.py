@@ -1,10 +1,35 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import re
+import threading
+import time
+from urllib.error import HTTPError, URLError
 
+from .chunks import chunks_index_for
 from .es import ESClient
+from .versions import VersionStore, blobs_index_for
+
+
+# Matching blobs a history search scores and highlights one by one (the rest match unscored)
+BLOB_CANDIDATES = 500
+# Further matching blobs joined as one terms clause (Elasticsearch's default index.max_terms_count)
+BLOB_TERMS_LIMIT = 65536
+# Chunked (large) files a search considers before the file filters apply,
+# and how many of each result's best chunks are turned into matches
+CHUNK_CANDIDATES = 500
+CHUNKS_PER_FILE = 3
+# Filters chunk docs can apply themselves (the rest only exist on file docs)
+CHUNK_FILTER_FIELDS = {"language", "extension", "file_path"}
+
+# Substrings at least this long are matched through content.trigram
+TRIGRAM_FIELD = "content.trigram"
+TRIGRAM_MIN_CHARS = 3
+# Indices created before content.trigram are re-checked this often (a rebuild adds it)
+TRIGRAM_RECHECK_S = 300.0
+_TRIGRAM_LOCK = threading.Lock()
+_TRIGRAM_INDICES: Dict[Tuple[str, str], Tuple[bool, float]] = {}
 
 
 @dataclass
@@ -58,7 +83,13 @@ def simple_search_es(
     if options.show_deleted and filters.is_current is not None:
         filters.is_current = None  # Show all files (current + deleted)
 
+    # Version text lives in the blobs index (delta blobs keep their new lines
+    # in added_lines); see _join_blob_matches
+    is_versions = index.endswith("_versions")
+
     must: List[Dict[str, Any]] = []
+    uses_trigrams = False
+    scans_keyword = False
     if query and query.strip() and query.strip() != "*":
         # Apply wildcard suffix for partial matching if requested
         search_query = query
@@ -77,6 +108,8 @@ def simple_search_es(
         if options.search_content:
             # Use exact subfield if query contains special characters
             search_fields.append("content.exact^1" if needs_exact else "content^1")
+            if is_versions:
+                search_fields.append("added_lines.exact^1" if needs_exact else "added_lines^1")
         if options.search_name:
             search_fields.append("file_name.text^2")
 
@@ -98,7 +131,13 @@ def simple_search_es(
             # Keyword field preserves original text without tokenization
             # Use bool/should to boost exact case matches higher than case-insensitive matches
             phrase_queries = []
-            if options.search_content:
+            if options.search_content and len(search_query) >= TRIGRAM_MIN_CHARS and not is_versions and _has_trigrams(es, index):
+                # Index-accelerated: candidates from the trigram index, no term scan
+                phrase_queries.append(_substring_query(TRIGRAM_FIELD, search_query))
+                uses_trigrams = True
+            elif options.search_content:
+                # Indices without trigrams (and short queries): scan with wildcards
+                scans_keyword = True
                 # Use bool query with case-sensitive (boosted) and case-insensitive (fallback)
                 phrase_queries.append({
                     "bool": {
@@ -250,6 +289,10 @@ def simple_search_es(
                 "original_width",
                 "original_height",
                 "version_count",
+                "content_hash",
+                "storage",
+                "base_hash",
+                "delta",
             ]
         },
     }
@@ -273,9 +316,38 @@ def simple_search_es(
                 }
             },
         }
+        if is_versions:
+            body["highlight"]["fields"]["added_lines"] = dict(body["highlight"]["fields"]["content"])
+
+    blob_highlights: Dict[str, Dict[str, Any]] = {}
+    blobs_truncated = False
+    if is_versions and must:
+        # Version docs hold metadata and their text lives in the blobs index:
+        # find the matching blobs first, then the versions pointing at them
+        body["query"]["bool"]["must"], blob_highlights, blobs_truncated = _join_blob_matches(
+            es, index, must, body.get("highlight")
+        )
+
+    # Large files are matched through their chunks, so neither ES nor the line
+    # mapping below ever works through a whole large file's content
+    chunk_scores: Optional[Dict[str, tuple]] = None
+    if not is_versions and must and options.search_content:
+        chunk_scores = _chunk_candidates(es, index, must, filter_clauses, must_not_clauses, uses_trigrams, scans_keyword)
+        if chunk_scores is not None:
+            body["query"]["bool"]["must_not"] = list(body["query"]["bool"]["must_not"]) + [{"term": {"chunked": True}}]
 
     res = es.search(index, body)
     hits = res.get("hits", {}).get("hits", [])
+    if is_versions:
+        VersionStore(es, index).fill([h.get("_source", {}) for h in hits])
+
+    chunk_segments: Dict[str, List[tuple]] = {}
+    if chunk_scores:
+        chunk_hits = _join_chunk_files(es, index, chunk_scores, body, options.limit)
+        if chunk_hits:
+            hits = sorted(hits + chunk_hits, key=lambda h: h.get("_score") or 0.0, reverse=True)[:max(1, options.limit)]
+            shown = {h["_id"]: chunk_scores[h["_id"]][1] for h in hits if h.get("_id") in chunk_scores}
+            chunk_segments = _chunk_segments(es, index, must, shown, body.get("highlight"))
 
     # Debug: Log result count
     import logging
@@ -293,10 +365,17 @@ def simple_search_es(
         debug_stats["total_hits"] += 1
         src = h.get("_source", {})
         # Get highlights from either content or content.exact field
-        hl_list = h.get("highlight", {}).get("content", [])
+        hl = h.get("highlight") or blob_highlights.get(src.get("content_hash"), {})
+        hl_list = hl.get("content", [])
         if not hl_list:
-            hl_list = h.get("highlight", {}).get("content.exact", [])
+            hl_list = hl.get("content.exact", [])
+        if not hl_list:
+            hl_list = hl.get("added_lines", [])
         content = src.get("content", "")
+        # (text, fragments, line offset) to map matches in: the file, or its best chunks
+        segments = chunk_segments.get(h.get("_id")) or [(content, hl_list, 0)]
+        if h.get("_id") in chunk_segments:
+            hl_list = [frag for _text, frags, _offset in segments for frag in frags]
 
         # DEBUG: Log highlight fragments
         if hl_list:
@@ -312,10 +391,13 @@ def simple_search_es(
         matches: List[Dict[str, Any]] = []
         line_match_counts = {}  # Track how many times each line matched
         # Build matches from highlight fragments when available
-        for frag_idx, frag in enumerate(hl_list[:10]):
+        fragments = [(text, frag, offset) for text, frags, offset in segments for frag in frags]
+        for frag_idx, (text, frag, offset) in enumerate(fragments[:10]):
             line_no, before_ctx, after_ctx, line_highlight = _compute_line_context(
-                content, frag, query, options.context_lines, apply_markup=options.highlight
+                text, frag, query, options.context_lines, apply_markup=options.highlight
             )
+            if line_no:
+                line_no += offset
 
             # DEBUG: Log line mapping for first file
             if debug_stats["total_hits"] <= 1 and frag_idx < 3:
@@ -352,9 +434,12 @@ def simple_search_es(
 
         # Fallback: ensure at least one match by using query-based matching
         if not matches:
+            text, _frags, offset = segments[0]
             line_no, before_ctx, after_ctx, line_highlight = _compute_line_context(
-                content, "", query, options.context_lines, apply_markup=options.highlight
+                text, "", query, options.context_lines, apply_markup=options.highlight
             )
+            if line_no:
+                line_no += offset
             matches.append({
                 "line": line_no,
                 "content": None,
@@ -405,11 +490,241 @@ def simple_search_es(
     #print(f"  Avg matches per result: {debug_stats['total_matches'] / max(1, debug_stats['total_hits']):.1f}")
 
     out: Dict[str, Any] = {"total_hits": len(results), "results": results}
+    if blobs_truncated:
+        # Too many distinct matching texts; some older versions aren't searched
+        out["truncated"] = True
     if debug:
         out["debug"] = {"query": body, "took": res.get("took")}
     return out
 
 
+def _join_blob_matches(
+    es: ESClient,
+    versions_index: str,
+    must: List[Dict[str, Any]],
+    highlight: Optional[Dict[str, Any]],
+):
+    """Rewrite a versions-index text query to match through the blobs index.
+
+    Returns the replacement ``must`` clauses, the blobs' highlights by
+    content hash, and whether some matching blobs had to be left out. The
+    ``BLOB_CANDIDATES`` best blobs each become a constant-score clause
+    boosted by the blob's own score, so versions rank like their text; any
+    further matches (up to ``BLOB_TERMS_LIMIT``) are paged in and match
+    unscored. Version docs that still carry content (written before blobs)
+    keep matching directly.
+    """
+    blobs_index = blobs_index_for(versions_index)
+    blob_body: Dict[str, Any] = {
+        "query": {"bool": {"must": must}},
+        "size": BLOB_CANDIDATES,
+        "_source": ["content_hash"],
+    }
+    if highlight:
+        blob_body["highlight"] = highlight
+    try:
+        res = es.search(blobs_index, blob_body)
+    except (HTTPError, URLError):
+        return must, {}, False
+
+    should: List[Dict[str, Any]] = [{"bool": {"must": must}}]
+    highlights: Dict[str, Dict[str, Any]] = {}
+    top = res.get("hits", {}).get("hits", [])
+    for h in top:
+        should.append({
+            "constant_score": {
+                "filter": {"term": {"content_hash": h["_id"]}},
+                "boost": max(float(h.get("_score") or 1.0), 1e-6),
+            }
+        })
+        if h.get("highlight"):
+            highlights[h["_id"]] = h["highlight"]
+
+    truncated = False
+    if len(top) >= BLOB_CANDIDATES:
+        # Past the scored candidates, the rest match as one terms clause,
+        # ranked just below the weakest of them
+        seen = {h["_id"] for h in top}
+        rest: List[str] = []
+        try:
+            for h in es.iter_hits(blobs_index, {"bool": {"must": must}}, sort=[{"content_hash": "asc"}], source_includes=[]):
+                if h["_id"] in seen:
+                    continue
+                if len(rest) >= BLOB_TERMS_LIMIT:
+                    truncated = True
+                    break
+                rest.append(h["_id"])
+        except (HTTPError, URLError, RuntimeError):
+            truncated = True
+        if rest:
+            should.append({
+                "constant_score": {
+                    "filter": {"terms": {"content_hash": rest}},
+                    "boost": max(min(float(h.get("_score") or 1.0) for h in top) * 0.5, 1e-6),
+                }
+            })
+    return [{"bool": {"should": should, "minimum_should_match": 1}}], highlights, truncated
+
+
+def _has_trigrams(es: ESClient, index: str) -> bool:
+    """Whether ``index`` has the content.trigram subfield (cached; old indices lack it until rebuilt)."""
+    key = (es.base, index)
+    now = time.monotonic()
+    with _TRIGRAM_LOCK:
+        cached = _TRIGRAM_INDICES.get(key)
+    if cached is not None and (cached[0] or now - cached[1] < TRIGRAM_RECHECK_S):
+        return cached[0]
+    try:
+        found = es.has_field(index, TRIGRAM_FIELD)
+    except (HTTPError, URLError):
+        return False
+    with _TRIGRAM_LOCK:
+        _TRIGRAM_INDICES[key] = (found, now)
+    return found
+
+
+def _substring_query(field: str, text: str) -> Dict[str, Any]:
+    """Case-insensitive substring match on a trigram field.
+
+    The conjunction of the text's trigrams narrows the candidates through the
+    index; the phrase then checks they occur consecutively, i.e. that the
+    text itself does.
+    """
+    return {
+        "bool": {
+            "filter": [{"match": {field: {"query": text, "operator": "and"}}}],
+            "must": [{"match_phrase": {field: {"query": text}}}],
+        }
+    }
+
+
+def _chunk_candidates(
+    es: ESClient,
+    files_index: str,
+    must: List[Dict[str, Any]],
+    filter_clauses: List[Dict[str, Any]],
+    must_not_clauses: List[Dict[str, Any]],
+    uses_trigrams: bool = False,
+    scans_keyword: bool = False,
+) -> Optional[Dict[str, tuple]]:
+    """Best chunk score and content hash per chunked file matching ``must``.
+
+    Returns None if the chunks index can't be searched (e.g. it doesn't
+    exist yet, or lacks trigrams ``must`` relies on, or ``must`` scans
+    content.keyword, which chunks don't have), in which case large files are
+    searched whole as before.
+    """
+    if scans_keyword or (uses_trigrams and not _has_trigrams(es, chunks_index_for(files_index))):
+        return None
+    def chunk_side(clauses):
+        # {"term": {"language": ...}} -> "language"
+        return [c for c in clauses if next(iter(next(iter(c.values())))) in CHUNK_FILTER_FIELDS]
+
+    chunk_body = {
+        "query": {"bool": {
+            "must": must,
+            "filter": chunk_side(filter_clauses),
+            "must_not": chunk_side(must_not_clauses),
+        }},
+        "size": CHUNK_CANDIDATES,
+        "_source": ["file_id", "content_hash"],
+        "collapse": {"field": "file_id"},
+    }
+    try:
+        res = es.search(chunks_index_for(files_index), chunk_body)
+    except (HTTPError, URLError):
+        return None
+    out: Dict[str, tuple] = {}
+    for h in res.get("hits", {}).get("hits", []):
+        src = h.get("_source") or {}
+        if src.get("file_id"):
+            out[src["file_id"]] = (max(float(h.get("_score") or 1.0), 1e-6), src.get("content_hash"))
+    return out
+
+
+def _join_chunk_files(
+    es: ESClient,
+    files_index: str,
+    chunk_scores: Dict[str, tuple],
+    body: Dict[str, Any],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """File docs of chunk-matched files that pass the search's filters, scored like their best chunk.
+
+    A chunk only counts while its file doc still has the chunk's content hash.
+    """
+    should = [
+        {
+            "constant_score": {
+                "filter": {"bool": {"filter": [{"ids": {"values": [file_id]}}, {"term": {"content_hash": h}}]}},
+                "boost": score,
+            }
+        }
+        for file_id, (score, h) in chunk_scores.items()
+    ]
+    query = body["query"]["bool"]
+    join_body = {
+        "query": {"bool": {
+            "should": should,
+            "minimum_should_match": 1,
+            "filter": query["filter"],
+            # Without the chunked exclusion added for the main search
+            "must_not": [c for c in query["must_not"] if c != {"term": {"chunked": True}}],
+        }},
+        "size": max(1, limit),
+        "_source": {"includes": [f for f in body["_source"]["includes"] if f != "content"]},
+    }
+    try:
+        return es.search(files_index, join_body).get("hits", {}).get("hits", [])
+    except (HTTPError, URLError):
+        return []
+
+
+def _chunk_segments(
+    es: ESClient,
+    files_index: str,
+    must: List[Dict[str, Any]],
+    shown: Dict[str, Optional[str]],
+    highlight: Optional[Dict[str, Any]],
+) -> Dict[str, List[tuple]]:
+    """(chunk text, highlight fragments, line offset) of the best chunks of each shown file."""
+    if not shown:
+        return {}
+    inner: Dict[str, Any] = {"name": "chunks", "size": CHUNKS_PER_FILE, "_source": ["content", "start_line"]}
+    if highlight:
+        inner["highlight"] = highlight
+    detail_body = {
+        "query": {"bool": {
+            "must": must,
+            "should": [
+                {"bool": {"filter": [{"term": {"file_id": file_id}}, {"term": {"content_hash": h}}]}}
+                for file_id, h in sorted(shown.items())
+            ],
+            "minimum_should_match": 1,
+        }},
+        "size": len(shown),
+        "_source": ["file_id"],
+        "collapse": {"field": "file_id", "inner_hits": inner},
+    }
+    try:
+        res = es.search(chunks_index_for(files_index), detail_body)
+    except (HTTPError, URLError):
+        return {}
+    out: Dict[str, List[tuple]] = {}
+    for h in res.get("hits", {}).get("hits", []):
+        file_id = (h.get("_source") or {}).get("file_id")
+        chunk_hits = (((h.get("inner_hits") or {}).get("chunks") or {}).get("hits") or {}).get("hits") or []
+        segments = []
+        for c in chunk_hits:
+            src = c.get("_source") or {}
+            hl = c.get("highlight") or {}
+            frags = hl.get("content") or hl.get("content.exact") or []
+            segments.append((src.get("content", ""), frags, int(src.get("start_line") or 1) - 1))
+        if file_id and segments:
+            out[file_id] = segments
+    return out
+
+
 def _compute_line_context(content: str, highlight_fragment: str, query: str, context_lines: int, apply_markup: bool = True):
     if not content:
         return None, [], [], None
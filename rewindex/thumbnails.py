@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .bulk import BulkWriter
+from .config import ensure_rewindex_dir
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when thumbnail parameters change so old cache entries are ignored
+THUMBNAIL_CACHE_VERSION = 1
+THUMBNAIL_SIZE = "200x200"
+
+
+def _png_size(data: bytes) -> Optional[tuple]:
+    """Read (width, height) from a PNG's IHDR chunk."""
+    if len(data) >= 24 and data[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", data[16:24])
+    return None
+
+
+def generate_image_preview(path: Path, max_size_kb: int = 50) -> Optional[Dict]:
+    """Generate base64 thumbnail using ImageMagick's convert command.
+
+    A single ``convert`` call prints the original dimensions and writes the
+    PNG thumbnail to stdout; the thumbnail's own size is read from its header.
+    """
+    try:
+        # Check file size
+        size_kb = path.stat().st_size / 1024
+        print(f"📸 [preview] Generating for {path.name} ({size_kb:.1f}KB)")
+        logger.info(f"📸 [preview] Generating for {path.name} ({size_kb:.1f}KB)")
+
+        # No size limit! We're generating thumbnails (max 200x200), so output is always small
+        # ImageMagick can handle multi-MB images efficiently
+
+        # Try ImageMagick convert first (handles images + videos!)
+        try:
+            # Supports: images, PDFs, videos (first frame)
+            result = subprocess.run([
+                'convert',
+                str(path) + '[0]',  # [0] gets first frame for videos/PDFs
+                '-print', '%w %h\\n',  # ORIGINAL dimensions, printed before thumbnailing
+                '-thumbnail', THUMBNAIL_SIZE,  # Max dimensions (maintains aspect)
+                '-quality', '85',
+                '-strip',  # Remove metadata
+                'png:-'
+            ], capture_output=True, timeout=5, check=False)
+
+            if result.returncode == 0:
+                print(f"✅ [preview] ImageMagick success: {path.name}")
+                logger.info(f"✅ [preview] ImageMagick success: {path.name}")
+
+                dims, _, thumbnail_data = result.stdout.partition(b"\n")
+                original_width = None
+                original_height = None
+                try:
+                    w, h = dims.decode().split()
+                    original_width = int(w)
+                    original_height = int(h)
+                except ValueError:
+                    pass
+
+                thumb_width, thumb_height = _png_size(thumbnail_data) or (200, 200)
+
+                # Convert to base64
+                b64 = base64.b64encode(thumbnail_data).decode('utf-8')
+                return {
+                    'data': f"data:image/png;base64,{b64}",
+                    'width': thumb_width,
+                    'height': thumb_height,
+                    'original_width': original_width,
+                    'original_height': original_height
+                }
+            else:
+                # ImageMagick failed
+                stderr = result.stderr.decode('utf-8', errors='ignore').strip()
+                print(f"❌ [preview] ImageMagick failed for {path.name}: {stderr[:100]}")
+                logger.warning(f"❌ [preview] ImageMagick failed for {path.name}: {stderr[:100]}")
+
+        except subprocess.TimeoutExpired:
+            print(f"⏱️  [preview] ImageMagick timeout for {path.name}")
+            logger.warning(f"⏱️  [preview] ImageMagick timeout for {path.name}")
+        except FileNotFoundError:
+            print(f"🔧 [preview] ImageMagick not installed (convert command not found)")
+            logger.warning(f"🔧 [preview] ImageMagick not installed (convert command not found)")
+
+        # Fallback to PIL if available
+        try:
+            print(f"🔄 [preview] Trying PIL fallback for {path.name}")
+            logger.info(f"🔄 [preview] Trying PIL fallback for {path.name}")
+            from PIL import Image
+            from io import BytesIO
+
+            # No size limit - PIL can handle large images, we're thumbnailing to 150x150
+            img = Image.open(path)
+            original_size = img.size
+
+            img.thumbnail((150, 150))
+            final_size = img.size
+
+            buffer = BytesIO()
+            img.save(buffer, format='PNG')
+            b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            print(f"✅ [preview] PIL success: {path.name}")
+            logger.info(f"✅ [preview] PIL success: {path.name}")
+            return {
+                'data': f"data:image/png;base64,{b64}",
+                'width': final_size[0],
+                'height': final_size[1],
+                'original_width': original_size[0],
+                'original_height': original_size[1]
+            }
+        except ImportError:
+            logger.warning(f"📦 [preview] PIL not available (pip install Pillow)")
+        except Exception as pil_error:
+            logger.warning(f"❌ [preview] PIL failed for {path.name}: {pil_error}")
+
+        return None
+
+    except Exception as e:
+        logger.error(f"💥 [preview] Unexpected error for {path.name}: {e}")
+        return None
+
+
+class ThumbnailCache:
+    """On-disk previews keyed by content hash.
+
+    Renamed, copied or re-indexed images with the same bytes reuse the stored
+    preview instead of running ImageMagick again. Failed generations aren't
+    cached, so installing ImageMagick later still takes effect.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    @classmethod
+    def for_project(cls, project_root: Path) -> "ThumbnailCache":
+        return cls(ensure_rewindex_dir(project_root) / "thumbnails")
+
+    def _path(self, content_hash: str) -> Path:
+        return self.directory / content_hash[:2] / f"{content_hash}.json"
+
+    def get(self, content_hash: str) -> Optional[Dict]:
+        try:
+            data = json.loads(self._path(content_hash).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("v") != THUMBNAIL_CACHE_VERSION:
+            return None
+        return data.get("preview")
+
+    def put(self, content_hash: str, preview: Dict) -> None:
+        path = self._path(content_hash)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps({"v": THUMBNAIL_CACHE_VERSION, "preview": preview}), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"[preview] could not cache thumbnail for {content_hash[:12]}: {e}")
+
+    def preview(self, path: Path, content_hash: str, max_size_kb: int = 50) -> Optional[Dict]:
+        """Cached preview for ``content_hash``, generating (and storing) it on a miss."""
+        cached = self.get(content_hash)
+        if cached is not None:
+            return cached
+        preview = generate_image_preview(path, max_size_kb=max_size_kb)
+        if preview:
+            self.put(content_hash, preview)
+        return preview
+
+
+# Live queues in this process, for /index/status
+_QUEUES: "weakref.WeakSet[ThumbnailQueue]" = weakref.WeakSet()
+
+
+def preview_fields(preview: Optional[Dict]) -> Dict:
+    """Files-index fields for a generated preview."""
+    if not preview:
+        return {}
+    if not isinstance(preview, dict):
+        # Old format (string only)
+        return {"preview_base64": preview}
+    return {
+        "preview_base64": preview.get("data"),
+        "preview_width": preview.get("width"),  # Thumbnail width
+        "preview_height": preview.get("height"),  # Thumbnail height
+        "original_width": preview.get("original_width"),  # Original image width
+        "original_height": preview.get("original_height"),  # Original image height
+    }
+
+
+class ThumbnailQueue:
+    """Generates image previews in the background and patches them into the files index.
+
+    Indexing writes image docs straight away with ``preview_pending: true`` and
+    submits them here; ``workers`` threads then render thumbnails (through the
+    :class:`ThumbnailCache`) and queue a partial update on the bulk writer.
+    At most ``max_pending`` images wait; beyond that ``submit`` returns False
+    and the doc stays pending until ``rewindex index previews`` backfills it.
+    """
+
+    def __init__(self, writer: BulkWriter, cache: ThumbnailCache, workers: int = 2, max_pending: int = 10000, max_size_kb: int = 50) -> None:
+        self.writer = writer
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.max_size_kb = max_size_kb
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        # content_hash -> [lock, waiters]: duplicates queued together render once
+        self._rendering: Dict[str, list] = {}
+        self.stats = {"queued": 0, "done": 0, "failed": 0, "dropped": 0, "active": 0}
+        _QUEUES.add(self)
+
+    def submit(self, files_index: str, file_id: str, path: Path, content_hash: str) -> bool:
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((files_index, file_id, path, content_hash))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+        with self._lock:
+            self.stats["queued"] += 1
+        return True
+
+    def pending(self) -> int:
+        return self._queue.qsize() + self.stats["active"]
+
+    def _ensure_workers(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"rewindex-thumbnail-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            with self._lock:
+                self.stats["active"] += 1
+            try:
+                self._render(*item)
+            except Exception as e:
+                logger.warning(f"❌ [preview] background thumbnail failed for {item[1]}: {e}")
+                with self._lock:
+                    self.stats["failed"] += 1
+            finally:
+                with self._lock:
+                    self.stats["active"] -= 1
+
+    def _render(self, files_index: str, file_id: str, path: Path, content_hash: str) -> None:
+        buffered = self.writer.peek(files_index, file_id)
+        if buffered is not None and buffered.get("content_hash") != content_hash:
+            # File changed again since it was queued; that version has its own request
+            return
+        with self._lock:
+            entry = self._rendering.setdefault(content_hash, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                preview = self.cache.preview(path, content_hash, max_size_kb=self.max_size_kb)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._rendering[content_hash]
+        with self._lock:
+            self.stats["done" if preview else "failed"] += 1
+        # Clear the pending flag either way; backfill retries docs without a
+        # preview. Only onto the content it was rendered from: if the file
+        # changed and its new doc already went out, this is a no-op
+        self.writer.update(
+            files_index, file_id, {**preview_fields(preview), "preview_pending": False},
+            if_match={"content_hash": content_hash},
+        )
+
+    def close(self, wait: bool = True, timeout: Optional[float] = None) -> None:
+        """Stop the workers, by default after the queue has drained.
+
+        Anything still queued when ``timeout`` expires (or with ``wait=False``)
+        is left ``preview_pending`` for a later backfill.
+        """
+        if not self._threads:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not wait:
+            self._discard_queued()
+        elif self.pending():
+            print(f"[rewindex] Waiting for {self.pending()} thumbnails...")
+        for _ in self._threads:
+            while True:
+                try:
+                    self._queue.put(None, timeout=0.5)
+                    break
+                except queue.Full:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self._discard_queued()
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def _discard_queued(self) -> None:
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+def thumbnail_progress() -> Dict[str, int]:
+    """Combined counters of this process's thumbnail queues."""
+    out = {"queued": 0, "done": 0, "failed": 0, "dropped": 0, "pending": 0}
+    for q in list(_QUEUES):
+        for key in ("queued", "done", "failed", "dropped"):
+            out[key] += q.stats[key]
+        out["pending"] += q.pending()
+    return out
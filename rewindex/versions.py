@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import difflib
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .bulk import BulkWriter
+from .es import ESClient
+
+
+logger = logging.getLogger(__name__)
+
+# VersioningConfig.storage
+STORAGE_FULL = "full"
+STORAGE_DELTA = "delta"
+
+# Version doc "storage" field. Docs without it (written before deltas
+# existed, or in full mode) carry their whole content like a keyframe.
+DOC_KEYFRAME = "keyframe"
+DOC_DELTA = "delta"
+
+# A delta is only worth it if it's clearly smaller than the text itself
+DELTA_MAX_RATIO = 0.5
+
+# Guard against corrupt chains when reconstructing
+MAX_CHAIN_LENGTH = 1000
+
+# Content hashes known to be stored in a blobs index in this process, so
+# duplicate content isn't even sent. Bounded; forgetting one only
+# costs a redundant create that Elasticsearch rejects.
+_KNOWN_BLOBS_MAX = 200_000
+
+# (start, end, replacement lines): replace old_lines[start:end]
+DeltaOp = Tuple[int, int, List[str]]
+
+
+def make_delta(old: str, new: str) -> Tuple[List[DeltaOp], List[str]]:
+    """Line-level edit script turning ``old`` into ``new``, plus the added lines."""
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops: List[DeltaOp] = []
+    added: List[str] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        lines = b[j1:j2]
+        ops.append((i1, i2, lines))
+        added.extend(lines)
+    return ops, added
+
+
+def apply_delta(old: str, ops: Iterable[Any]) -> str:
+    a = old.splitlines(keepends=True)
+    out: List[str] = []
+    pos = 0
+    for start, end, lines in ops:
+        out.extend(a[pos:start])
+        out.extend(lines)
+        pos = end
+    out.extend(a[pos:])
+    return "".join(out)
+
+
+def blobs_index_for(versions_index: str) -> str:
+    """Blobs index paired with a versions index (see :func:`~rewindex.es.ensure_indices`)."""
+    base = versions_index[: -len("_versions")] if versions_index.endswith("_versions") else versions_index
+    return f"{base}_blobs"
+
+
+def version_id(project_id: str, file_path: str, content_hash: str) -> str:
+    """Doc id of one path's version with the given content."""
+    path_key = hashlib.sha1(f"{project_id}:{file_path}".encode("utf-8")).hexdigest()[:16]
+    return f"{content_hash}:{path_key}"
+
+
+def build_version(
+    versioning,
+    *,
+    file_path: str,
+    content: str,
+    content_hash: str,
+    previous_hash: Optional[str],
+    previous_content: Optional[str],
+    version_count: int,
+    language: str,
+    project_id: str,
+    created_at: int,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(version doc, blob doc) for a new text version.
+
+    The version doc is the path's metadata; the blob holds the text and is
+    shared by every version with the same content. In delta storage mode
+    every ``keyframe_interval``-th version of a file gets a whole blob and
+    the ones in between a line delta against the previous version
+    (``base_hash``), when that version's text is known and the delta is
+    small enough. Deltas carry the lines they add in ``added_lines`` so
+    history stays searchable.
+    """
+    meta: Dict[str, Any] = {
+        "file_path": file_path,
+        "content_hash": content_hash,
+        "previous_hash": previous_hash,
+        "created_at": created_at,
+        "is_current": True,
+        "language": language,
+        "project_id": project_id,
+        "size_bytes": len(content.encode("utf-8")),
+        "line_count": content.count("\n") + 1,
+    }
+    blob: Dict[str, Any] = {
+        "content_hash": content_hash,
+        "created_at": created_at,
+        "size_bytes": meta["size_bytes"],
+    }
+    if getattr(versioning, "storage", STORAGE_FULL) != STORAGE_DELTA:
+        blob["content"] = content
+        return meta, blob
+
+    interval = max(1, int(getattr(versioning, "keyframe_interval", 20)))
+    if previous_hash and previous_content is not None and (version_count - 1) % interval:
+        ops, added = make_delta(previous_content, content)
+        delta_size = sum(len(line) for _, _, lines in ops for line in lines) + 16 * len(ops)
+        if delta_size <= DELTA_MAX_RATIO * len(content):
+            blob.update({
+                "storage": DOC_DELTA,
+                "base_hash": previous_hash,
+                "delta": [[s, e, lines] for s, e, lines in ops],
+                "added_lines": "".join(added),
+            })
+            return meta, blob
+    blob.update({"storage": DOC_KEYFRAME, "content": content})
+    return meta, blob
+
+
+def write_version(
+    writer: BulkWriter,
+    versions_index: str,
+    meta: Dict[str, Any],
+    blob: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Queue a version doc on ``writer``, plus its blob if that content is new.
+
+    Blobs are created, never overwritten: the first stored form of a text
+    stays its only one, so a delta's base always predates it and chains
+    can't loop (a revert just points at the existing blob).
+    """
+    h = meta["content_hash"]
+    writer.index(versions_index, version_id(meta.get("project_id", ""), meta["file_path"], h), meta)
+    if blob is None:
+        return
+    blobs_index = blobs_index_for(versions_index)
+    with _KNOWN_LOCK:
+        if (blobs_index, h) in _KNOWN_BLOBS:
+            return
+    if writer.peek(blobs_index, h) is not None:
+        # Already queued on this writer
+        return
+    # Only remembered once stored, so a failed write is tried again next time
+    writer.create(blobs_index, h, blob, on_stored=lambda: _remember_blob(blobs_index, h))
+
+
+def _remember_blob(blobs_index: str, h: str) -> None:
+    with _KNOWN_LOCK:
+        if len(_KNOWN_BLOBS) >= _KNOWN_BLOBS_MAX:
+            _KNOWN_BLOBS.clear()
+        _KNOWN_BLOBS.add((blobs_index, h))
+
+
+def supersede_version(writer: BulkWriter, versions_index: str, project_id: str, file_path: str, content_hash: str) -> None:
+    """Queue clearing ``is_current`` on a path's previous version."""
+    writer.update(versions_index, version_id(project_id, file_path, content_hash), {"is_current": False})
+
+
+def forget_blobs(blobs_index: Optional[str] = None) -> None:
+    """Drop the known-blob cache (for one index, or all), e.g. after deleting blobs."""
+    with _KNOWN_LOCK:
+        if blobs_index is None:
+            _KNOWN_BLOBS.clear()
+        else:
+            _KNOWN_BLOBS.difference_update([k for k in _KNOWN_BLOBS if k[0] == blobs_index])
+
+
+_KNOWN_BLOBS: set = set()
+_KNOWN_LOCK = threading.Lock()
+
+
+class VersionCoalescer:
+    """Holds each file's newest text version for a window before writing it.
+
+    Autosaving editors change a file every few seconds. A change within
+    ``window_s`` of a file's held version replaces that version in memory,
+    so each window puts only its last text in the versions index. Versions
+    are written by :meth:`flush_due` once their window has passed (the
+    watchers call it on every tick) and by :meth:`flush` on shutdown.
+
+    A held version keeps its base: the file's last written version, which
+    it supersedes (and is stored as a delta against) when written, and
+    ``base_previous_hash``, the version that base followed.
+    """
+
+    def __init__(self, versioning, window_s: float) -> None:
+        self.versioning = versioning
+        self.window_s = max(0.0, window_s)
+        self._held: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._ready: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.stats = {"held": 0, "coalesced": 0, "written": 0}
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._held) + len(self._ready)
+
+    def held(self, versions_index: str, project_id: str, file_path: str) -> Optional[Dict[str, Any]]:
+        """The file's held version, if its window is still open.
+
+        The caller must follow up with :meth:`offer` or :meth:`discard`, and
+        :meth:`release` either way (in a ``finally``); until then the
+        version isn't flushed from under it.
+        """
+        with self._lock:
+            entry = self._held.get((versions_index, project_id, file_path))
+            if entry is None or time.monotonic() - entry["opened"] >= self.window_s:
+                return None
+            entry["busy"] = True
+            return dict(entry)
+
+    def offer(self, versions_index: str, **version: Any) -> None:
+        """Hold a version (``build_version`` keyword arguments), replacing an open one."""
+        key = (versions_index, version["project_id"], version["file_path"])
+        with self._lock:
+            entry = self._held.get(key)
+            if entry is not None:
+                if entry.pop("busy", False) or time.monotonic() - entry["opened"] < self.window_s:
+                    # Same window: newest text wins, the base stays
+                    for k in ("content", "content_hash", "language", "created_at"):
+                        entry[k] = version[k]
+                    self.stats["coalesced"] += 1
+                    return
+                # Closed but not flushed yet; it's this version's base, so it goes first
+                self._ready.append(entry)
+            self._held[key] = {**version, "versions_index": versions_index, "opened": time.monotonic()}
+            self.stats["held"] += 1
+
+    def release(self, versions_index: str, project_id: str, file_path: str) -> None:
+        """Let a version returned by :meth:`held` be flushed again (a no-op once offered or discarded)."""
+        with self._lock:
+            entry = self._held.get((versions_index, project_id, file_path))
+            if entry is not None:
+                entry.pop("busy", None)
+
+    def discard(self, versions_index: str, project_id: str, file_path: str) -> None:
+        """Drop a held version (the file went back to its last written text)."""
+        with self._lock:
+            self._held.pop((versions_index, project_id, file_path), None)
+
+    def flush_due(self, writer: BulkWriter) -> int:
+        """Queue the versions whose window has passed on ``writer``."""
+        now = time.monotonic()
+        with self._lock:
+            due = [k for k, e in self._held.items() if now - e["opened"] >= self.window_s and not e.get("busy")]
+            entries = self._ready + [self._held.pop(k) for k in due]
+            self._ready = []
+        return self._write_entries(writer, entries)
+
+    def flush(self, writer: BulkWriter) -> int:
+        """Queue every held version on ``writer``."""
+        with self._lock:
+            entries = self._ready + list(self._held.values())
+            self._ready = []
+            self._held.clear()
+        return self._write_entries(writer, entries)
+
+    def _write_entries(self, writer: BulkWriter, entries: List[Dict[str, Any]]) -> int:
+        for e in entries:
+            versions_index = e["versions_index"]
+            if e.get("previous_hash"):
+                supersede_version(writer, versions_index, e["project_id"], e["file_path"], e["previous_hash"])
+            write_version(writer, versions_index, *build_version(
+                self.versioning,
+                **{k: e[k] for k in (
+                    "file_path", "content", "content_hash", "previous_hash", "previous_content",
+                    "version_count", "language", "project_id", "created_at",
+                )},
+            ))
+        with self._lock:
+            self.stats["written"] += len(entries)
+        return len(entries)
+
+
+class _TextCache:
+    """LRU of reconstructed texts, bounded by entry count and total characters."""
+
+    def __init__(self, max_entries: int = 512, max_chars: int = 64 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._data: "OrderedDict[tuple, str]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            text = self._data.get(key)
+            if text is not None:
+                self._data.move_to_end(key)
+            return text
+
+    def put(self, key: tuple, text: str) -> None:
+        if len(text) > self.max_chars // 4:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._chars -= len(old)
+            self._data[key] = text
+            self._chars += len(text)
+            while self._data and (len(self._data) > self.max_entries or self._chars > self.max_chars):
+                _, evicted = self._data.popitem(last=False)
+                self._chars -= len(evicted)
+
+
+# Texts are content-addressed, so entries never go stale
+_TEXTS = _TextCache()
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VersionStore:
+    """Reads version docs with their full text, joined from the blobs index.
+
+    Version docs written before blobs existed carry their own ``content``
+    (or, for a while, their own delta) and are read as they are.
+    """
+
+    def __init__(self, es: ESClient, versions_index: str, blobs_index: Optional[str] = None) -> None:
+        self.es = es
+        self.versions_index = versions_index
+        self.blobs_index = blobs_index or blobs_index_for(versions_index)
+
+    def get(self, content_hash: str, file_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The latest version with this content (at ``file_path``, if given), text filled in."""
+        must: List[Dict[str, Any]] = [{"term": {"content_hash": content_hash}}]
+        if file_path:
+            must.append({"term": {"file_path": file_path}})
+        try:
+            res = self.es.search(self.versions_index, {
+                "query": {"bool": {"must": must}},
+                "sort": [{"created_at": {"order": "desc"}}],
+                "size": 1,
+            })
+            hits = res.get("hits", {}).get("hits", [])
+        except Exception:
+            hits = []
+        src = hits[0].get("_source") if hits else None
+        if not src:
+            # Pre-blob layout: the version doc's id is the hash
+            src = (self.es.get_doc(self.versions_index, content_hash) or {}).get("_source")
+        if not src:
+            return None
+        return self.fill([src])[0]
+
+    def content(self, content_hash: str) -> Optional[str]:
+        return self._text(content_hash, {})
+
+    def fill(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill ``content`` on version sources (in place; also returned).
+
+        Blobs are fetched in one request, and they double as bases for each
+        other, so a page of one file's history costs little beyond that.
+        """
+        todo = [
+            s for s in sources
+            if "content" not in s and not s.get("is_binary") and s.get("content_hash")
+        ]
+        known: Dict[str, Dict[str, Any]] = {}
+        for s in sources:
+            if s.get("storage") == DOC_DELTA and s.get("content_hash"):
+                known[s["content_hash"]] = s  # pre-blob delta version docs
+        missing = sorted({s["content_hash"] for s in todo} - known.keys())
+        if missing:
+            known.update(self._fetch_blobs(missing))
+        for src in sources:
+            if src.get("is_binary") and "content" not in src:
+                src["content"] = ""
+        for src in todo:
+            text = self._text(src["content_hash"], known)
+            if text is None:
+                logger.warning(f"[versions] could not reconstruct {str(src.get('content_hash'))[:12]} ({src.get('file_path')})")
+            src["content"] = text if text is not None else ""
+        for src in sources:
+            src.pop("delta", None)
+        return sources
+
+    def _fetch_blobs(self, hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        try:
+            docs = self.es.mget(self.blobs_index, hashes)
+        except Exception:
+            return {}
+        return {d["_id"]: d["_source"] for d in docs if d.get("found") and d.get("_source")}
+
+    def _load(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Blob for a hash, falling back to a pre-blob version doc."""
+        for index in (self.blobs_index, self.versions_index):
+            try:
+                src = (self.es.get_doc(index, content_hash) or {}).get("_source")
+            except Exception:
+                src = None
+            if src:
+                return src
+        return None
+
+    def _text(self, content_hash: Optional[str], known: Dict[str, Dict[str, Any]]) -> Optional[str]:
+        if not content_hash:
+            return None
+        # Walk back to a keyframe (or a cached text), then replay the deltas forward
+        chain: List[Dict[str, Any]] = []
+        h = content_hash
+        base: Optional[str] = None
+        seen = set()
+        while True:
+            cached = _TEXTS.get((self.blobs_index, h))
+            if cached is not None:
+                base = cached
+                break
+            if h in seen or len(chain) > MAX_CHAIN_LENGTH:
+                return None
+            seen.add(h)
+            src = known.get(h)
+            if src is None or (src.get("storage") == DOC_DELTA and "delta" not in src):
+                src = self._load(h)
+                if not src:
+                    return None
+            if src.get("storage") != DOC_DELTA:
+                base = src.get("content") or ""
+                if h == content_hash:
+                    return base
+                _TEXTS.put((self.blobs_index, h), base)
+                break
+            chain.append(src)
+            h = src.get("base_hash")
+            if not h:
+                return None
+
+        text = base
+        for src in reversed(chain):
+            text = apply_delta(text, src.get("delta") or [])
+            h = src.get("content_hash")
+            if _text_hash(text) != h:
+                logger.warning(f"[versions] delta for {str(h)[:12]} doesn't reproduce its hash")
+                return None
+            _TEXTS.put((self.blobs_index, h), text)
+        return text
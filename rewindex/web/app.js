@@ -2134,7 +2134,7 @@
       if(contentHash){
         // Fetch specific version by hash (from file timeline)
         console.log(`📅 [openDiffEditor] Fetching version by hash: ${contentHash}`);
-        const versionData = await fetchJSON('/version?hash=' + encodeURIComponent(contentHash));
+        const versionData = await fetchJSON('/version?hash=' + encodeURIComponent(contentHash) + '&path=' + encodeURIComponent(path));
         historicalContent = versionData.content || '';
       } else {
         // Get historical version from tile content (global time-travel mode)